@@ -1,46 +1,47 @@
 
 # Admin Panel for USDT-INR Exchange Bot
+import argparse
 import sqlite3
 from datetime import datetime, timedelta
 import json
 
+from telegram.ext import CommandHandler
+
+from config import ADMIN_USER_IDS, DATABASE_PATH
+from migrations import DAILY_STATS_TOTAL, apply_migrations, rebuild_daily_stats, rebuild_trade_counters
+
 class AdminPanel:
-    def __init__(self, db_path):
+    def __init__(self, db_path, db=None):
         self.db_path = db_path
+        # Running bot's DatabaseManager, so admin writes also update its in-memory state
+        self.db = db
 
     def get_stats(self):
-        """Get bot statistics"""
+        """Get bot statistics from the trigger-maintained daily_stats rows"""
         conn = sqlite3.connect(self.db_path)
         cursor = conn.cursor()
 
-        # Total users
-        cursor.execute("SELECT COUNT(*) FROM users")
-        total_users = cursor.fetchone()[0]
-
-        # New users today
-        cursor.execute("SELECT COUNT(*) FROM users WHERE date(registration_date) = date('now')")
-        new_users_today = cursor.fetchone()[0]
-
-        # Active offers
-        cursor.execute("SELECT COUNT(*) FROM offers WHERE status = 'ACTIVE'")
-        active_offers = cursor.fetchone()[0]
-
-        # Total transactions
-        cursor.execute("SELECT COUNT(*) FROM transactions")
-        total_transactions = cursor.fetchone()[0]
-
-        # Completed transactions today
-        cursor.execute("SELECT COUNT(*) FROM transactions WHERE date(completed_date) = date('now')")
-        transactions_today = cursor.fetchone()[0]
+        # Two primary key lookups: the all-time row and today's row
+        cursor.execute('''
+            SELECT t.new_users, t.offers_active, t.transactions_initiated,
+                   COALESCE(d.new_users, 0), COALESCE(d.offers_created, 0),
+                   COALESCE(d.transactions_initiated, 0), COALESCE(d.transactions_completed, 0)
+            FROM daily_stats t
+            LEFT JOIN daily_stats d ON d.day = date('now')
+            WHERE t.day = ?
+        ''', (DAILY_STATS_TOTAL,))
+        row = cursor.fetchone() or (0,) * 7
 
         conn.close()
 
         return {
-            'total_users': total_users,
-            'new_users_today': new_users_today,
-            'active_offers': active_offers,
-            'total_transactions': total_transactions,
-            'transactions_today': transactions_today
+            'total_users': row[0],
+            'new_users_today': row[3],
+            'active_offers': row[1],
+            'total_transactions': row[2],
+            'transactions_today': row[6],
+            'offers_created_today': row[4],
+            'transactions_initiated_today': row[5]
         }
 
     def get_top_users(self, limit=10):
@@ -48,11 +49,11 @@ class AdminPanel:
         conn = sqlite3.connect(self.db_path)
         cursor = conn.cursor()
 
+        # Index range read on idx_users_leaderboard; tx_count is kept by triggers
         cursor.execute('''
-            SELECT username, reputation_score, 
-                   (SELECT COUNT(*) FROM transactions WHERE buyer_id = u.user_id OR seller_id = u.user_id) as transaction_count
-            FROM users u 
-            ORDER BY reputation_score DESC, transaction_count DESC 
+            SELECT username, reputation_score, tx_count
+            FROM users
+            ORDER BY reputation_score DESC, tx_count DESC
             LIMIT ?
         ''', (limit,))
 
@@ -79,8 +80,28 @@ class AdminPanel:
 
         return results
 
+    def rebuild_daily_stats(self):
+        """Recompute daily_stats and the per-user trade counters from history"""
+        conn = sqlite3.connect(self.db_path)
+        try:
+            # IMMEDIATE keeps concurrent writers (and their triggers) out until the rebuild commits
+            conn.execute("BEGIN IMMEDIATE")
+            rows = rebuild_daily_stats(conn.cursor())
+            rebuild_trade_counters(conn.cursor())
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+        return rows
+
     def block_user(self, user_id, reason=""):
         """Block a user"""
+        if self.db is not None:
+            self.db.block_user(user_id)
+            return True
+
         conn = sqlite3.connect(self.db_path)
         cursor = conn.cursor()
 
@@ -110,9 +131,16 @@ Generated: {datetime.now().strftime("%Y-%m-%d %H:%M:%S")}
 • Active Offers: {stats['active_offers']}
 • Total Transactions: {stats['total_transactions']}
 • Transactions Today: {stats['transactions_today']}
-
-⭐ TOP USERS:
+• Offers Posted Today: {stats['offers_created_today']}
 '''
+        if self.db is not None:
+            cache = self.db.user_cache.stats()
+            report += (
+                f"• User Cache: {cache['size']}/{cache['maxsize']} entries, "
+                f"{cache['hit_rate']:.0%} hit rate ({cache['hits']} hits, {cache['misses']} misses, "
+                f"{cache['evictions']} evictions)\n"
+            )
+        report += "\n⭐ TOP USERS:\n"
         for i, (username, score, tx_count) in enumerate(top_users, 1):
             report += f"{i}. @{username} - ⭐{score:.1f} ({tx_count} transactions)\n"
 
@@ -124,7 +152,7 @@ Generated: {datetime.now().strftime("%Y-%m-%d %H:%M:%S")}
         return report
 
 # Usage example for admin commands in main bot
-def add_admin_handlers(application):
+def add_admin_handlers(application, db=None, outbox=None):
     """Add admin command handlers to the bot"""
 
     async def admin_stats(update, context):
@@ -133,8 +161,22 @@ def add_admin_handlers(application):
             await update.message.reply_text("❌ Access denied.")
             return
 
-        admin = AdminPanel(DATABASE_PATH)
+        admin = AdminPanel(DATABASE_PATH, db)
         report = admin.generate_report()
+        processor_stats = getattr(application.update_processor, "stats", None)
+        if processor_stats:
+            updates = processor_stats()
+            report += (
+                f"\n⚙️ UPDATES: {updates['running']}/{updates['max_running']} running, "
+                f"{updates['pending']} queued across {updates['active_chats']} chats "
+                f"(peak queue {updates['peak_pending']}, {updates['processed']} processed)\n"
+            )
+        if outbox is not None:
+            sends = outbox.stats()
+            report += (
+                f"📤 OUTBOX: {sends['queued']} queued for {sends['chats']} chats, "
+                f"{sends['sent']} sent, {sends['failed']} failed, {sends['retry_after']} flood waits\n"
+            )
         await update.message.reply_text(report, parse_mode='Markdown')
 
     async def admin_block_user(update, context):
@@ -150,11 +192,33 @@ def add_admin_handlers(application):
         target_user_id = int(context.args[0])
         reason = " ".join(context.args[1:]) if len(context.args) > 1 else ""
 
-        admin = AdminPanel(DATABASE_PATH)
-        admin.block_user(target_user_id, reason)
+        admin = AdminPanel(DATABASE_PATH, db)
+        if db is not None:
+            await db.run(admin.block_user, target_user_id, reason)
+        else:
+            admin.block_user(target_user_id, reason)
 
         await update.message.reply_text(f"✅ User {target_user_id} has been blocked.")
 
     # Add handlers
     application.add_handler(CommandHandler("admin_stats", admin_stats))
     application.add_handler(CommandHandler("block_user", admin_block_user))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="USDT-INR Exchange Bot admin tools")
+    parser.add_argument("--db", default=DATABASE_PATH, help="SQLite database path")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("report", help="print the admin report")
+    commands.add_parser("rebuild-stats", help="recompute daily_stats and trade counters from history")
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(args.db)
+    apply_migrations(conn)
+    conn.close()
+
+    admin = AdminPanel(args.db)
+    if args.command == "report":
+        print(admin.generate_report())
+    elif args.command == "rebuild-stats":
+        print(f"Rebuilt daily_stats: {admin.rebuild_daily_stats()} rows")
@@ -0,0 +1,330 @@
+# Online backups for USDT-INR Exchange Bot
+#
+# Copying usdt_exchange.db while the bot writes to it can produce a torn file, so snapshots
+# use SQLite's online backup API instead: BACKUP_PAGES_PER_STEP pages per step with a short
+# sleep between steps, on a worker thread with its own connection. The backup connection
+# holds a read transaction for the whole copy; in WAL mode that pins one consistent
+# snapshot without blocking writers, and stops concurrent writes from restarting the copy.
+#
+# Each snapshot is checked with PRAGMA quick_check, gzip-compressed and written next to a
+# sha256sum-compatible checksum file. Old snapshots are rotated: the newest
+# BACKUP_KEEP_RECENT, plus the newest of each of the last BACKUP_KEEP_DAILY days and
+# BACKUP_KEEP_WEEKLY weeks are kept.
+#
+#   python backup.py snapshot
+#   python backup.py list
+#   python backup.py verify backups/usdt_exchange-20240101T000000Z.db.gz
+#   python backup.py restore backups/usdt_exchange-20240101T000000Z.db.gz --db usdt_exchange.db
+#   python backup.py loadtest    # back up a scratch database under a synthetic write load
+
+import argparse
+import asyncio
+import gzip
+import hashlib
+import logging
+import os
+import re
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+
+from config import (
+    DATABASE_PATH, BACKUP_INTERVAL, BACKUP_DIR, BACKUP_PAGES_PER_STEP, BACKUP_STEP_SLEEP,
+    BACKUP_KEEP_RECENT, BACKUP_KEEP_DAILY, BACKUP_KEEP_WEEKLY
+)
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_TIME = "%Y%m%dT%H%M%SZ"
+CHUNK_SIZE = 1024 * 1024
+
+
+def _sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _snapshot_time(path: str) -> Optional[datetime]:
+    match = re.search(r"-(\d{8}T\d{6}Z)\.db\.gz$", path)
+    if not match:
+        return None
+    return datetime.strptime(match.group(1), SNAPSHOT_TIME).replace(tzinfo=timezone.utc)
+
+
+def online_copy(source_path: str, target_path: str, pages: int = BACKUP_PAGES_PER_STEP,
+                sleep: float = BACKUP_STEP_SLEEP) -> int:
+    """Copy a live database to ``target_path`` in page steps; returns the number of steps"""
+    steps = 0
+
+    def progress(status, remaining, total):
+        nonlocal steps
+        steps += 1
+
+    source = sqlite3.connect(source_path, timeout=30)
+    target = sqlite3.connect(target_path)
+    try:
+        # Pin one snapshot: writers carry on in the WAL and the copy never restarts
+        source.execute("BEGIN")
+        source.execute("SELECT COUNT(*) FROM sqlite_master").fetchone()
+        source.backup(target, pages=pages, progress=progress, sleep=sleep)
+        source.rollback()
+        result = target.execute("PRAGMA quick_check").fetchone()[0]
+        if result != "ok":
+            raise ValueError(f"Backup copy failed quick_check: {result}")
+    finally:
+        target.close()
+        source.close()
+    return steps
+
+
+def verify(path: str) -> Dict:
+    """Check a snapshot's checksum and integrity; raises ValueError if it is unusable"""
+    checksum_path = path + ".sha256"
+    if not os.path.exists(checksum_path):
+        raise ValueError(f"Missing checksum file {checksum_path}")
+    with open(checksum_path) as f:
+        expected = f.read().split()[0]
+    actual = _sha256(path)
+    if actual != expected:
+        raise ValueError(f"Checksum mismatch for {path}: expected {expected}, got {actual}")
+
+    with tempfile.TemporaryDirectory() as scratch:
+        copy = os.path.join(scratch, "verify.db")
+        with gzip.open(path, "rb") as src, open(copy, "wb") as dst:
+            shutil.copyfileobj(src, dst, CHUNK_SIZE)
+        conn = sqlite3.connect(copy)
+        try:
+            result = conn.execute("PRAGMA integrity_check").fetchone()[0]
+            if result != "ok":
+                raise ValueError(f"{path} failed integrity_check: {result}")
+            tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+            counts = {table: conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+                      for table in ("users", "offers", "transactions") if table in tables}
+            version = (conn.execute("SELECT COALESCE(MAX(version), 0) FROM schema_version").fetchone()[0]
+                       if "schema_version" in tables else 0)
+        finally:
+            conn.close()
+    return {'path': path, 'sha256': actual, 'schema_version': version, 'rows': counts}
+
+
+def restore(path: str, target: str, force: bool = False) -> Optional[str]:
+    """Replace ``target`` with a verified snapshot; the bot must be stopped.
+
+    The previous database (and any WAL/shm files) is moved aside; returns its new path.
+    """
+    verify(path)
+    if os.path.exists(target) and not force:
+        raise ValueError(f"{target} exists; pass --force to replace it (stop the bot first)")
+    staged = target + ".restoring"
+    with gzip.open(path, "rb") as src, open(staged, "wb") as dst:
+        shutil.copyfileobj(src, dst, CHUNK_SIZE)
+
+    moved = None
+    if os.path.exists(target):
+        moved = f"{target}.pre-restore-{datetime.now(timezone.utc).strftime(SNAPSHOT_TIME)}"
+        os.replace(target, moved)
+    # A stale WAL would be replayed on top of the restored file
+    for suffix in ("-wal", "-shm"):
+        if os.path.exists(target + suffix):
+            os.replace(target + suffix, (moved or target) + suffix + ".old")
+    os.replace(staged, target)
+    return moved
+
+
+class BackupManager:
+    """Takes, rotates and lists compressed online snapshots of the bot database"""
+
+    def __init__(self, db_path: str = DATABASE_PATH, directory: str = BACKUP_DIR,
+                 pages: int = BACKUP_PAGES_PER_STEP, sleep: float = BACKUP_STEP_SLEEP,
+                 keep_recent: int = BACKUP_KEEP_RECENT, keep_daily: int = BACKUP_KEEP_DAILY,
+                 keep_weekly: int = BACKUP_KEEP_WEEKLY):
+        self.db_path = db_path
+        self.directory = directory
+        self.pages = pages
+        self.sleep = sleep
+        self.keep_recent = keep_recent
+        self.keep_daily = keep_daily
+        self.keep_weekly = keep_weekly
+        self.prefix = os.path.splitext(os.path.basename(db_path))[0]
+        self._running = threading.Lock()
+
+    def snapshots(self) -> List[Tuple[str, datetime]]:
+        """Existing snapshots, newest first"""
+        if not os.path.isdir(self.directory):
+            return []
+        found = []
+        for name in os.listdir(self.directory):
+            taken = _snapshot_time(name) if name.startswith(self.prefix + "-") else None
+            if taken:
+                found.append((os.path.join(self.directory, name), taken))
+        found.sort(key=lambda item: item[1], reverse=True)
+        return found
+
+    def snapshot(self) -> str:
+        """Take one compressed, checksummed snapshot; blocking, run it off the event loop"""
+        os.makedirs(self.directory, exist_ok=True)
+        started = time.monotonic()
+        name = f"{self.prefix}-{datetime.now(timezone.utc).strftime(SNAPSHOT_TIME)}.db.gz"
+        path = os.path.join(self.directory, name)
+        copy = os.path.join(self.directory, f".{name}.db.partial")
+        compressed = path + ".partial"
+        try:
+            steps = online_copy(self.db_path, copy, self.pages, self.sleep)
+            with open(copy, "rb") as src, gzip.open(compressed, "wb", compresslevel=6) as dst:
+                shutil.copyfileobj(src, dst, CHUNK_SIZE)
+            checksum = _sha256(compressed)
+            os.replace(compressed, path)
+            with open(path + ".sha256", "w") as f:
+                f.write(f"{checksum}  {name}\n")
+        finally:
+            for leftover in (copy, compressed):
+                if os.path.exists(leftover):
+                    os.remove(leftover)
+        logger.info(f"Backup {name} written in {time.monotonic() - started:.1f}s "
+                    f"({steps} steps, {os.path.getsize(path) / 1024:.0f} KiB)")
+        return path
+
+    def rotate(self, now: Optional[datetime] = None) -> List[str]:
+        """Delete snapshots outside the retention schedule; returns the removed paths"""
+        now = now or datetime.now(timezone.utc)
+        snapshots = self.snapshots()
+        keep = {path for path, _ in snapshots[:self.keep_recent]}
+        days, weeks = set(), set()
+        for path, taken in snapshots:
+            day, week = taken.date(), taken.isocalendar()[:2]
+            if day not in days and (now.date() - day).days < self.keep_daily:
+                days.add(day)
+                keep.add(path)
+            if week not in weeks and (now.date() - day).days < 7 * self.keep_weekly:
+                weeks.add(week)
+                keep.add(path)
+        removed = []
+        for path, _ in snapshots:
+            if path not in keep:
+                for leftover in (path, path + ".sha256"):
+                    if os.path.exists(leftover):
+                        os.remove(leftover)
+                removed.append(path)
+        return removed
+
+    def backup(self) -> Optional[str]:
+        """Snapshot and rotate unless a backup is already running"""
+        if not self._running.acquire(blocking=False):
+            logger.warning("Previous backup still running; skipping this one")
+            return None
+        try:
+            path = self.snapshot()
+            removed = self.rotate()
+            if removed:
+                logger.info(f"Rotated out {len(removed)} old backups")
+            return path
+        finally:
+            self._running.release()
+
+    def schedule(self, job_queue, interval: float = BACKUP_INTERVAL):
+        if interval:
+            job_queue.run_repeating(self.run, interval=interval, first=interval, name="database_backup")
+
+    async def run(self, context=None):
+        # Default executor: a long copy must not hold one of the DB pool workers
+        try:
+            await asyncio.get_running_loop().run_in_executor(None, self.backup)
+        except Exception:
+            logger.exception("Database backup failed")
+
+
+def _load_test(seconds: float, rows: int):
+    """Back up a scratch database while writer threads commit small transactions"""
+    from migrations import apply_migrations
+
+    with tempfile.TemporaryDirectory() as scratch:
+        db_path = os.path.join(scratch, "loadtest.db")
+        conn = sqlite3.connect(db_path)
+        conn.execute("PRAGMA journal_mode=WAL")
+        apply_migrations(conn)
+        conn.execute("CREATE TABLE loadtest (id INTEGER PRIMARY KEY, payload BLOB)")
+        conn.executemany("INSERT INTO loadtest (payload) VALUES (?)", ((os.urandom(256),) for _ in range(rows)))
+        conn.commit()
+        conn.close()
+
+        stop = threading.Event()
+        latencies: List[float] = []
+
+        def writer():
+            wconn = sqlite3.connect(db_path, timeout=30)
+            wconn.execute("PRAGMA busy_timeout=5000")
+            while not stop.is_set():
+                started = time.perf_counter()
+                wconn.execute("INSERT INTO loadtest (payload) VALUES (?)", (os.urandom(256),))
+                wconn.commit()
+                latencies.append(time.perf_counter() - started)
+                time.sleep(0.001)
+            wconn.close()
+
+        writers = [threading.Thread(target=writer) for _ in range(2)]
+        for thread in writers:
+            thread.start()
+        time.sleep(0.5)
+        manager = BackupManager(db_path, os.path.join(scratch, "backups"))
+        baseline = len(latencies)
+        started = time.monotonic()
+        path = manager.snapshot()
+        elapsed = time.monotonic() - started
+        during = latencies[baseline:]
+        time.sleep(max(0.0, seconds - elapsed))
+        stop.set()
+        for thread in writers:
+            thread.join()
+
+        report = verify(path)
+        during.sort()
+        print(f"Backed up {rows} rows in {elapsed:.2f}s while {len(during)} writes committed")
+        if during:
+            print(f"Write latency during backup: p50 {during[len(during) // 2] * 1000:.1f} ms, "
+                  f"max {during[-1] * 1000:.1f} ms")
+        print(f"Snapshot verified: sha256 {report['sha256'][:16]}…, schema v{report['schema_version']}")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    parser = argparse.ArgumentParser(description="Online backups of the bot database")
+    parser.add_argument("--db", default=DATABASE_PATH, help="SQLite database path")
+    parser.add_argument("--dir", default=BACKUP_DIR, help="backup directory")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("snapshot", help="take a snapshot now and rotate old ones")
+    commands.add_parser("list", help="list snapshots, newest first")
+    check = commands.add_parser("verify", help="check a snapshot's checksum and integrity")
+    check.add_argument("snapshot")
+    back = commands.add_parser("restore", help="replace --db with a snapshot (stop the bot first)")
+    back.add_argument("snapshot")
+    back.add_argument("--force", action="store_true", help="replace an existing database")
+    load = commands.add_parser("loadtest", help="back up a scratch database under a write load")
+    load.add_argument("--seconds", type=float, default=3)
+    load.add_argument("--rows", type=int, default=200_000)
+    args = parser.parse_args()
+
+    manager = BackupManager(args.db, args.dir)
+    try:
+        if args.command == "snapshot":
+            print(manager.backup())
+        elif args.command == "list":
+            for path, taken in manager.snapshots():
+                print(f"{taken:%Y-%m-%d %H:%M:%S} UTC  {os.path.getsize(path) / 1024:10.0f} KiB  {path}")
+        elif args.command == "verify":
+            report = verify(args.snapshot)
+            print(f"OK: schema v{report['schema_version']}, "
+                  + ", ".join(f"{table} {count}" for table, count in report['rows'].items()))
+        elif args.command == "restore":
+            moved = restore(args.snapshot, args.db, args.force)
+            print(f"Restored {args.db} from {args.snapshot}" + (f"; previous database kept as {moved}" if moved else ""))
+        else:
+            _load_test(args.seconds, args.rows)
+    except ValueError as e:
+        raise SystemExit(f"Error: {e}")
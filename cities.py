@@ -0,0 +1,283 @@
+# Offline gazetteer of Indian cities for USDT-INR Exchange Bot
+#
+# Maps free-text city input ("Bombay", "bengaluru", "Gurgaon ", "mumbia") to a canonical
+# city_id so offers and users can be matched with an indexed equality lookup instead of
+# LIKE '%city%'. Resolution tries an exact name/alias match, then a unique prefix in a
+# trie, then typo-tolerant matching over a character trigram index.
+
+import re
+from difflib import SequenceMatcher
+from typing import Dict, List, Optional, Set
+
+# (city_id, display name, aliases)
+CITIES = [
+    ("mumbai", "Mumbai", ["bombay", "bambai", "mumbai city"]),
+    ("delhi", "Delhi", ["new delhi", "dilli", "delhi ncr", "ncr", "nct delhi"]),
+    ("bangalore", "Bangalore", ["bengaluru", "banglore", "bangaluru", "blr"]),
+    ("hyderabad", "Hyderabad", ["hyd", "secunderabad", "cyberabad"]),
+    ("ahmedabad", "Ahmedabad", ["amdavad", "ahmadabad"]),
+    ("chennai", "Chennai", ["madras"]),
+    ("kolkata", "Kolkata", ["calcutta"]),
+    ("pune", "Pune", ["poona"]),
+    ("surat", "Surat", []),
+    ("jaipur", "Jaipur", ["pink city"]),
+    ("lucknow", "Lucknow", []),
+    ("kanpur", "Kanpur", ["cawnpore"]),
+    ("nagpur", "Nagpur", []),
+    ("indore", "Indore", []),
+    ("thane", "Thane", []),
+    ("bhopal", "Bhopal", []),
+    ("visakhapatnam", "Visakhapatnam", ["vizag", "vishakhapatnam", "waltair"]),
+    ("patna", "Patna", []),
+    ("vadodara", "Vadodara", ["baroda"]),
+    ("ghaziabad", "Ghaziabad", []),
+    ("ludhiana", "Ludhiana", []),
+    ("agra", "Agra", []),
+    ("nashik", "Nashik", ["nasik"]),
+    ("faridabad", "Faridabad", []),
+    ("meerut", "Meerut", []),
+    ("rajkot", "Rajkot", []),
+    ("varanasi", "Varanasi", ["banaras", "benares", "kashi"]),
+    ("srinagar", "Srinagar", []),
+    ("aurangabad", "Aurangabad", ["chhatrapati sambhajinagar", "sambhajinagar"]),
+    ("dhanbad", "Dhanbad", []),
+    ("amritsar", "Amritsar", []),
+    ("navi-mumbai", "Navi Mumbai", ["new bombay", "vashi"]),
+    ("prayagraj", "Prayagraj", ["allahabad"]),
+    ("ranchi", "Ranchi", []),
+    ("howrah", "Howrah", []),
+    ("coimbatore", "Coimbatore", ["kovai"]),
+    ("jabalpur", "Jabalpur", ["jubbulpore"]),
+    ("gwalior", "Gwalior", []),
+    ("vijayawada", "Vijayawada", ["bezawada"]),
+    ("jodhpur", "Jodhpur", []),
+    ("madurai", "Madurai", []),
+    ("raipur", "Raipur", []),
+    ("kota", "Kota", []),
+    ("guwahati", "Guwahati", ["gauhati"]),
+    ("chandigarh", "Chandigarh", ["tricity"]),
+    ("solapur", "Solapur", ["sholapur"]),
+    ("hubli", "Hubli", ["hubballi", "hubli-dharwad", "dharwad"]),
+    ("bareilly", "Bareilly", []),
+    ("moradabad", "Moradabad", []),
+    ("mysore", "Mysore", ["mysuru"]),
+    ("gurugram", "Gurugram", ["gurgaon", "gurgoan"]),
+    ("aligarh", "Aligarh", []),
+    ("jalandhar", "Jalandhar", ["jullundur"]),
+    ("tiruchirappalli", "Tiruchirappalli", ["trichy", "tiruchi"]),
+    ("bhubaneswar", "Bhubaneswar", ["bhubaneshwar", "bbsr"]),
+    ("salem", "Salem", []),
+    ("mira-bhayandar", "Mira-Bhayandar", ["mira road", "bhayandar", "mira bhayander"]),
+    ("warangal", "Warangal", []),
+    ("thiruvananthapuram", "Thiruvananthapuram", ["trivandrum", "tvm"]),
+    ("bhiwandi", "Bhiwandi", []),
+    ("saharanpur", "Saharanpur", []),
+    ("guntur", "Guntur", []),
+    ("amravati", "Amravati", []),
+    ("bikaner", "Bikaner", []),
+    ("noida", "Noida", ["greater noida", "gautam buddh nagar"]),
+    ("jamshedpur", "Jamshedpur", ["tatanagar"]),
+    ("bhilai", "Bhilai", ["durg"]),
+    ("cuttack", "Cuttack", []),
+    ("firozabad", "Firozabad", []),
+    ("kochi", "Kochi", ["cochin", "ernakulam"]),
+    ("bhavnagar", "Bhavnagar", []),
+    ("dehradun", "Dehradun", ["dehra dun"]),
+    ("durgapur", "Durgapur", []),
+    ("asansol", "Asansol", []),
+    ("nanded", "Nanded", []),
+    ("kolhapur", "Kolhapur", []),
+    ("ajmer", "Ajmer", []),
+    ("gulbarga", "Gulbarga", ["kalaburagi"]),
+    ("jamnagar", "Jamnagar", []),
+    ("ujjain", "Ujjain", []),
+    ("siliguri", "Siliguri", []),
+    ("jhansi", "Jhansi", []),
+    ("jammu", "Jammu", []),
+    ("mangalore", "Mangalore", ["mangaluru"]),
+    ("erode", "Erode", []),
+    ("belgaum", "Belgaum", ["belagavi"]),
+    ("tirunelveli", "Tirunelveli", []),
+    ("gaya", "Gaya", []),
+    ("jalgaon", "Jalgaon", []),
+    ("udaipur", "Udaipur", []),
+    ("kozhikode", "Kozhikode", ["calicut"]),
+    ("kurnool", "Kurnool", []),
+    ("bokaro", "Bokaro", ["bokaro steel city"]),
+    ("bellary", "Bellary", ["ballari"]),
+    ("patiala", "Patiala", []),
+    ("agartala", "Agartala", []),
+    ("bhagalpur", "Bhagalpur", []),
+    ("latur", "Latur", []),
+    ("dhule", "Dhule", []),
+    ("tirupati", "Tirupati", []),
+    ("rohtak", "Rohtak", []),
+    ("korba", "Korba", []),
+    ("bhilwara", "Bhilwara", []),
+    ("muzaffarpur", "Muzaffarpur", []),
+    ("ahmednagar", "Ahmednagar", ["ahilyanagar"]),
+    ("mathura", "Mathura", []),
+    ("kollam", "Kollam", ["quilon"]),
+    ("bilaspur", "Bilaspur", []),
+    ("shahjahanpur", "Shahjahanpur", []),
+    ("thrissur", "Thrissur", ["trichur"]),
+    ("alwar", "Alwar", []),
+    ("kakinada", "Kakinada", []),
+    ("nellore", "Nellore", []),
+    ("panipat", "Panipat", []),
+    ("karnal", "Karnal", []),
+    ("sonipat", "Sonipat", []),
+    ("bathinda", "Bathinda", ["bhatinda"]),
+    ("mohali", "Mohali", ["sas nagar", "sahibzada ajit singh nagar"]),
+    ("panchkula", "Panchkula", []),
+    ("shimla", "Shimla", ["simla"]),
+    ("haridwar", "Haridwar", []),
+    ("rishikesh", "Rishikesh", []),
+    ("goa", "Goa", ["panaji", "panjim", "margao", "madgaon", "vasco da gama"]),
+    ("pondicherry", "Pondicherry", ["puducherry"]),
+    ("vellore", "Vellore", []),
+    ("tiruppur", "Tiruppur", ["tirupur"]),
+    ("davanagere", "Davanagere", ["davangere"]),
+    ("shillong", "Shillong", []),
+    ("imphal", "Imphal", []),
+    ("aizawl", "Aizawl", []),
+    ("gangtok", "Gangtok", []),
+    ("itanagar", "Itanagar", []),
+    ("kohima", "Kohima", []),
+    ("dimapur", "Dimapur", []),
+    ("port-blair", "Port Blair", ["sri vijaya puram"]),
+    ("kalyan-dombivli", "Kalyan-Dombivli", ["kalyan", "dombivli"]),
+    ("vasai-virar", "Vasai-Virar", ["vasai", "virar"]),
+    ("pimpri-chinchwad", "Pimpri-Chinchwad", ["pimpri", "chinchwad", "pcmc"]),
+    ("ulhasnagar", "Ulhasnagar", []),
+    ("sangli", "Sangli", []),
+    ("akola", "Akola", []),
+    ("gorakhpur", "Gorakhpur", []),
+]
+
+# Minimum similarity for a typo-tolerant match to be offered as "did you mean"
+FUZZY_THRESHOLD = 0.8
+# Shortest input that may be completed from a unique prefix ("thiruvanan" -> ...)
+MIN_PREFIX_LENGTH = 4
+
+
+def normalize_city_name(text: str) -> str:
+    """Lowercase, drop punctuation and collapse whitespace"""
+    text = (text or "").lower().replace("&", " and ")
+    text = re.sub(r"[^a-z0-9]+", " ", text)
+    return " ".join(text.split())
+
+
+def slugify_city(text: str) -> str:
+    """Stable id for towns that are not in the gazetteer"""
+    return normalize_city_name(text).replace(" ", "-")
+
+
+def _trigrams(name: str) -> Set[str]:
+    padded = f"  {name} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class _TrieNode:
+    __slots__ = ("children", "city_ids")
+
+    def __init__(self):
+        self.children: Dict[str, "_TrieNode"] = {}
+        self.city_ids: Set[str] = set()
+
+
+class Gazetteer:
+    """Resolves free-text city names to canonical city ids"""
+
+    def __init__(self, cities=CITIES):
+        self.names: Dict[str, str] = {}  # city_id -> display name
+        self._lookup: Dict[str, str] = {}  # normalized name or alias -> city_id
+        self._trie = _TrieNode()
+        self._trigram_index: Dict[str, Set[str]] = {}
+
+        for city_id, display, aliases in cities:
+            self.names[city_id] = display
+            for name in [city_id.replace("-", " "), display, *aliases]:
+                key = normalize_city_name(name)
+                if not key or key in self._lookup:
+                    continue
+                self._lookup[key] = city_id
+                self._insert_prefix(key, city_id)
+                for gram in _trigrams(key):
+                    self._trigram_index.setdefault(gram, set()).add(key)
+
+    def _insert_prefix(self, key: str, city_id: str):
+        node = self._trie
+        for char in key:
+            node = node.children.setdefault(char, _TrieNode())
+            node.city_ids.add(city_id)
+
+    def _complete_prefix(self, key: str) -> Set[str]:
+        node = self._trie
+        for char in key:
+            node = node.children.get(char)
+            if node is None:
+                return set()
+        return node.city_ids
+
+    def _fuzzy_candidates(self, key: str, limit: int = 10) -> List[tuple]:
+        """Names sharing the most trigrams with the input, scored by edit similarity"""
+        counts: Dict[str, int] = {}
+        for gram in _trigrams(key):
+            for name in self._trigram_index.get(gram, ()):
+                counts[name] = counts.get(name, 0) + 1
+        shortlist = sorted(counts, key=counts.get, reverse=True)[:limit]
+        scored = [(SequenceMatcher(None, key, name).ratio(), name) for name in shortlist]
+        scored.sort(reverse=True)
+        return scored
+
+    def resolve(self, text: str) -> Optional[str]:
+        """Return the canonical city_id for user input, or None if it is not a known city.
+
+        Only exact names/aliases and unique prefixes resolve. A near miss may be a different
+        real town ("Rampur" is not "Raipur"), so typos are left to suggest() and the user.
+        """
+        key = normalize_city_name(text)
+        if not key:
+            return None
+        if key in self._lookup:
+            return self._lookup[key]
+
+        if len(key) >= MIN_PREFIX_LENGTH:
+            completions = self._complete_prefix(key)
+            if len(completions) == 1:
+                return next(iter(completions))
+        return None
+
+    def suggest(self, text: str, limit: int = 3, min_score: float = 0.0) -> List[str]:
+        """Display names of the closest known cities, best first.
+
+        With ``min_score`` only likely typos are returned; they keep the first letter, which
+        typos rarely hit ("ram nagar" is not "jamnagar").
+        """
+        key = normalize_city_name(text)
+        suggestions = []
+        for score, name in self._fuzzy_candidates(key):
+            if score < min_score:
+                break
+            if min_score and name[0] != key[0]:
+                continue
+            display = self.names[self._lookup[name]]
+            if display not in suggestions:
+                suggestions.append(display)
+            if len(suggestions) == limit:
+                break
+        return suggestions
+
+    def city_id_for(self, text: str) -> str:
+        """Canonical id for known cities, a slug of the input for everything else"""
+        return self.resolve(text) or slugify_city(text)
+
+    def display_name(self, text: str) -> str:
+        city_id = self.resolve(text)
+        if city_id:
+            return self.names[city_id]
+        return " ".join(word.capitalize() for word in normalize_city_name(text).split())
+
+
+gazetteer = Gazetteer()
@@ -5,17 +5,52 @@ BOT_TOKEN = "YOUR_BOT_TOKEN_FROM_BOTFATHER"
 
 # Database Configuration
 DATABASE_PATH = "usdt_exchange.db"
-BACKUP_INTERVAL = 3600  # seconds
+BACKUP_INTERVAL = 3600  # seconds between online backups (0 disables them)
+BACKUP_DIR = "backups"
+BACKUP_PAGES_PER_STEP = 256  # database pages copied per backup step
+BACKUP_STEP_SLEEP = 0.005  # seconds to sleep between backup steps
+BACKUP_KEEP_RECENT = 24  # newest snapshots always kept
+BACKUP_KEEP_DAILY = 7  # plus the newest snapshot of each of this many days
+BACKUP_KEEP_WEEKLY = 4  # plus the newest snapshot of each of this many weeks
+DB_POOL_SIZE = 4  # persistent SQLite connections / DB worker threads
+WRITE_BEHIND_FLUSH_MS = 500  # flush buffered low-priority writes this often...
+WRITE_BEHIND_MAX_BATCH = 200  # ...or as soon as this many are waiting
+WRITE_BEHIND_MAX_RETRIES = 5  # failed flushes before a buffered statement is dropped
+WRITE_BEHIND_MAX_QUEUED = 10000  # buffered statements kept while the database is unavailable
+USER_CACHE_SIZE = 10000  # user records kept in memory
+USER_CACHE_TTL = 300  # seconds
+RENDER_CACHE_BYTES = 8 * 1024 * 1024  # memory budget for pre-rendered offer cards
+PERSISTENCE_FLUSH_INTERVAL = 30  # seconds between writes of changed conversation/user data
 
 # Payment Gateway (Optional - for premium features)
 RAZORPAY_KEY_ID = "YOUR_RAZORPAY_KEY_ID"
 RAZORPAY_KEY_SECRET = "YOUR_RAZORPAY_KEY_SECRET"
 
+# Update processing
+MAX_CONCURRENT_UPDATES = 64  # handlers running at once (one per chat at a time)
+MAX_PENDING_UPDATES = 1024  # updates accepted for processing before backpressure
+
+# Outbound messages (Telegram limits: ~30 msg/s per bot, ~1 msg/s per chat, 20 msg/min per group)
+OUTBOX_GLOBAL_RATE = 30  # messages per second across all chats
+OUTBOX_CHAT_RATE = 1  # messages per second to one private chat...
+OUTBOX_CHAT_BURST = 5  # ...after an initial burst of this many
+OUTBOX_GROUP_RATE = 20 / 60  # messages per second to one group
+
 # Bot Settings
 MAX_OFFERS_PER_USER = 5
 OFFER_EXPIRY_DAYS = 7
+EXPIRY_CHECK_INTERVAL = 60  # seconds between expiry checks
+MARKET_RECONCILE_INTERVAL = 900  # seconds between order book / market checks against SQLite
+RATE_HISTORY_DIR = "rate_history"  # OHLC rate series per city
+RATE_HISTORY_RETENTION_DAYS = {'1m': 2, '1h': 90, '1d': None}  # None keeps buckets forever
+RATE_HISTORY_RETENTION_INTERVAL = 3600  # seconds between retention passes
+RATE_HISTORY_MAX_OPEN = 64  # series kept open (two file descriptors each)
 MIN_USDT_AMOUNT = 10
 MAX_USDT_AMOUNT = 10000
+BROWSE_PAGE_SIZE = 5  # offers shown per browse page
+TOP_TRADERS_LIMIT = 10  # traders listed by /top
+TRANSACTIONS_PAGE_SIZE = 10  # trades per My Transactions page
+MATCH_LIMIT = 3  # crossing counter-offers reported when an offer is posted
 
 # Admin Configuration
 ADMIN_USER_IDS = [123456789]  # Add admin Telegram user IDs
@@ -28,9 +63,25 @@ LOG_FILE = "bot.log"
 ENABLE_PHONE_VERIFICATION = True
 ENABLE_LOCATION_VERIFICATION = True
 ENABLE_USER_RATINGS = True
+REPUTATION_PRIOR_MEAN = 4.0  # score of a user with no ratings
+REPUTATION_PRIOR_WEIGHT = 5  # ratings needed before a user's own average dominates
+REPUTATION_HALF_LIFE_DAYS = None  # e.g. 180 to make older ratings count less
+REPUTATION_DECAY_INTERVAL = 86400  # seconds between decay passes over all scores (with a half-life)
 ENABLE_ESCROW = False  # Premium feature
 
 # Notification Settings
 NOTIFY_NEW_OFFERS = True
+SUBSCRIPTIONS_MAX_PER_USER = 10  # city/side subscriptions per user
+NEW_OFFER_COALESCE_SECONDS = 60  # offers posted in a city/side within this window go out as one message
+NEW_OFFER_QUIET_HOURS = (23, 8)  # local hours without new-offer messages; held offers go out afterwards
+QUIET_HOURS_UTC_OFFSET_MINUTES = 330  # IST
+FANOUT_BATCH_SIZE = 500  # subscriber ids read per query
+FANOUT_MAX_QUEUED = 1000  # outbox backlog at which the fan-out waits before queueing more
 NOTIFY_PRICE_ALERTS = True
+ALERT_MAX_PER_USER = 10  # active price alerts per user
+ALERT_EXPIRY_DAYS = 30  # price alerts are removed after this long
+ALERT_NOTIFY_BURST = 3  # alert messages a user can get in a row...
+ALERT_NOTIFY_PER_HOUR = 10  # ...then at most this many per hour
+ALERT_DEDUP_WINDOW = 3600  # seconds during which a repost at the same rate is not announced again
+ALERT_PRUNE_INTERVAL = 3600  # seconds between removals of expired alerts
 NOTIFY_SYSTEM_UPDATES = True
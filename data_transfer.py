@@ -0,0 +1,469 @@
+# Bulk import/export for USDT-INR Exchange Bot
+#
+# Moves users, offers, transactions and ratings between databases (migrations, audits,
+# staging rebuilds) in constant memory:
+#
+# * Export streams each table from one read transaction with fetchmany, so the files form a
+#   consistent snapshot, and writes CSV or JSONL (chosen by file extension).
+# * Import streams the file, validates and normalises every row, and inserts chunks with
+#   executemany, one transaction per chunk. The number of input rows handled is stored in the
+#   import_progress table inside the same transaction, so a failed or interrupted import
+#   resumes after the last committed chunk. Invalid rows are written to <file>.rejects.jsonl.
+#   Inserts fire the usual triggers, so daily_stats and trade counters stay correct. Ratings
+#   travel with the users' rating aggregates, so reputation.py verify still agrees.
+#
+#   python data_transfer.py export --dir dump/                  # users/offers/transactions/ratings.csv
+#   python data_transfer.py export --dir dump/ --format jsonl
+#   python data_transfer.py import --dir dump/                  # parents first, ratings last
+#   python data_transfer.py import dump/offers.csv --table offers --on-conflict update
+#
+# Restart the bot after an import so its order book and caches pick up the new rows.
+
+import argparse
+import csv
+import json
+import os
+import sqlite3
+import sys
+import time
+from datetime import datetime
+from typing import Callable, Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+from config import DATABASE_PATH
+from expiry import SQLITE_TIMESTAMP
+from migrations import apply_migrations
+
+BATCH_SIZE = 5000
+FORMATS = ("csv", "jsonl")
+
+
+def _integer(value):
+    if isinstance(value, bool) or (isinstance(value, float) and not value.is_integer()):
+        raise ValueError(f"not an integer: {value!r}")
+    return int(value)
+
+
+def _flag(value):
+    value = _integer(value)
+    if value not in (0, 1):
+        raise ValueError(f"expected 0 or 1, got {value}")
+    return value
+
+
+def _stars(value):
+    value = _integer(value)
+    if not 1 <= value <= 5:
+        raise ValueError(f"expected 1-5 stars, got {value}")
+    return value
+
+
+def _real(value):
+    return float(value)
+
+
+def _positive(value):
+    value = float(value)
+    if value <= 0:
+        raise ValueError(f"must be positive, got {value}")
+    return value
+
+
+def _text(value):
+    return str(value)
+
+
+def _timestamp(value):
+    """Normalise to SQLite's 'YYYY-MM-DD HH:MM:SS' (UTC)"""
+    text = str(value).replace("T", " ")
+    datetime.strptime(text[:19], SQLITE_TIMESTAMP)
+    return text[:19]
+
+
+def _json_text(value):
+    text = value if isinstance(value, str) else json.dumps(value)
+    json.loads(text)
+    return text
+
+
+def _one_of(*choices):
+    def check(value):
+        value = str(value).upper()
+        if value not in choices:
+            raise ValueError(f"expected one of {', '.join(choices)}, got {value!r}")
+        return value
+    return check
+
+
+class Column(NamedTuple):
+    name: str
+    convert: Callable
+    required: bool = False
+
+
+# Trigger-maintained columns (users.tx_count/trades_completed, offers.version) are not
+# moved; inserting the rows recomputes them.
+TABLES: Dict[str, List[Column]] = {
+    'users': [
+        Column('user_id', _integer, True), Column('username', _text), Column('phone', _text),
+        Column('city', _text), Column('city_id', _text), Column('registration_date', _timestamp),
+        Column('last_active', _timestamp), Column('verification_status', _integer),
+        Column('reputation_score', _real), Column('is_blocked', _flag), Column('rating_sum', _real),
+        Column('rating_weight', _real), Column('rating_updated', _timestamp),
+    ],
+    'offers': [
+        Column('offer_id', _integer, True), Column('user_id', _integer, True),
+        Column('offer_type', _one_of("SELL", "BUY"), True), Column('amount', _positive, True),
+        Column('rate', _positive, True), Column('min_order', _positive), Column('max_order', _positive),
+        Column('city', _text), Column('city_id', _text), Column('payment_methods', _json_text),
+        Column('terms', _text), Column('created_date', _timestamp),
+        Column('status', _one_of("ACTIVE", "COMPLETED", "CANCELLED", "EXPIRED", "BLOCKED")),
+        Column('expiry_date', _timestamp), Column('view_count', _integer),
+    ],
+    'transactions': [
+        Column('transaction_id', _integer, True), Column('buyer_id', _integer, True),
+        Column('seller_id', _integer, True), Column('offer_id', _integer), Column('amount', _positive, True),
+        Column('rate', _positive, True), Column('total_inr', _real),
+        Column('status', _one_of("INITIATED", "COMPLETED", "CANCELLED")), Column('created_date', _timestamp),
+        Column('completed_date', _timestamp), Column('meeting_location', _text), Column('notes', _text),
+        Column('buyer_confirmed', _flag), Column('seller_confirmed', _flag),
+    ],
+    'ratings': [
+        Column('rating_id', _integer, True), Column('transaction_id', _integer, True),
+        Column('rater_id', _integer, True), Column('rated_user_id', _integer, True),
+        Column('rating', _stars, True), Column('comment', _text), Column('created_date', _timestamp),
+    ],
+}
+# Parents before children
+TABLE_ORDER = ("users", "offers", "transactions", "ratings")
+# daily_stats counts each row on this day and no trigger moves it, so --on-conflict update
+# keeps the stored value
+DAY_COLUMNS = {'users': 'registration_date', 'offers': 'created_date', 'transactions': 'created_date'}
+
+
+def _format_for(path: str, fmt: Optional[str] = None) -> str:
+    fmt = fmt or os.path.splitext(path)[1].lstrip(".").lower()
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown format for {path}; use a .csv or .jsonl file or --format")
+    return fmt
+
+
+# Export
+
+def export_table(conn: sqlite3.Connection, table: str, path: str, fmt: Optional[str] = None,
+                 batch_size: int = BATCH_SIZE, progress: Optional[Callable[[int], None]] = None) -> int:
+    """Stream one table to a CSV/JSONL file; returns the number of rows written"""
+    fmt = _format_for(path, fmt)
+    names = [column.name for column in TABLES[table]]
+    cursor = conn.execute(f"SELECT {', '.join(names)} FROM {table} ORDER BY {names[0]}")
+    partial = path + ".partial"
+    written = 0
+    with open(partial, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f) if fmt == "csv" else None
+        if writer:
+            writer.writerow(names)
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            if writer:
+                writer.writerows(rows)
+            else:
+                f.writelines(json.dumps(dict(zip(names, row)), ensure_ascii=False) + "\n" for row in rows)
+            written += len(rows)
+            if progress:
+                progress(written)
+    os.replace(partial, path)
+    return written
+
+
+def export_all(db_path: str, directory: str, fmt: str = "csv", tables: Iterable[str] = TABLE_ORDER,
+               batch_size: int = BATCH_SIZE, progress: Optional[Callable[[str, int], None]] = None) -> Dict[str, int]:
+    """Export several tables from one consistent read snapshot"""
+    os.makedirs(directory, exist_ok=True)
+    conn = sqlite3.connect(db_path, timeout=30)
+    counts = {}
+    try:
+        conn.execute("BEGIN")
+        for table in tables:
+            path = os.path.join(directory, f"{table}.{fmt}")
+            counts[table] = export_table(conn, table, path, fmt, batch_size,
+                                         (lambda n, t=table: progress(t, n)) if progress else None)
+        conn.rollback()
+    finally:
+        conn.close()
+    return counts
+
+
+# Import
+
+class _CountingLines:
+    """Decoded lines of a binary file that keeps count of the bytes consumed"""
+
+    def __init__(self, f):
+        self.f = f
+        self.bytes = 0
+
+    def __iter__(self) -> Iterator[str]:
+        for line in self.f:
+            self.bytes += len(line)
+            yield line.decode("utf-8-sig" if self.bytes == len(line) else "utf-8")
+
+
+def _records(lines: _CountingLines, fmt: str) -> Iterator[Tuple[int, Optional[Dict], Optional[str]]]:
+    """Yield (record number, fields, parse error) for every input record"""
+    if fmt == "csv":
+        for number, row in enumerate(csv.DictReader(lines), 1):
+            yield number, row, None
+        return
+    number = 0
+    for line in lines:
+        if not line.strip():
+            continue
+        number += 1
+        try:
+            fields = json.loads(line)
+            if not isinstance(fields, dict):
+                raise ValueError("not a JSON object")
+            yield number, fields, None
+        except ValueError as e:
+            yield number, None, f"invalid JSON: {e}"
+
+
+def validate_row(table: str, fields: Dict) -> Tuple:
+    """Convert one input record to a row tuple for ``table``; raises ValueError"""
+    row = []
+    for column in TABLES[table]:
+        value = fields.get(column.name)
+        if value is None or value == "":
+            if column.required:
+                raise ValueError(f"{column.name} is required")
+            row.append(None)
+            continue
+        try:
+            row.append(column.convert(value))
+        except (TypeError, ValueError) as e:
+            raise ValueError(f"{column.name}: {e}")
+    return tuple(row)
+
+
+def _insert_sql(conn: sqlite3.Connection, table: str, on_conflict: str) -> str:
+    names = [column.name for column in TABLES[table]]
+    # Blank values take the column default, as they would in a plain INSERT without them
+    defaults = {row[1]: row[4] for row in conn.execute(f"PRAGMA table_info({table})") if row[4] is not None}
+    values = ", ".join(f"COALESCE(?, {defaults[name]})" if name in defaults else "?" for name in names)
+    verb = "INSERT OR IGNORE" if on_conflict == "skip" else "INSERT"
+    sql = f"{verb} INTO {table} ({', '.join(names)}) VALUES ({values})"
+    if on_conflict == "update":
+        # An upsert, not OR REPLACE: REPLACE deletes without firing the delete triggers
+        updates = ", ".join(f"{name} = excluded.{name}" for name in names[1:] if name != DAY_COLUMNS.get(table))
+        sql += f" ON CONFLICT ({names[0]}) DO UPDATE SET {updates}"
+    return sql
+
+
+def _progress_key(path: str) -> str:
+    """Identify an input file by path and size so a changed file does not resume"""
+    return f"{os.path.abspath(path)}:{os.path.getsize(path)}"
+
+
+def _ensure_progress_table(conn: sqlite3.Connection):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS import_progress (
+            source TEXT PRIMARY KEY,
+            table_name TEXT NOT NULL,
+            records_done INTEGER NOT NULL,
+            rows_inserted INTEGER NOT NULL,
+            rejected INTEGER NOT NULL,
+            finished INTEGER NOT NULL DEFAULT 0,
+            updated_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    conn.commit()
+
+
+class ImportResult(NamedTuple):
+    table: str
+    records: int  # input records handled, including resumed ones
+    inserted: int  # rows inserted or updated
+    rejected: int
+    resumed_from: int
+
+
+def import_table(conn: sqlite3.Connection, table: str, path: str, fmt: Optional[str] = None,
+                 chunk_size: int = BATCH_SIZE, on_conflict: str = "abort", max_errors: int = 0,
+                 restart: bool = False, progress: Optional[Callable[[int, float], None]] = None) -> ImportResult:
+    """Validate and insert a CSV/JSONL file in chunked transactions, resuming where a previous run stopped"""
+    fmt = _format_for(path, fmt)
+    if conn.in_transaction:
+        conn.commit()
+    _ensure_progress_table(conn)
+    source = _progress_key(path)
+    if restart:
+        conn.execute("DELETE FROM import_progress WHERE source = ?", (source,))
+        conn.commit()
+    state = conn.execute(
+        "SELECT table_name, records_done, rows_inserted, rejected, finished FROM import_progress WHERE source = ?",
+        (source,)
+    ).fetchone()
+    if state and state[0] != table:
+        raise ValueError(f"{path} was previously imported into {state[0]}, not {table}")
+    if state and state[4]:
+        return ImportResult(table, state[1], state[2], state[3], state[1])
+    done, inserted, rejected = (state[1], state[2], state[3]) if state else (0, 0, 0)
+    resumed_from = done
+
+    sql = _insert_sql(conn, table, on_conflict)
+    size = os.path.getsize(path) or 1
+    chunk: List[Tuple] = []
+
+    def commit_chunk(records_done: int, finished: bool = False):
+        nonlocal inserted
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            # rowcount leaves out trigger writes and rows skipped as duplicates
+            inserted += max(conn.executemany(sql, chunk).rowcount, 0)
+            conn.execute('''
+                INSERT INTO import_progress (source, table_name, records_done, rows_inserted, rejected, finished)
+                VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT (source) DO UPDATE SET records_done = excluded.records_done,
+                    rows_inserted = excluded.rows_inserted, rejected = excluded.rejected,
+                    finished = excluded.finished, updated_date = CURRENT_TIMESTAMP
+            ''', (source, table, records_done, inserted, rejected, int(finished)))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        chunk.clear()
+
+    with open(path, "rb") as f, \
+            open(path + ".rejects.jsonl", "a" if done else "w", encoding="utf-8") as rejects:
+        lines = _CountingLines(f)
+        number = 0
+        for number, fields, error in _records(lines, fmt):
+            if number <= done:
+                continue  # committed by an earlier run
+            if error is None:
+                try:
+                    chunk.append(validate_row(table, fields))
+                except ValueError as e:
+                    error = str(e)
+            if error is not None:
+                rejected += 1
+                rejects.write(json.dumps({'record': number, 'error': error, 'fields': fields},
+                                         ensure_ascii=False, default=str) + "\n")
+                if rejected > max_errors:
+                    rejects.flush()
+                    # Keep what was valid so far; a rerun resumes at this record
+                    rejected -= 1
+                    commit_chunk(number - 1)
+                    rejected += 1
+                    raise ValueError(f"Record {number} of {path}: {error} "
+                                     f"({rejected} rejected, limit {max_errors}; see {rejects.name})")
+            if len(chunk) >= chunk_size:
+                commit_chunk(number)
+                if progress:
+                    progress(number, lines.bytes / size)
+        commit_chunk(max(number, done), finished=True)
+    if progress:
+        progress(max(number, done), 1.0)
+    return ImportResult(table, max(number, done), inserted, rejected, resumed_from)
+
+
+def connect_for_import(db_path: str) -> sqlite3.Connection:
+    """Autocommit connection to a migrated database; import_table manages its own transactions"""
+    conn = sqlite3.connect(db_path, timeout=30, isolation_level=None)
+    conn.execute("PRAGMA journal_mode=WAL")
+    apply_migrations(conn)
+    return conn
+
+
+def import_all(db_path: str, directory: str, fmt: str = "csv",
+               progress: Optional[Callable[[str, int, float], None]] = None, **options) -> List[ImportResult]:
+    """Import <table>.<fmt> files from a directory, parents before children"""
+    conn = connect_for_import(db_path)
+    try:
+        results = []
+        for table in TABLE_ORDER:
+            path = os.path.join(directory, f"{table}.{fmt}")
+            if os.path.exists(path):
+                results.append(import_table(conn, table, path, fmt,
+                                            progress=(lambda n, f, t=table: progress(t, n, f)) if progress else None,
+                                            **options))
+        return results
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Stream users, offers and transactions to and from CSV/JSONL")
+    parser.add_argument("--db", default=DATABASE_PATH, help="SQLite database path")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE, help="rows per fetch / insert chunk")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    out = commands.add_parser("export", help="export tables to a directory")
+    out.add_argument("--dir", required=True)
+    out.add_argument("--format", choices=FORMATS, default="csv")
+    out.add_argument("--tables", default=",".join(TABLE_ORDER), help="comma-separated tables")
+
+    load = commands.add_parser("import", help="import a file, or every <table>.<format> file in --dir")
+    load.add_argument("file", nargs="?")
+    load.add_argument("--table", choices=list(TABLES), help="target table for a single file")
+    load.add_argument("--dir")
+    load.add_argument("--format", choices=FORMATS)
+    load.add_argument("--on-conflict", choices=["abort", "skip", "update"], default="abort",
+                      help="existing primary keys: fail, keep the existing row, or update it "
+                           "(the row's registration/created date is kept)")
+    load.add_argument("--max-errors", type=int, default=0, help="invalid rows tolerated before stopping")
+    load.add_argument("--restart", action="store_true", help="ignore saved progress and start over")
+    args = parser.parse_args()
+
+    started: Dict[str, float] = {}
+    last_report = [time.monotonic()]
+
+    def report(label: str, count: int, fraction: Optional[float] = None):
+        if label not in started:
+            if started:
+                print(file=sys.stderr)
+            # A table starts where the previous one finished
+            started[label] = last_report[0]
+        last_report[0] = time.monotonic()
+        rate = count / max(last_report[0] - started[label], 1e-3)
+        done = f" ({fraction:.0%})" if fraction is not None else ""
+        print(f"\r{label}: {count:,} rows{done}, {rate:,.0f} rows/s", end="", file=sys.stderr, flush=True)
+
+    try:
+        if args.command == "export":
+            tables = [table.strip() for table in args.tables.split(",") if table.strip()]
+            unknown = set(tables) - set(TABLES)
+            if unknown:
+                raise ValueError(f"Unknown tables: {', '.join(sorted(unknown))}")
+            counts = export_all(args.db, args.dir, args.format, tables, args.batch_size,
+                                lambda table, n: report(f"export {table}", n))
+            print(file=sys.stderr)
+            for table, count in counts.items():
+                print(f"{table}: {count} rows -> {os.path.join(args.dir, f'{table}.{args.format}')}")
+        else:
+            options = dict(chunk_size=args.batch_size, on_conflict=args.on_conflict,
+                           max_errors=args.max_errors, restart=args.restart)
+            if args.dir:
+                results = import_all(args.db, args.dir, args.format or "csv",
+                                     lambda table, n, f: report(f"import {table}", n, f), **options)
+            elif args.file and args.table:
+                conn = connect_for_import(args.db)
+                try:
+                    results = [import_table(conn, args.table, args.file, args.format,
+                                            progress=lambda n, f: report(f"import {args.table}", n, f), **options)]
+                finally:
+                    conn.close()
+            else:
+                raise ValueError("Give either --dir or a file with --table")
+            print(file=sys.stderr)
+            for result in results:
+                if result.resumed_from and result.resumed_from == result.records:
+                    resumed = " (already imported)"
+                else:
+                    resumed = f", resumed after record {result.resumed_from}" if result.resumed_from else ""
+                print(f"{result.table}: {result.records} records, {result.inserted} rows written, "
+                      f"{result.rejected} rejected{resumed}")
+    except (ValueError, sqlite3.Error) as e:
+        print(file=sys.stderr)
+        raise SystemExit(f"Error: {e}")
@@ -27,8 +27,15 @@ if grep -q "YOUR_BOT_TOKEN_FROM_BOTFATHER" config.py; then
 fi
 
 # Create systemd service file (optional)
+# Usage: ./deploy.sh --service [polling|webhook]
+# Webhook settings (WEBHOOK_URL, WEBHOOK_SECRET, WEBHOOK_PORT, ...) are read from .env
 if [ "$1" = "--service" ]; then
-    echo "🔧 Creating systemd service..."
+    BOT_MODE="${2:-polling}"
+    if [ "$BOT_MODE" != "polling" ] && [ "$BOT_MODE" != "webhook" ]; then
+        echo "❌ Unknown mode '$BOT_MODE'. Use polling or webhook."
+        exit 1
+    fi
+    echo "🔧 Creating systemd service ($BOT_MODE mode)..."
     cat > usdt-exchange-bot.service << EOF
 [Unit]
 Description=USDT-INR Exchange Telegram Bot
@@ -39,7 +46,8 @@ Type=simple
 User=$USER
 WorkingDirectory=$(pwd)
 Environment=PATH=$(pwd)/venv/bin
-ExecStart=$(pwd)/venv/bin/python usdt_exchange_bot.py
+EnvironmentFile=-$(pwd)/.env
+ExecStart=$(pwd)/venv/bin/python usdt_exchange_bot.py --mode $BOT_MODE
 Restart=always
 RestartSec=10
 
@@ -63,7 +71,7 @@ print('✅ Configuration test passed')
 
 if [ $? -eq 0 ]; then
     echo "✅ Deployment completed successfully!"
-    echo "🏃 Run: python usdt_exchange_bot.py"
+    echo "🏃 Run: python usdt_exchange_bot.py [--mode polling|webhook]"
 else
     echo "❌ Deployment failed. Check configuration."
 fi
@@ -0,0 +1,95 @@
+# Offer expiry for USDT-INR Exchange Bot
+#
+# Upcoming expiry times are kept in a min-heap so the periodic job can tell in O(1) whether
+# anything is due. Due offers are moved to EXPIRED in one indexed UPDATE, which keeps the
+# ACTIVE set small and lets reads drop the expiry_date predicate.
+
+import heapq
+import logging
+import threading
+from collections import defaultdict
+from datetime import datetime, timezone
+from typing import Dict, Iterable, List, Tuple
+
+from send_queue import BULK
+
+logger = logging.getLogger(__name__)
+
+SQLITE_TIMESTAMP = "%Y-%m-%d %H:%M:%S"
+
+
+def utc_timestamp(moment: datetime = None) -> str:
+    """UTC time formatted like SQLite's CURRENT_TIMESTAMP / datetime('now')"""
+    return (moment or datetime.now(timezone.utc)).strftime(SQLITE_TIMESTAMP)
+
+
+class ExpiryHeap:
+    """Min-heap of (expiry_date, offer_id) for active offers"""
+
+    def __init__(self):
+        self._heap: List[Tuple[str, int]] = []
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._heap)
+
+    def load(self, offers: Iterable[Dict]):
+        with self._lock:
+            self._heap = [(str(o['expiry_date']), o['offer_id']) for o in offers if o.get('expiry_date')]
+            heapq.heapify(self._heap)
+
+    def push(self, expiry_date: str, offer_id: int):
+        with self._lock:
+            heapq.heappush(self._heap, (str(expiry_date), offer_id))
+
+    def has_due(self, now: str) -> bool:
+        with self._lock:
+            return bool(self._heap) and self._heap[0][0] <= now
+
+    def pop_due(self, now: str) -> List[int]:
+        """Remove and return the ids of every entry due at ``now``"""
+        due = []
+        with self._lock:
+            while self._heap and self._heap[0][0] <= now:
+                due.append(heapq.heappop(self._heap)[1])
+        return due
+
+
+class OfferExpiryScheduler:
+    """JobQueue job that expires due offers and tells their owners"""
+
+    def __init__(self, db, interval: float = 60, outbox=None):
+        self.db = db
+        self.interval = interval
+        self.outbox = outbox
+
+    def schedule(self, job_queue):
+        job_queue.run_repeating(self.check, interval=self.interval, first=0, name="offer_expiry")
+
+    async def check(self, context):
+        if not self.db.expiry_heap.has_due(utc_timestamp()):
+            return
+        expired = await self.db.run(self.db.expire_due_offers)
+        if not expired:
+            return
+        logger.info(f"Expired {len(expired)} offers")
+
+        by_owner = defaultdict(list)
+        for offer in expired:
+            by_owner[offer['user_id']].append(offer)
+        for user_id, offers in by_owner.items():
+            lines = [
+                f"#{o['offer_id']}: {'Selling' if o['offer_type'] == 'SELL' else 'Buying'} "
+                f"{o['amount']} USDT at ₹{o['rate']}"
+                for o in offers
+            ]
+            text = ("⌛ <b>Your offer has expired</b>\n\n" + "\n".join(lines) +
+                    "\n\nPost a new offer if you still want to trade.")
+            if self.outbox is not None:
+                # Bulk lane: interactive replies go out first
+                self.outbox.send_message(user_id, text, priority=BULK, parse_mode='HTML')
+                continue
+            try:
+                await context.bot.send_message(chat_id=user_id, text=text, parse_mode='HTML')
+            except Exception as e:
+                logger.warning(f"Could not notify user {user_id} about expired offers: {e}")
@@ -0,0 +1,156 @@
+# New-offer fan-out for USDT-INR Exchange Bot
+#
+# Users can subscribe to new SELL and/or BUY offers in a city (/subscribe). When an offer is
+# posted, handle_offer_terms hands it to the fan-out and replies to the poster straight away;
+# delivery happens in a background task per (city_id, offer_type):
+#
+# * Coalescing: offers posted within NEW_OFFER_COALESCE_SECONDS go out as one message.
+# * Quiet hours: nothing is sent during NEW_OFFER_QUIET_HOURS; offers posted meanwhile are
+#   held and sent as one digest when the quiet hours end (if they are still active).
+# * Streaming: subscriber ids are read from the city_subscriptions primary key (the
+#   city -> subscriber index) in keyset batches, each on a DB worker thread.
+# * Pacing: messages go through the outbox's bulk lane; the fan-out waits while the outbox
+#   backlog is above FANOUT_MAX_QUEUED, so thousands of subscribers never pile up at once.
+
+import asyncio
+import html
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional, Set, Tuple
+
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+
+from config import (
+    NEW_OFFER_COALESCE_SECONDS, NEW_OFFER_QUIET_HOURS, QUIET_HOURS_UTC_OFFSET_MINUTES,
+    FANOUT_BATCH_SIZE, FANOUT_MAX_QUEUED
+)
+from cities import gazetteer
+from order_book import sort_key
+from rendering import build_offer_card, render_offer_block
+from send_queue import BULK
+
+logger = logging.getLogger(__name__)
+
+DIGEST_SIZE = 5  # offers listed in a coalesced message
+BACKLOG_POLL_SECONDS = 1.0
+
+
+class NewOfferFanout:
+    """Coalesced, paced new-offer notifications to city subscribers"""
+
+    def __init__(self, db, outbox, cards=None, coalesce_seconds: float = NEW_OFFER_COALESCE_SECONDS,
+                 quiet_hours: Optional[Tuple[int, int]] = NEW_OFFER_QUIET_HOURS,
+                 utc_offset_minutes: int = QUIET_HOURS_UTC_OFFSET_MINUTES,
+                 batch_size: int = FANOUT_BATCH_SIZE, max_queued: int = FANOUT_MAX_QUEUED):
+        self.db = db
+        self.outbox = outbox
+        self.cards = cards
+        self.coalesce_seconds = coalesce_seconds
+        self.quiet_hours = quiet_hours
+        self.utc_offset = timedelta(minutes=utc_offset_minutes)
+        self.batch_size = batch_size
+        self.max_queued = max_queued
+        self._pending: Dict[Tuple[str, str], List[Dict]] = {}
+        self._tasks: Dict[Tuple[str, str], asyncio.Task] = {}  # still collecting offers
+        self._deliveries: Set[asyncio.Task] = set()  # every delivery task, collecting or sending
+        self.messages = 0
+        self.fanouts = 0
+
+    def offer_posted(self, offer: Dict):
+        """Hold an offer for the next delivery to its city/side; returns immediately"""
+        key = (offer['city_id'], offer['offer_type'])
+        self._pending.setdefault(key, []).append(offer)
+        if key not in self._tasks:
+            task = self._tasks[key] = asyncio.create_task(self._deliver_later(key))
+            self._deliveries.add(task)
+            task.add_done_callback(self._deliveries.discard)
+
+    def quiet_delay(self, now: Optional[datetime] = None) -> float:
+        """Seconds until the current quiet hours end, 0 outside quiet hours"""
+        if not self.quiet_hours:
+            return 0.0
+        start, end = self.quiet_hours
+        local = (now or datetime.now(timezone.utc)) + self.utc_offset
+        quiet = start <= local.hour < end if start < end else (local.hour >= start or local.hour < end)
+        if not quiet:
+            return 0.0
+        resume = local.replace(hour=end, minute=0, second=0, microsecond=0)
+        if resume <= local:
+            resume += timedelta(days=1)
+        return (resume - local).total_seconds()
+
+    async def _deliver_later(self, key: Tuple[str, str]):
+        try:
+            await asyncio.sleep(self.coalesce_seconds)
+            delay = self.quiet_delay()
+            if delay:
+                logger.info(f"Holding new {key[1]} offers in {key[0]} for {delay / 3600:.1f}h of quiet hours")
+                await asyncio.sleep(delay)
+        finally:
+            # Offers posted from here on start the next window
+            del self._tasks[key]
+            offers = self._pending.pop(key, [])
+        try:
+            await self._fan_out(key, offers)
+        except Exception:
+            logger.exception(f"New-offer fan-out for {key[0]}/{key[1]} failed")
+
+    async def _fan_out(self, key: Tuple[str, str], offers: List[Dict]):
+        city_id, offer_type = key
+        # Skip offers withdrawn or expired while they were held
+        offers = [offer for offer in offers if offer['offer_id'] in self.db.order_book]
+        if not offers:
+            return
+        offers.sort(key=lambda offer: sort_key(offer_type, offer['rate'], offer['offer_id']))
+        text, reply_markup = self.render(offers)
+        # Posters are not told about their own offers, whether alone or in a digest
+        owners = {offer['user_id'] for offer in offers}
+
+        after, recipients = 0, 0
+        while True:
+            batch = await self.db.run(self.db.get_subscriber_batch, city_id, offer_type, after, self.batch_size)
+            for user_id in batch:
+                if user_id not in owners:
+                    self.outbox.send_message(user_id, text, BULK, parse_mode='HTML', reply_markup=reply_markup)
+                    recipients += 1
+            if len(batch) < self.batch_size:
+                break
+            after = batch[-1]
+            while len(self.outbox) > self.max_queued:
+                await asyncio.sleep(BACKLOG_POLL_SECONDS)
+        self.fanouts += 1
+        self.messages += recipients
+        logger.info(f"Queued {len(offers)} new {offer_type} offers in {city_id} for {recipients} subscribers")
+
+    def render(self, offers: List[Dict]) -> Tuple[str, InlineKeyboardMarkup]:
+        offer = offers[0]
+        city = html.escape(gazetteer.display_name(offer['city_id']))
+        traders = "seller" if offer['offer_type'] == "SELL" else "buyer"
+        if len(offers) == 1:
+            card = self.cards.get(offer) if self.cards is not None else build_offer_card(offer)
+            return f"🆕 <b>New {traders} in {city}</b>\n\n{card.text}", card.reply_markup
+
+        lines = [f"🆕 <b>{len(offers)} new {traders}s in {city}</b>\n"]
+        lines += [render_offer_block(o, i, self.cards) for i, o in enumerate(offers[:DIGEST_SIZE], 1)]
+        if len(offers) > DIGEST_SIZE:
+            lines.append(f"…and {len(offers) - DIGEST_SIZE} more")
+        lines.append("Manage notifications with /subscribe")
+        reply_markup = InlineKeyboardMarkup([[InlineKeyboardButton("🔍 Browse Offers", callback_data="browse_offers")]])
+        return "\n".join(lines), reply_markup
+
+    async def stop(self):
+        """Drop held offers and wait for deliveries already sending; call before outbox.stop()"""
+        held = sum(len(offers) for offers in self._pending.values())
+        for task in list(self._tasks.values()):
+            task.cancel()
+        if held:
+            logger.warning(f"Dropped new-offer notifications for {held} held offers on shutdown")
+        if self._deliveries:
+            await asyncio.gather(*self._deliveries, return_exceptions=True)
+
+    def stats(self) -> Dict:
+        return {
+            'held': sum(len(offers) for offers in self._pending.values()),
+            'fanouts': self.fanouts,
+            'messages': self.messages,
+        }
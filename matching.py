@@ -0,0 +1,178 @@
+# Offer matching for USDT-INR Exchange Bot
+#
+# When an offer is posted, the engine looks for counter-offers in the same city that could
+# trade with it right away: the rates cross (SELL rate <= BUY rate) and the order size
+# ranges overlap. Candidates come from the order book's size-banded, price-sorted cells, best
+# price first: a bisect per cell finds where the crossing prices end, and cells whose size
+# bands cannot overlap the new offer's range are skipped, so every crossing offer that could
+# trade is considered without walking the ones that could not.
+#
+# Both parties get a match card. The resting offer's rate is the trade price, and the
+# largest size both sides accept is suggested for /trade.
+#
+#   python matching.py --offers 5000    # benchmark against a brute-force scan
+
+import argparse
+import html
+import random
+import time
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+
+from config import MATCH_LIMIT
+from order_book import OrderBook, sort_key, tradable_range
+from send_queue import BULK, INTERACTIVE
+
+
+def overlap(a: Dict, b: Dict) -> Optional[Tuple[float, float]]:
+    """Trade sizes acceptable to both offers, or None if their ranges do not intersect"""
+    a_low, a_high = tradable_range(a)
+    b_low, b_high = tradable_range(b)
+    low, high = max(a_low, b_low), min(a_high, b_high)
+    return (low, high) if low <= high else None
+
+
+class Match(NamedTuple):
+    offer: Dict  # the newly posted offer
+    counter: Dict  # the resting offer it crosses
+    rate: float  # the resting offer's rate
+    min_amount: float
+    max_amount: float
+
+
+class MatchingEngine:
+    """Finds crossing counter-offers in the order book for a newly posted offer"""
+
+    def __init__(self, order_book: OrderBook, limit: int = MATCH_LIMIT):
+        self.order_book = order_book
+        self.limit = limit
+
+    def find(self, offer: Dict) -> List[Match]:
+        """Up to ``limit`` counter-offers from other users, best rate first"""
+        counter_type = "BUY" if offer['offer_type'] == "SELL" else "SELL"
+        owner = offer['user_id']
+        counters = self.order_book.crossing(offer['city_id'], counter_type, offer['rate'], *tradable_range(offer),
+                                            lambda counter: counter['user_id'] != owner, self.limit)
+        return [Match(offer, counter, counter['rate'], *overlap(offer, counter)) for counter in counters]
+
+    def notify(self, outbox, matches: List[Match]):
+        """Queue a match card for the new offer's owner and one for each counterparty"""
+        if not matches:
+            return
+        offer = matches[0].offer
+        text, reply_markup = render_owner_card(matches)
+        outbox.send_message(offer['user_id'], text, INTERACTIVE, parse_mode='HTML', reply_markup=reply_markup)
+        for match in matches:
+            text, reply_markup = render_counterparty_card(match)
+            # Bulk lane: the counterparty did not ask for this message
+            outbox.send_message(match.counter['user_id'], text, BULK, parse_mode='HTML', reply_markup=reply_markup)
+
+
+def _side(offer: Dict) -> str:
+    return "sells" if offer['offer_type'] == "SELL" else "buys"
+
+
+def _amount(value: float) -> str:
+    return f"{value:g}"
+
+
+def render_owner_card(matches: List[Match]) -> Tuple[str, InlineKeyboardMarkup]:
+    offer = matches[0].offer
+    lines = [f"🎯 <b>Your offer #{offer['offer_id']} matches {len(matches)} "
+             f"offer{'s' if len(matches) > 1 else ''}</b>\n"]
+    keyboard = []
+    for i, match in enumerate(matches, 1):
+        counter = match.counter
+        username = html.escape(str(counter['username']))
+        lines.append(
+            f"{i}. @{username} {_side(counter)} at ₹{match.rate} · "
+            f"{_amount(match.min_amount)}-{_amount(match.max_amount)} USDT · #{counter['offer_id']}\n"
+            f"   /trade {counter['offer_id']} {_amount(match.max_amount)}"
+        )
+        keyboard.append([InlineKeyboardButton(f"💬 {i}. @{counter['username']}"[:40],
+                                              callback_data=f"contact_{counter['user_id']}")])
+    return "\n".join(lines), InlineKeyboardMarkup(keyboard)
+
+
+def render_counterparty_card(match: Match) -> Tuple[str, InlineKeyboardMarkup]:
+    offer, counter = match.offer, match.counter
+    username = html.escape(str(offer['username']))
+    text = (
+        f"🎯 <b>New match for your offer #{counter['offer_id']}</b>\n\n"
+        f"@{username} {_side(offer)} at ₹{offer['rate']} (your rate ₹{counter['rate']})\n"
+        f"Trade size: {_amount(match.min_amount)}-{_amount(match.max_amount)} USDT\n\n"
+        f"They can /trade on your offer, or you can take theirs with "
+        f"/trade {offer['offer_id']} {_amount(match.max_amount)}"
+    )
+    reply_markup = InlineKeyboardMarkup([[
+        InlineKeyboardButton("💬 Contact User", callback_data=f"contact_{offer['user_id']}")
+    ]])
+    return text, reply_markup
+
+
+def _brute_force(offers: List[Dict], offer: Dict, limit: int) -> List[int]:
+    """Reference answer: check every offer and sort the ones that could trade"""
+    counter_type = "BUY" if offer['offer_type'] == "SELL" else "SELL"
+    crossing = [
+        o for o in offers
+        if o['city_id'] == offer['city_id'] and o['offer_type'] == counter_type and o['user_id'] != offer['user_id']
+        and (o['rate'] <= offer['rate'] if counter_type == "SELL" else o['rate'] >= offer['rate'])
+        and overlap(offer, o) is not None
+    ]
+    crossing.sort(key=lambda o: sort_key(counter_type, o['rate'], o['offer_id']))
+    return [o['offer_id'] for o in crossing[:limit]]
+
+
+def _random_offer(rng: random.Random, offer_id: int, offer_type: str, mid: float, spread: float) -> Dict:
+    min_order = rng.choice([10, 25, 50, 100, 250, 500])
+    max_order = min_order * rng.choice([1, 2, 4, 10, 20])
+    # Sellers sit above the mid and buyers below it, with some overlap around it
+    offset = rng.uniform(-spread, 3 * spread)
+    return {
+        'offer_id': offer_id, 'user_id': offer_id, 'username': f"user{offer_id}", 'offer_type': offer_type,
+        'amount': max_order * rng.choice([1, 1, 2]), 'min_order': min_order, 'max_order': max_order,
+        'rate': round(mid + offset if offer_type == "SELL" else mid - offset, 2), 'city_id': "mumbai",
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark offer matching against a brute-force scan")
+    parser.add_argument("--offers", type=int, default=5000, help="active offers per side in one city")
+    parser.add_argument("--queries", type=int, default=2000, help="new offers to match")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    mid, spread = 88.0, 0.5
+    offers = [_random_offer(rng, i, side, mid, spread)
+              for i, side in enumerate(["SELL", "BUY"] * args.offers, 1)]
+    book = OrderBook()
+    book.load(offers)
+    engine = MatchingEngine(book)
+
+    queries = [_random_offer(rng, len(offers) + i, rng.choice(["SELL", "BUY"]), mid, spread)
+               for i in range(1, args.queries + 1)]
+    # Aggressive offers priced through the whole opposite side
+    queries += [dict(q, rate=mid + 10 if q['offer_type'] == "BUY" else mid - 10) for q in queries[:args.queries // 10]]
+
+    timings, brute_timings, matched = [], [], 0
+    for query in queries:
+        start = time.perf_counter()
+        matches = engine.find(query)
+        timings.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        expected = _brute_force(offers, query, engine.limit)
+        brute_timings.append(time.perf_counter() - start)
+        found = [m.counter['offer_id'] for m in matches]
+        assert found == expected, f"offer {query['offer_id']}: engine {found}, brute force {expected}"
+        matched += bool(matches)
+
+    def percentile(values: List[float], p: float) -> float:
+        return sorted(values)[min(len(values) - 1, int(p * len(values)))] * 1e6
+
+    print(f"{len(offers)} active offers, {len(queries)} new offers ({matched} matched), results identical")
+    for name, values in (("engine", timings), ("brute force", brute_timings)):
+        print(f"{name:>12}: p50 {percentile(values, 0.5):8.1f} µs  p99 {percentile(values, 0.99):8.1f} µs  "
+              f"max {max(values) * 1e6:8.1f} µs")
@@ -0,0 +1,551 @@
+# Schema migrations for USDT-INR Exchange Bot
+#
+# Each migration is an ordered (version, description, function) entry. Steps must be
+# idempotent so a database that already has some of the objects (e.g. the original
+# CREATE TABLE IF NOT EXISTS schema) upgrades cleanly in place.
+
+import re
+import sqlite3
+import logging
+from typing import Callable, Dict, List, Tuple
+
+from cities import gazetteer
+from config import REPUTATION_PRIOR_MEAN
+from reputation import ReputationEngine
+
+logger = logging.getLogger(__name__)
+
+
+def _column_exists(cursor: sqlite3.Cursor, table: str, column: str) -> bool:
+    cursor.execute(f"PRAGMA table_info({table})")
+    return any(row[1] == column for row in cursor.fetchall())
+
+
+def _add_column(cursor: sqlite3.Cursor, table: str, column: str, declaration: str):
+    """ALTER TABLE ... ADD COLUMN, skipped when the column is already there"""
+    if not _column_exists(cursor, table, column):
+        cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {declaration}")
+
+
+def _001_base_tables(cursor: sqlite3.Cursor):
+    """Original schema"""
+    # Users table
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS users (
+            user_id INTEGER PRIMARY KEY,
+            username TEXT,
+            phone TEXT,
+            city TEXT,
+            registration_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            last_active TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            verification_status INTEGER DEFAULT 0,
+            reputation_score REAL DEFAULT 5.0,
+            is_blocked INTEGER DEFAULT 0
+        )
+    ''')
+
+    # Offers table
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS offers (
+            offer_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            offer_type TEXT, -- 'SELL' or 'BUY'
+            amount REAL,
+            rate REAL,
+            min_order REAL,
+            max_order REAL,
+            city TEXT,
+            payment_methods TEXT, -- JSON string
+            terms TEXT,
+            created_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            status TEXT DEFAULT 'ACTIVE', -- 'ACTIVE', 'COMPLETED', 'CANCELLED'
+            expiry_date TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users (user_id)
+        )
+    ''')
+
+    # Transactions table
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS transactions (
+            transaction_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            buyer_id INTEGER,
+            seller_id INTEGER,
+            offer_id INTEGER,
+            amount REAL,
+            rate REAL,
+            total_inr REAL,
+            status TEXT DEFAULT 'INITIATED',
+            created_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            completed_date TIMESTAMP,
+            meeting_location TEXT,
+            notes TEXT,
+            FOREIGN KEY (buyer_id) REFERENCES users (user_id),
+            FOREIGN KEY (seller_id) REFERENCES users (user_id),
+            FOREIGN KEY (offer_id) REFERENCES offers (offer_id)
+        )
+    ''')
+
+    # Ratings table
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS ratings (
+            rating_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            transaction_id INTEGER,
+            rater_id INTEGER,
+            rated_user_id INTEGER,
+            rating INTEGER, -- 1-5 stars
+            comment TEXT,
+            created_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (transaction_id) REFERENCES transactions (transaction_id),
+            FOREIGN KEY (rater_id) REFERENCES users (user_id),
+            FOREIGN KEY (rated_user_id) REFERENCES users (user_id)
+        )
+    ''')
+
+
+def _002_query_indexes(cursor: sqlite3.Cursor):
+    """Indexes for the browse, listing, expiry and admin queries"""
+    # get_offers always filters on status and orders by created_date DESC
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_offers_status_created
+        ON offers (status, created_date DESC)
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_offers_status_city_created
+        ON offers (status, city, created_date DESC)
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_offers_status_type_created
+        ON offers (status, offer_type, created_date DESC)
+    ''')
+    # My Listings: get_offers({'user_id': ...})
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_offers_user_status_created
+        ON offers (user_id, status, created_date DESC)
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_offers_status_expiry
+        ON offers (status, expiry_date)
+    ''')
+
+    # AdminPanel.get_top_users / get_stats
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_transactions_buyer ON transactions (buyer_id)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_transactions_seller ON transactions (seller_id)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_transactions_completed ON transactions (completed_date)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_users_registration ON users (registration_date)")
+
+
+def _003_city_ids(cursor: sqlite3.Cursor):
+    """Canonical city ids on users and offers, backfilled from the free-text city column"""
+    _add_column(cursor, "users", "city_id", "TEXT")
+    _add_column(cursor, "offers", "city_id", "TEXT")
+
+    for table in ("users", "offers"):
+        cursor.execute(f"SELECT DISTINCT city FROM {table} WHERE city IS NOT NULL AND city_id IS NULL")
+        for (city,) in cursor.fetchall():
+            cursor.execute(
+                f"UPDATE {table} SET city_id = ? WHERE city = ? AND city_id IS NULL",
+                (gazetteer.city_id_for(city), city)
+            )
+
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_offers_status_cityid_type_created
+        ON offers (status, city_id, offer_type, created_date DESC)
+    ''')
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_users_city_id ON users (city_id)")
+
+
+def _004_activity_tracking(cursor: sqlite3.Cursor):
+    """Offer view counters and an audit log, written through the write-behind queue"""
+    _add_column(cursor, "offers", "view_count", "INTEGER DEFAULT 0")
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS audit_log (
+            audit_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            action TEXT,
+            details TEXT,
+            created_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_audit_log_user_created ON audit_log (user_id, created_date)")
+
+
+def _005_utc_expiry_dates(cursor: sqlite3.Cursor):
+    """Rewrite local-time Python expiry timestamps in SQLite's UTC CURRENT_TIMESTAMP format"""
+    cursor.execute('''
+        UPDATE offers SET expiry_date = datetime(expiry_date, 'utc')
+        WHERE expiry_date IS NOT NULL AND length(expiry_date) > 19
+    ''')
+
+
+def _006_offer_versions(cursor: sqlite3.Cursor):
+    """Version counter bumped whenever anything shown on an offer card changes"""
+    _add_column(cursor, "offers", "version", "INTEGER NOT NULL DEFAULT 1")
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_offers_version
+        AFTER UPDATE OF offer_type, amount, rate, min_order, max_order, city, city_id,
+                        payment_methods, terms ON offers
+        BEGIN
+            UPDATE offers SET version = OLD.version + 1 WHERE offer_id = NEW.offer_id;
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_users_offer_version
+        AFTER UPDATE OF username, reputation_score ON users
+        WHEN OLD.username IS NOT NEW.username OR OLD.reputation_score IS NOT NEW.reputation_score
+        BEGIN
+            UPDATE offers SET version = version + 1 WHERE user_id = NEW.user_id;
+        END
+    ''')
+
+
+def _007_persistence(cursor: sqlite3.Cursor):
+    """Conversation states and user/chat/bot data kept across restarts (see persistence.py)"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS persistence (
+            kind TEXT NOT NULL,
+            key TEXT NOT NULL,
+            data TEXT NOT NULL,
+            updated_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (kind, key)
+        ) WITHOUT ROWID
+    ''')
+
+
+DAILY_STATS_TOTAL = "total"
+
+
+def _bump_daily_stats(day: str, column: str, delta: str = "1", when: str = "1") -> str:
+    """Trigger statement adding ``delta`` to one daily_stats counter, creating the row if needed"""
+    return f'''
+            INSERT INTO daily_stats (day, {column}) SELECT {day}, {delta} WHERE {when}
+            ON CONFLICT (day) DO UPDATE SET {column} = {column} + excluded.{column};'''
+
+
+def rebuild_daily_stats(cursor: sqlite3.Cursor) -> int:
+    """Recompute daily_stats from users, offers and transactions; returns the number of rows.
+
+    Each source table is read once through an aggregate cursor and the per-day counters are
+    accumulated in memory (one small dict entry per day) before being written back.
+    """
+    columns = ("new_users", "offers_created", "offers_active", "transactions_initiated",
+               "transactions_completed")
+    days: Dict[str, Dict[str, int]] = {}
+    total = dict.fromkeys(columns, 0)
+
+    def add(day, column, count):
+        if day is not None:
+            days.setdefault(day, dict.fromkeys(columns, 0))[column] += count
+        total[column] += count
+
+    for day, count in cursor.execute("SELECT date(registration_date), COUNT(*) FROM users GROUP BY 1"):
+        add(day, "new_users", count)
+    for day, count, active in cursor.execute(
+            "SELECT date(created_date), COUNT(*), SUM(status = 'ACTIVE') FROM offers GROUP BY 1"):
+        add(day, "offers_created", count)
+        total["offers_active"] += active
+    for day, count in cursor.execute("SELECT date(created_date), COUNT(*) FROM transactions GROUP BY 1"):
+        add(day, "transactions_initiated", count)
+    for day, count in cursor.execute(
+            "SELECT date(completed_date), COUNT(*) FROM transactions WHERE completed_date IS NOT NULL GROUP BY 1"):
+        add(day, "transactions_completed", count)
+
+    days[DAILY_STATS_TOTAL] = total
+    cursor.execute("DELETE FROM daily_stats")
+    cursor.executemany(
+        f"INSERT INTO daily_stats (day, {', '.join(columns)}) VALUES (?, ?, ?, ?, ?, ?)",
+        ((day, *(counters[c] for c in columns)) for day, counters in days.items())
+    )
+    return len(days)
+
+
+def _008_daily_stats(cursor: sqlite3.Cursor):
+    """Per-day counters plus an all-time 'total' row, kept current by triggers"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS daily_stats (
+            day TEXT PRIMARY KEY, -- 'YYYY-MM-DD' (UTC) or 'total'
+            new_users INTEGER NOT NULL DEFAULT 0,
+            offers_created INTEGER NOT NULL DEFAULT 0,
+            offers_active INTEGER NOT NULL DEFAULT 0, -- only maintained on the 'total' row
+            transactions_initiated INTEGER NOT NULL DEFAULT 0,
+            transactions_completed INTEGER NOT NULL DEFAULT 0
+        ) WITHOUT ROWID
+    ''')
+    total = f"'{DAILY_STATS_TOTAL}'"
+    triggers = {
+        "trg_stats_user_insert": (
+            "AFTER INSERT ON users",
+            _bump_daily_stats("date(NEW.registration_date)", "new_users")
+            + _bump_daily_stats(total, "new_users")),
+        "trg_stats_user_delete": (
+            "AFTER DELETE ON users",
+            _bump_daily_stats("date(OLD.registration_date)", "new_users", "-1")
+            + _bump_daily_stats(total, "new_users", "-1")),
+        "trg_stats_offer_insert": (
+            "AFTER INSERT ON offers",
+            _bump_daily_stats("date(NEW.created_date)", "offers_created")
+            + _bump_daily_stats(total, "offers_created")
+            + _bump_daily_stats(total, "offers_active", "NEW.status = 'ACTIVE'")),
+        "trg_stats_offer_status": (
+            "AFTER UPDATE OF status ON offers WHEN (OLD.status = 'ACTIVE') != (NEW.status = 'ACTIVE')",
+            _bump_daily_stats(total, "offers_active", "(NEW.status = 'ACTIVE') - (OLD.status = 'ACTIVE')")),
+        "trg_stats_offer_delete": (
+            "AFTER DELETE ON offers",
+            _bump_daily_stats("date(OLD.created_date)", "offers_created", "-1")
+            + _bump_daily_stats(total, "offers_created", "-1")
+            + _bump_daily_stats(total, "offers_active", "-(OLD.status = 'ACTIVE')")),
+        "trg_stats_transaction_insert": (
+            "AFTER INSERT ON transactions",
+            _bump_daily_stats("date(NEW.created_date)", "transactions_initiated")
+            + _bump_daily_stats(total, "transactions_initiated")),
+        "trg_stats_transaction_insert_completed": (
+            "AFTER INSERT ON transactions WHEN NEW.completed_date IS NOT NULL",
+            _bump_daily_stats("date(NEW.completed_date)", "transactions_completed")
+            + _bump_daily_stats(total, "transactions_completed")),
+        "trg_stats_transaction_completed": (
+            "AFTER UPDATE OF completed_date ON transactions "
+            "WHEN OLD.completed_date IS NOT NEW.completed_date",
+            # Moves the completion from its old day (if any) to its new day (if any)
+            _bump_daily_stats("date(OLD.completed_date)", "transactions_completed", "-1",
+                              "OLD.completed_date IS NOT NULL")
+            + _bump_daily_stats("date(NEW.completed_date)", "transactions_completed", "1",
+                                "NEW.completed_date IS NOT NULL")
+            + _bump_daily_stats(total, "transactions_completed",
+                                "(NEW.completed_date IS NOT NULL) - (OLD.completed_date IS NOT NULL)")),
+        "trg_stats_transaction_delete": (
+            "AFTER DELETE ON transactions",
+            _bump_daily_stats("date(OLD.created_date)", "transactions_initiated", "-1")
+            + _bump_daily_stats(total, "transactions_initiated", "-1")
+            + _bump_daily_stats("date(OLD.completed_date)", "transactions_completed", "-1",
+                                "OLD.completed_date IS NOT NULL")
+            + _bump_daily_stats(total, "transactions_completed", "-(OLD.completed_date IS NOT NULL)")),
+    }
+    for name, (event, body) in triggers.items():
+        cursor.execute(f"CREATE TRIGGER IF NOT EXISTS {name} {event} BEGIN{body}\n        END")
+    rebuild_daily_stats(cursor)
+
+
+def rebuild_trade_counters(cursor: sqlite3.Cursor):
+    """Recount users.tx_count / trades_completed from the transactions table"""
+    # Each side is a range read on idx_transactions_buyer / idx_transactions_seller
+    cursor.execute('''
+        UPDATE users SET
+            tx_count = (SELECT COUNT(*) FROM transactions WHERE buyer_id = users.user_id)
+                     + (SELECT COUNT(*) FROM transactions
+                        WHERE seller_id = users.user_id AND buyer_id IS NOT users.user_id),
+            trades_completed = (SELECT COUNT(*) FROM transactions
+                                WHERE buyer_id = users.user_id AND status = 'COMPLETED')
+                             + (SELECT COUNT(*) FROM transactions
+                                WHERE seller_id = users.user_id AND buyer_id IS NOT users.user_id
+                                  AND status = 'COMPLETED')
+    ''')
+
+
+def _009_trade_counters(cursor: sqlite3.Cursor):
+    """Per-user trade counters and leaderboard indexes"""
+    _add_column(cursor, "users", "tx_count", "INTEGER NOT NULL DEFAULT 0")
+    _add_column(cursor, "users", "trades_completed", "INTEGER NOT NULL DEFAULT 0")
+    # A self-trade counts once, like the old OR-subquery did
+    parties = "user_id IN ({0}.buyer_id, {0}.seller_id)"
+    completed = "({0}.status = 'COMPLETED')"
+    triggers = {
+        "trg_users_tx_insert": (
+            "AFTER INSERT ON transactions",
+            f"UPDATE users SET tx_count = tx_count + 1, trades_completed = trades_completed + "
+            f"{completed.format('NEW')} WHERE {parties.format('NEW')};"),
+        "trg_users_tx_status": (
+            f"AFTER UPDATE OF status ON transactions WHEN {completed.format('OLD')} != {completed.format('NEW')}",
+            f"UPDATE users SET trades_completed = trades_completed + {completed.format('NEW')} - "
+            f"{completed.format('OLD')} WHERE {parties.format('NEW')};"),
+        "trg_users_tx_parties": (
+            "AFTER UPDATE OF buyer_id, seller_id ON transactions",
+            f"UPDATE users SET tx_count = tx_count - 1, trades_completed = trades_completed - "
+            f"{completed.format('OLD')} WHERE {parties.format('OLD')};"
+            f"\n            UPDATE users SET tx_count = tx_count + 1, trades_completed = trades_completed + "
+            f"{completed.format('NEW')} WHERE {parties.format('NEW')};"),
+        "trg_users_tx_delete": (
+            "AFTER DELETE ON transactions",
+            f"UPDATE users SET tx_count = tx_count - 1, trades_completed = trades_completed - "
+            f"{completed.format('OLD')} WHERE {parties.format('OLD')};"),
+    }
+    for name, (event, body) in triggers.items():
+        cursor.execute(f"CREATE TRIGGER IF NOT EXISTS {name} {event} BEGIN\n            {body}\n        END")
+    rebuild_trade_counters(cursor)
+
+    # AdminPanel.get_top_users and /top read these in order and stop after LIMIT rows
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_users_leaderboard
+        ON users (reputation_score DESC, tx_count DESC)
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_users_city_leaderboard
+        ON users (city_id, reputation_score DESC, tx_count DESC)
+    ''')
+
+
+def _010_ratings(cursor: sqlite3.Cursor):
+    """Running rating aggregates per user and two-sided trade confirmation"""
+    _add_column(cursor, "users", "rating_sum", "REAL NOT NULL DEFAULT 0")
+    _add_column(cursor, "users", "rating_weight", "REAL NOT NULL DEFAULT 0")
+    _add_column(cursor, "users", "rating_updated", "TIMESTAMP")
+    _add_column(cursor, "transactions", "buyer_confirmed", "INTEGER NOT NULL DEFAULT 0")
+    _add_column(cursor, "transactions", "seller_confirmed", "INTEGER NOT NULL DEFAULT 0")
+    # One rating per party per trade
+    cursor.execute('''
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_ratings_transaction_rater
+        ON ratings (transaction_id, rater_id)
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_ratings_rated_created
+        ON ratings (rated_user_id, created_date)
+    ''')
+    ReputationEngine().recompute(cursor.connection, rebuild=True)
+
+
+def _011_transaction_history(cursor: sqlite3.Cursor):
+    """Per-party history indexes for keyset-paginated My Transactions"""
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_transactions_buyer_created
+        ON transactions (buyer_id, created_date, transaction_id)
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_transactions_seller_created
+        ON transactions (seller_id, created_date, transaction_id)
+    ''')
+    # Covered by the composite indexes above
+    cursor.execute("DROP INDEX IF EXISTS idx_transactions_buyer")
+    cursor.execute("DROP INDEX IF EXISTS idx_transactions_seller")
+
+
+def _012_price_alerts(cursor: sqlite3.Cursor):
+    """Price alert subscriptions; the bot keeps the active ones indexed in memory"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS price_alerts (
+            alert_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            city_id TEXT NOT NULL,
+            offer_type TEXT NOT NULL CHECK (offer_type IN ('BUY', 'SELL')),
+            direction TEXT NOT NULL CHECK (direction IN ('BELOW', 'ABOVE')),
+            threshold REAL NOT NULL,
+            created_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            expiry_date TIMESTAMP NOT NULL,
+            FOREIGN KEY (user_id) REFERENCES users (user_id)
+        )
+    ''')
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_price_alerts_user ON price_alerts (user_id)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_price_alerts_expiry ON price_alerts (expiry_date)")
+
+
+def _013_city_subscriptions(cursor: sqlite3.Cursor):
+    """Opt-in new-offer notifications; the primary key doubles as the city -> subscriber index"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS city_subscriptions (
+            city_id TEXT NOT NULL,
+            offer_type TEXT NOT NULL CHECK (offer_type IN ('BUY', 'SELL')),
+            user_id INTEGER NOT NULL,
+            created_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (city_id, offer_type, user_id)
+        ) WITHOUT ROWID
+    ''')
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_city_subscriptions_user ON city_subscriptions (user_id)")
+
+
+def _014_trade_counter_updates(cursor: sqlite3.Cursor):
+    """Count a completion once when an update also changes the trade's parties"""
+    # Both the status and the parties trigger of migration 9 fired for such an update; now
+    # the status trigger leaves it to the parties trigger, which moves the completion too
+    parties = "user_id IN ({0}.buyer_id, {0}.seller_id)"
+    completed = "({0}.status = 'COMPLETED')"
+    same_parties = "OLD.buyer_id IS NEW.buyer_id AND OLD.seller_id IS NEW.seller_id"
+    triggers = {
+        "trg_users_tx_status": (
+            f"AFTER UPDATE OF status ON transactions "
+            f"WHEN {completed.format('OLD')} != {completed.format('NEW')} AND {same_parties}",
+            f"UPDATE users SET trades_completed = trades_completed + {completed.format('NEW')} - "
+            f"{completed.format('OLD')} WHERE {parties.format('NEW')};"),
+        "trg_users_tx_parties": (
+            f"AFTER UPDATE OF buyer_id, seller_id ON transactions WHEN NOT ({same_parties})",
+            f"UPDATE users SET tx_count = tx_count - 1, trades_completed = trades_completed - "
+            f"{completed.format('OLD')} WHERE {parties.format('OLD')};"
+            f"\n            UPDATE users SET tx_count = tx_count + 1, trades_completed = trades_completed + "
+            f"{completed.format('NEW')} WHERE {parties.format('NEW')};"),
+    }
+    for name, (event, body) in triggers.items():
+        cursor.execute(f"DROP TRIGGER IF EXISTS {name}")
+        cursor.execute(f"CREATE TRIGGER {name} {event} BEGIN\n            {body}\n        END")
+    rebuild_trade_counters(cursor)
+
+
+def _015_reputation_default(cursor: sqlite3.Cursor):
+    """Unrated users default to the reputation prior, as migration 10 scored existing ones"""
+    # SQLite cannot ALTER a column default; a default lives only in the stored CREATE TABLE
+    # text, so it is edited in place (https://sqlite.org/lang_altertable.html#otheralter)
+    sql = cursor.execute("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'users'").fetchone()[0]
+    updated = re.sub(r"(reputation_score\s+REAL\s+DEFAULT\s+)[-+0-9.eE]+", rf"\g<1>{float(REPUTATION_PRIOR_MEAN)!r}", sql)
+    if updated != sql:
+        schema_version = cursor.execute("PRAGMA schema_version").fetchone()[0]
+        cursor.execute("PRAGMA writable_schema = ON")
+        cursor.execute("UPDATE sqlite_master SET sql = ? WHERE type = 'table' AND name = 'users'", (updated,))
+        cursor.execute(f"PRAGMA schema_version = {schema_version + 1}")
+        cursor.execute("PRAGMA writable_schema = OFF")
+    # Users inserted since migration 10 by anything but create_user got the old default
+    cursor.execute("UPDATE users SET reputation_score = ? WHERE rating_weight = 0",
+                   (ReputationEngine().score(0, 0),))
+
+
+MIGRATIONS: List[Tuple[int, str, Callable[[sqlite3.Cursor], None]]] = [
+    (1, "base tables", _001_base_tables),
+    (2, "query indexes", _002_query_indexes),
+    (3, "canonical city ids", _003_city_ids),
+    (4, "activity tracking", _004_activity_tracking),
+    (5, "utc expiry dates", _005_utc_expiry_dates),
+    (6, "offer versions", _006_offer_versions),
+    (7, "conversation persistence", _007_persistence),
+    (8, "daily stats", _008_daily_stats),
+    (9, "trade counters", _009_trade_counters),
+    (10, "ratings", _010_ratings),
+    (11, "transaction history", _011_transaction_history),
+    (12, "price alerts", _012_price_alerts),
+    (13, "city subscriptions", _013_city_subscriptions),
+    (14, "trade counter updates", _014_trade_counter_updates),
+    (15, "reputation default", _015_reputation_default),
+]
+
+
+def get_schema_version(conn: sqlite3.Connection) -> int:
+    cursor = conn.cursor()
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            description TEXT,
+            applied_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    cursor.execute("SELECT COALESCE(MAX(version), 0) FROM schema_version")
+    return cursor.fetchone()[0]
+
+
+def apply_migrations(conn: sqlite3.Connection) -> int:
+    """Apply every pending migration in order and return the resulting schema version"""
+    current = get_schema_version(conn)
+    conn.commit()
+
+    for version, description, migrate in MIGRATIONS:
+        if version <= current:
+            continue
+        cursor = conn.cursor()
+        try:
+            cursor.execute("BEGIN")
+            migrate(cursor)
+            cursor.execute(
+                "INSERT INTO schema_version (version, description) VALUES (?, ?)",
+                (version, description)
+            )
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            logger.exception(f"Migration {version} ({description}) failed")
+            raise
+        current = version
+        logger.info(f"Applied migration {version}: {description}")
+
+    return current
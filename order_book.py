@@ -0,0 +1,369 @@
+# In-memory order book for USDT-INR Exchange Bot
+#
+# Active offers are kept sorted per (city_id, offer_type) by rate so browsing can show the
+# best prices first without touching SQLite: SELL offers cheapest first, BUY offers
+# highest first, ties broken by offer_id (oldest first).
+#
+# Market statistics come from the same structures: best and median rates are positions in
+# the sorted sides, and per-side amount and amount * rate totals are adjusted on every add
+# and remove, so market() is O(1) however many offers a city has. check_consistency compares
+# them with a brute-force recompute (market_from_offers) and the bot reconciles periodically.
+#
+# For matching, each side is also split into cells by the power-of-two bands of its offers'
+# smallest and largest tradable size, each cell price-sorted too. crossing() merges only the
+# cells whose bands can overlap the requested size range, so offers that are too small or too
+# large are never looked at.
+
+import heapq
+import itertools
+import math
+import threading
+from bisect import bisect_left, bisect_right, insort
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+
+# Relative tolerance for incrementally maintained totals
+TOTALS_TOLERANCE = 1e-9
+
+
+def sort_key(offer_type: str, rate: float, offer_id: int) -> Tuple[float, int]:
+    """Book order of an offer: best rate first (SELL lowest, BUY highest), then oldest"""
+    return (rate if offer_type == "SELL" else -rate, offer_id)
+
+
+def tradable_range(offer: Dict) -> Tuple[float, float]:
+    """Trade sizes an offer accepts: its order limits, capped by what is left of it"""
+    return offer['min_order'], min(offer['max_order'], offer['amount'])
+
+
+def _band(size: float) -> int:
+    """Size band: 0 below 1, then b for sizes in [2 ** (b - 1), 2 ** b)"""
+    return max(0, math.frexp(size)[1]) if size > 0 else 0
+
+
+def _size_cell(offer: Dict) -> Tuple[int, int]:
+    low, high = tradable_range(offer)
+    return _band(low), _band(high)
+
+
+def _cell_may_overlap(cell: Tuple[int, int], low: float, high: float) -> bool:
+    """Whether some offer in ``cell`` could accept a trade size in [low, high]"""
+    low_band, high_band = cell
+    smallest_low = 2.0 ** (low_band - 1) if low_band else 0.0
+    return smallest_low <= high and 2.0 ** high_band > low
+
+
+def _median(rates: List[float]) -> float:
+    middle = len(rates) // 2
+    return rates[middle] if len(rates) % 2 else (rates[middle - 1] + rates[middle]) / 2
+
+
+def _side_stats(count: int, best: float, median: float, volume: float, notional: float) -> Dict:
+    return {
+        'count': count, 'best': best, 'median': median, 'volume': volume,
+        'weighted_average': notional / volume if volume else None,
+    }
+
+
+def _market(sell: Optional[Dict], buy: Optional[Dict]) -> Dict:
+    market = {'SELL': sell, 'BUY': buy, 'spread': None, 'spread_percent': None}
+    if sell and buy:
+        market['spread'] = sell['best'] - buy['best']
+        market['spread_percent'] = market['spread'] / sell['best'] * 100
+    return market
+
+
+def markets_from_offers(offers: Iterable[Dict]) -> Dict[str, Dict]:
+    """Brute-force market statistics per city in one pass, for checking OrderBook.market()"""
+    sides: Dict[Tuple[str, str], List[Dict]] = {}
+    for offer in offers:
+        sides.setdefault((offer['city_id'], offer['offer_type']), []).append(offer)
+    stats = {}
+    for (city_id, offer_type), side in sides.items():
+        rates = sorted(o['rate'] for o in side)
+        stats[(city_id, offer_type)] = _side_stats(
+            len(side), rates[0] if offer_type == "SELL" else rates[-1], _median(rates),
+            math.fsum(o['amount'] for o in side), math.fsum(o['amount'] * o['rate'] for o in side)
+        )
+    return {city_id: _market(stats.get((city_id, "SELL")), stats.get((city_id, "BUY")))
+            for city_id, _ in stats}
+
+
+def market_from_offers(offers: Iterable[Dict], city_id: str) -> Dict:
+    """Brute-force market statistics for one city"""
+    markets = markets_from_offers(o for o in offers if o['city_id'] == city_id)
+    return markets.get(city_id) or _market(None, None)
+
+
+def _book_side(offer_type: str, keys: List[Tuple[float, int]], totals: List[float]) -> Optional[Dict]:
+    """Side statistics from a sorted book and its running totals"""
+    if not keys:
+        return None
+    rate = (lambda key: key[0]) if offer_type == "SELL" else (lambda key: -key[0])
+    middle = len(keys) // 2
+    if len(keys) % 2:
+        median = rate(keys[middle])
+    else:
+        median = (rate(keys[middle - 1]) + rate(keys[middle])) / 2
+    volume, notional = totals
+    return _side_stats(len(keys), rate(keys[0]), median, volume, notional)
+
+
+def _close(a: Optional[float], b: Optional[float]) -> bool:
+    if a is None or b is None:
+        return a is b
+    return math.isclose(a, b, rel_tol=TOTALS_TOLERANCE, abs_tol=TOTALS_TOLERANCE)
+
+
+def market_differences(actual: Dict, expected: Dict) -> List[str]:
+    """Fields where two market() results disagree"""
+    problems = []
+    for offer_type in ("SELL", "BUY"):
+        got, want = actual[offer_type], expected[offer_type]
+        if (got is None) != (want is None):
+            problems.append(f"{offer_type}: {got} != {want}")
+            continue
+        for field in (want or {}):
+            if not _close(got[field], want[field]):
+                problems.append(f"{offer_type} {field}: {got[field]} != {want[field]}")
+    return problems
+
+
+class OrderBook:
+    """Active offers sorted by price per (city_id, offer_type)"""
+
+    def __init__(self):
+        self._books: Dict[Tuple[str, str], List[Tuple[float, int]]] = {}
+        self._offers: Dict[int, Dict] = {}
+        self._by_user: Dict[int, set] = {}
+        self._totals: Dict[Tuple[str, str], List[float]] = {}  # book -> [amount, amount * rate]
+        # book -> size cell -> sorted keys, the same offers as _books split by size band
+        self._cells: Dict[Tuple[str, str], Dict[Tuple[int, int], List[Tuple[float, int]]]] = {}
+        self._changes = 0  # bumped by every add/remove, so reconcile can tell the book moved
+        # Mutated from the DB worker threads, read from the event loop
+        self._lock = threading.RLock()
+
+    def __len__(self) -> int:
+        return len(self._offers)
+
+    def __contains__(self, offer_id: int) -> bool:
+        return offer_id in self._offers
+
+    def load(self, offers: Iterable[Dict]):
+        """Replace the book contents with the given active offers"""
+        with self._lock:
+            self._books.clear()
+            self._offers.clear()
+            self._by_user.clear()
+            self._totals.clear()
+            self._cells.clear()
+            for offer in offers:
+                self._add(offer)
+            for keys in self._books.values():
+                keys.sort()
+            for cells in self._cells.values():
+                for keys in cells.values():
+                    keys.sort()
+
+    def add(self, offer: Dict):
+        with self._lock:
+            if offer['offer_id'] in self._offers:
+                self._remove(offer['offer_id'])
+            key = sort_key(offer['offer_type'], offer['rate'], offer['offer_id'])
+            insort(self._books.setdefault(self._book_key(offer), []), key)
+            insort(self._cells.setdefault(self._book_key(offer), {}).setdefault(_size_cell(offer), []), key)
+            self._index(offer)
+
+    def remove(self, offer_id: int) -> Optional[Dict]:
+        with self._lock:
+            return self._remove(offer_id)
+
+    def remove_user(self, user_id: int) -> List[Dict]:
+        """Drop every offer owned by a user (e.g. when they are blocked)"""
+        with self._lock:
+            return [self._remove(offer_id) for offer_id in list(self._by_user.get(user_id, ()))]
+
+    def replace_user(self, user_id: int, offers: Iterable[Dict]):
+        """Swap a user's offers for freshly loaded copies (e.g. after their reputation changed)"""
+        with self._lock:
+            for offer_id in list(self._by_user.get(user_id, ())):
+                self._remove(offer_id)
+            for offer in offers:
+                self.add(offer)
+
+    def get(self, offer_id: int) -> Optional[Dict]:
+        offer = self._offers.get(offer_id)
+        return dict(offer) if offer else None
+
+    def page(self, city_id: str, offer_type: str, after: Optional[Tuple[float, int]] = None,
+             before: Optional[Tuple[float, int]] = None, limit: int = 5) -> Tuple[List[Dict], bool]:
+        """Get up to ``limit`` offers, best rate first, in O(log n + k).
+
+        ``after``/``before`` are (rate, offer_id) cursors of the last/first offer on the
+        current page. The flag tells whether another page exists in the direction of travel.
+        """
+        with self._lock:
+            keys = self._books.get((city_id, offer_type), [])
+            if before is not None:
+                end = bisect_left(keys, sort_key(offer_type, *before))
+                start = max(0, end - limit)
+                picked, has_more = keys[start:end], start > 0
+            else:
+                start = bisect_right(keys, sort_key(offer_type, *after)) if after is not None else 0
+                picked, has_more = keys[start:start + limit], start + limit < len(keys)
+            return [dict(self._offers[offer_id]) for _, offer_id in picked], has_more
+
+    def crossing(self, city_id: str, offer_type: str, rate: float, low: float, high: float,
+                 accept: Optional[Callable[[Dict], bool]] = None, limit: int = 3) -> List[Dict]:
+        """Best-priced ``offer_type`` offers that cross ``rate`` and can trade a size in [low, high].
+
+        A SELL crosses when its rate is at or below ``rate``, a BUY when at or above. The
+        crossing prefix of every size cell that may overlap [low, high] is found by bisect and
+        the cells are merged in price order; each offer gets an exact size check and
+        ``accept`` until ``limit`` were found. Offers whose size bands cannot overlap are
+        never inspected, nor are offers beyond the rate.
+        """
+        with self._lock:
+            bound = (sort_key(offer_type, rate, 0)[0], float("inf"))
+            lanes = [itertools.islice(keys, bisect_right(keys, bound))
+                     for cell, keys in self._cells.get((city_id, offer_type), {}).items()
+                     if _cell_may_overlap(cell, low, high)]
+            found = []
+            for _, offer_id in heapq.merge(*lanes):
+                offer = self._offers[offer_id]
+                offer_low, offer_high = tradable_range(offer)
+                if offer_low <= high and offer_high >= low and (accept is None or accept(offer)):
+                    found.append(dict(offer))
+                    if len(found) >= limit:
+                        break
+            return found
+
+    def market(self, city_id: str) -> Dict:
+        """Best, median and amount-weighted average rate per side plus the spread, in O(1)"""
+        with self._lock:
+            sides = {offer_type: _book_side(offer_type, self._books.get((city_id, offer_type)),
+                                            self._totals.get((city_id, offer_type)))
+                     for offer_type in ("SELL", "BUY")}
+        return _market(sides['SELL'], sides['BUY'])
+
+    def check_consistency(self, db_offers: Iterable[Dict]) -> List[str]:
+        """Compare the book with the active offers in the database.
+
+        Returns a list of human-readable discrepancies; an empty list means the book
+        matches the database and its internal indexes are sorted and complete. The lock is
+        only held to copy the book, so readers on the event loop are not held up.
+        """
+        expected = {offer['offer_id']: offer for offer in db_offers}
+        expected_markets = markets_from_offers(expected.values())
+        with self._lock:
+            offers = dict(self._offers)
+            books = {book_key: list(keys) for book_key, keys in self._books.items()}
+            totals = {book_key: list(values) for book_key, values in self._totals.items()}
+
+        problems = []
+        for offer_id in expected.keys() - offers.keys():
+            problems.append(f"offer {offer_id} is active in the DB but missing from the book")
+        for offer_id in offers.keys() - expected.keys():
+            problems.append(f"offer {offer_id} is in the book but not active in the DB")
+        for offer_id in expected.keys() & offers.keys():
+            db_offer, book_offer = expected[offer_id], offers[offer_id]
+            if self._book_key(db_offer) != self._book_key(book_offer) or db_offer['rate'] != book_offer['rate']:
+                problems.append(f"offer {offer_id} differs: book has {book_offer['rate']} "
+                                f"in {self._book_key(book_offer)}, DB has {db_offer['rate']} "
+                                f"in {self._book_key(db_offer)}")
+
+        indexed = 0
+        for (city_id, offer_type), keys in books.items():
+            if keys != sorted(keys):
+                problems.append(f"book {city_id}/{offer_type} is not sorted")
+            for _, offer_id in keys:
+                offer = offers.get(offer_id)
+                if offer is None or self._book_key(offer) != (city_id, offer_type):
+                    problems.append(f"book {city_id}/{offer_type} holds stale offer {offer_id}")
+            indexed += len(keys)
+        if indexed != len(offers):
+            problems.append(f"{indexed} sorted entries for {len(offers)} offers")
+
+        for city_id in expected_markets.keys() | {city_id for city_id, _ in books}:
+            actual = _market(*(_book_side(offer_type, books.get((city_id, offer_type)),
+                                          totals.get((city_id, offer_type)))
+                               for offer_type in ("SELL", "BUY")))
+            want = expected_markets.get(city_id) or _market(None, None)
+            for problem in market_differences(actual, want):
+                problems.append(f"market {city_id}: {problem}")
+        return problems
+
+    def reconcile(self, load: Callable[[], List[Dict]], attempts: int = 3) -> List[str]:
+        """Compare the book with ``load()``'s active offers and rebuild it from them on any mismatch.
+
+        ``load`` runs outside the lock. An offer committed to the database but not yet applied
+        to the book looks like drift for a moment, so a mismatch is checked again against a
+        fresh read, and the rebuild is skipped if the book changed while that read ran.
+        """
+        problems = self.check_consistency(load())
+        for _ in range(attempts):
+            if not problems:
+                return []
+            changes = self._changes
+            rows = load()
+            problems = self.check_consistency(rows)
+            with self._lock:
+                if problems and self._changes == changes:
+                    self.load(rows)
+                    return problems
+        return problems
+
+    @staticmethod
+    def _book_key(offer: Dict) -> Tuple[str, str]:
+        return offer['city_id'], offer['offer_type']
+
+    def _add(self, offer: Dict):
+        """Append without keeping order; callers sort afterwards"""
+        key = sort_key(offer['offer_type'], offer['rate'], offer['offer_id'])
+        self._books.setdefault(self._book_key(offer), []).append(key)
+        self._cells.setdefault(self._book_key(offer), {}).setdefault(_size_cell(offer), []).append(key)
+        self._index(offer)
+
+    def _index(self, offer: Dict):
+        self._changes += 1
+        self._offers[offer['offer_id']] = dict(offer)
+        self._by_user.setdefault(offer['user_id'], set()).add(offer['offer_id'])
+        totals = self._totals.setdefault(self._book_key(offer), [0.0, 0.0])
+        totals[0] += offer['amount']
+        totals[1] += offer['amount'] * offer['rate']
+
+    def _remove(self, offer_id: int) -> Optional[Dict]:
+        offer = self._offers.pop(offer_id, None)
+        if offer is None:
+            return None
+        self._changes += 1
+        book_key = self._book_key(offer)
+        keys = self._books.get(book_key, [])
+        key = sort_key(offer['offer_type'], offer['rate'], offer_id)
+        i = bisect_left(keys, key)
+        if i < len(keys) and keys[i] == key:
+            del keys[i]
+        cells, size_cell = self._cells.get(book_key, {}), _size_cell(offer)
+        cell = cells.get(size_cell, [])
+        i = bisect_left(cell, key)
+        if i < len(cell) and cell[i] == key:
+            del cell[i]
+            if not cell:
+                del cells[size_cell]
+        if not cells:
+            self._cells.pop(book_key, None)
+        if keys:
+            totals = self._totals[book_key]
+            totals[0] -= offer['amount']
+            totals[1] -= offer['amount'] * offer['rate']
+        else:
+            # Empty side: drop the totals and any rounding drift with them
+            self._books.pop(book_key, None)
+            self._totals.pop(book_key, None)
+        owned = self._by_user.get(offer['user_id'])
+        if owned is not None:
+            owned.discard(offer_id)
+            if not owned:
+                del self._by_user[offer['user_id']]
+        return offer
+
@@ -0,0 +1,206 @@
+# Conversation persistence for USDT-INR Exchange Bot
+#
+# Stores ConversationHandler states, user_data, chat_data and bot_data in the bot's SQLite
+# database so a restart does not drop users in the middle of registration or the offer
+# wizard. Values are stored as JSON in the ``persistence`` table (migration 7), so they must
+# be JSON types; anything else is refused and logged rather than stored as its str().
+#
+# * Only changed keys are written: every value is compared with what was last read or
+#   written, and unchanged user/chat data is skipped.
+# * Writes are coalesced: everything PTB hands over during one update_interval round goes to
+#   SQLite in a single transaction on a DB worker thread.
+# * user_data/chat_data are loaded lazily, the first time a user or chat sends an update
+#   after a restart (refresh_user_data/refresh_chat_data). Conversation states and bot_data
+#   are read at startup because ConversationHandler needs them before routing.
+
+import asyncio
+import json
+import logging
+from typing import Any, Dict, Optional, Tuple
+
+from telegram.ext import BasePersistence, PersistenceInput
+
+logger = logging.getLogger(__name__)
+
+USER, CHAT, BOT = "user", "chat", "bot"
+CONVERSATION = "conversation:"
+
+# Collect the writes PTB issues concurrently in one update_persistence round
+COALESCE_DELAY = 0.05
+
+
+def _dumps(value: Any) -> str:
+    """Canonical JSON for ``value``; raises TypeError for anything JSON cannot represent"""
+    return json.dumps(value, sort_keys=True, separators=(",", ":"))
+
+
+class SQLitePersistence(BasePersistence):
+    """PTB persistence on the bot's SQLite database with lazy loads and dirty-only writes"""
+
+    def __init__(self, db, update_interval: float = 60, store_data: Optional[PersistenceInput] = None):
+        super().__init__(
+            store_data=store_data or PersistenceInput(callback_data=False),
+            update_interval=update_interval,
+        )
+        self.db = db
+        self._written: Dict[Tuple[str, str], int] = {}  # (kind, key) -> hash of stored JSON
+        self._dirty: Dict[Tuple[str, str], Optional[str]] = {}  # None means delete
+        self._loads: Dict[Tuple[str, str], Any] = {}  # True once loaded, a future while loading
+        self._write_task: Optional[asyncio.Task] = None
+        self.rows_written = 0
+        self.rows_skipped = 0
+
+    # Storage (run on the DB worker threads)
+
+    def _load_row(self, kind: str, key: str) -> Optional[str]:
+        with self.db.pool.connection() as conn:
+            row = conn.execute(
+                "SELECT data FROM persistence WHERE kind = ? AND key = ?", (kind, key)
+            ).fetchone()
+        return row[0] if row else None
+
+    def _load_kind(self, kind: str) -> Dict[str, str]:
+        with self.db.pool.connection() as conn:
+            return dict(conn.execute("SELECT key, data FROM persistence WHERE kind = ?", (kind,)))
+
+    def _write_rows(self, rows: Dict[Tuple[str, str], Optional[str]]):
+        upserts = [(kind, key, data) for (kind, key), data in rows.items() if data is not None]
+        deletes = [(kind, key) for (kind, key), data in rows.items() if data is None]
+        with self.db.pool.connection() as conn:
+            conn.executemany('''
+                INSERT INTO persistence (kind, key, data, updated_date)
+                VALUES (?, ?, ?, datetime('now'))
+                ON CONFLICT (kind, key) DO UPDATE SET data = excluded.data, updated_date = excluded.updated_date
+            ''', upserts)
+            conn.executemany("DELETE FROM persistence WHERE kind = ? AND key = ?", deletes)
+            conn.commit()
+
+    # Dirty tracking
+
+    def _mark(self, kind: str, key: str, value: Any):
+        """Queue a write of ``value`` (None deletes) unless it matches the stored copy"""
+        row = (kind, key)
+        try:
+            data = None if value is None else _dumps(value)
+        except (TypeError, ValueError) as e:
+            # Keep the last good copy rather than one that would not load back the same
+            logger.error(f"Not persisting {kind} data {key}: {e}")
+            return
+        if data is not None and (hash(data) == self._written.get(row)
+                                 or (data == "{}" and row not in self._written)):
+            self.rows_skipped += 1
+            self._dirty.pop(row, None)
+            return
+        if data is None and row not in self._written and row not in self._dirty:
+            return
+        self._dirty[row] = data
+        if self._write_task is None or self._write_task.done():
+            self._write_task = asyncio.create_task(self._write_soon())
+
+    async def _write_soon(self):
+        await asyncio.sleep(COALESCE_DELAY)
+        await self._write_dirty()
+
+    async def _write_dirty(self):
+        if not self._dirty:
+            return
+        rows, self._dirty = self._dirty, {}
+        try:
+            await self.db.run(self._write_rows, rows)
+        except Exception:
+            logger.exception(f"Failed to persist {len(rows)} conversation rows; will retry")
+            for row, data in rows.items():
+                self._dirty.setdefault(row, data)
+            return
+        for row, data in rows.items():
+            if data is None:
+                self._written.pop(row, None)
+            else:
+                self._written[row] = hash(data)
+        self.rows_written += len(rows)
+
+    async def _lazy_load(self, kind: str, key: str, target: Dict):
+        """Merge the stored data for ``key`` into ``target`` the first time it is seen"""
+        row = (kind, key)
+        state = self._loads.get(row)
+        if state is True:
+            return
+        if state is not None:
+            # Another update for the same user/chat is already loading it
+            await state
+            return
+        future = self._loads[row] = asyncio.get_running_loop().create_future()
+        try:
+            data = await self.db.run(self._load_row, kind, key)
+            if data is not None:
+                self._written[row] = hash(data)
+                for name, value in json.loads(data).items():
+                    target.setdefault(name, value)
+        finally:
+            self._loads[row] = True
+            future.set_result(None)
+
+    # BasePersistence: loading
+
+    async def get_user_data(self) -> Dict[int, Dict[Any, Any]]:
+        return {}  # loaded per user by refresh_user_data
+
+    async def get_chat_data(self) -> Dict[int, Dict[Any, Any]]:
+        return {}  # loaded per chat by refresh_chat_data
+
+    async def get_bot_data(self) -> Dict[Any, Any]:
+        data = await self.db.run(self._load_row, BOT, "")
+        if data is None:
+            return {}
+        self._written[(BOT, "")] = hash(data)
+        return json.loads(data)
+
+    async def get_callback_data(self) -> None:
+        return None
+
+    async def get_conversations(self, name: str) -> Dict:
+        rows = await self.db.run(self._load_kind, CONVERSATION + name)
+        conversations = {}
+        for key, data in rows.items():
+            self._written[(CONVERSATION + name, key)] = hash(data)
+            conversations[tuple(json.loads(key))] = json.loads(data)
+        logger.info(f"Restored {len(conversations)} '{name}' conversations")
+        return conversations
+
+    async def refresh_user_data(self, user_id: int, user_data: Dict[Any, Any]):
+        await self._lazy_load(USER, str(user_id), user_data)
+
+    async def refresh_chat_data(self, chat_id: int, chat_data: Dict[Any, Any]):
+        await self._lazy_load(CHAT, str(chat_id), chat_data)
+
+    async def refresh_bot_data(self, bot_data: Dict[Any, Any]):
+        pass
+
+    # BasePersistence: saving
+
+    async def update_user_data(self, user_id: int, data: Dict[Any, Any]):
+        self._mark(USER, str(user_id), data)
+
+    async def update_chat_data(self, chat_id: int, data: Dict[Any, Any]):
+        self._mark(CHAT, str(chat_id), data)
+
+    async def update_bot_data(self, data: Dict[Any, Any]):
+        self._mark(BOT, "", data)
+
+    async def update_callback_data(self, data) -> None:
+        pass
+
+    async def update_conversation(self, name: str, key: Tuple[int, ...], new_state: Optional[object]):
+        self._mark(CONVERSATION + name, _dumps(list(key)), new_state)
+
+    async def drop_user_data(self, user_id: int):
+        self._mark(USER, str(user_id), None)
+
+    async def drop_chat_data(self, chat_id: int):
+        self._mark(CHAT, str(chat_id), None)
+
+    async def flush(self):
+        if self._write_task is not None and not self._write_task.done():
+            await self._write_task
+        await self._write_dirty()
+        logger.info(f"Persistence flushed: {self.rows_written} rows written, {self.rows_skipped} unchanged skipped")
@@ -0,0 +1,166 @@
+# Price alerts for USDT-INR Exchange Bot
+#
+# "/alert mumbai sell below 88.0" asks to be told about new SELL offers in Mumbai at ₹88.0 or
+# less. Alerts live in the price_alerts table (migration 12); the active ones are also kept in
+# memory as sorted (threshold, alert_id) arrays per (city_id, offer_type, direction). For an
+# offer at rate r the BELOW alerts it triggers are the suffix with threshold >= r and the ABOVE
+# alerts the prefix with threshold <= r, so both are found by bisection in O(log n + matches).
+#
+# Notifications are deduplicated (one message per user per offer, and a repost at the same
+# rate within ALERT_DEDUP_WINDOW is not announced again) and rate limited per user with a
+# token bucket. Expired alerts are skipped on sight and deleted by a periodic job.
+
+import html
+import logging
+import threading
+from bisect import bisect_left, bisect_right, insort
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from config import (
+    ALERT_NOTIFY_BURST, ALERT_NOTIFY_PER_HOUR, ALERT_DEDUP_WINDOW, ALERT_PRUNE_INTERVAL
+)
+from cache import LRUCache
+from cities import gazetteer
+from expiry import utc_timestamp
+from rendering import build_offer_card
+from send_queue import BULK, TokenBucket
+
+logger = logging.getLogger(__name__)
+
+BELOW, ABOVE = "BELOW", "ABOVE"
+
+
+def describe_alert(alert: Dict) -> str:
+    return (f"{gazetteer.display_name(alert['city_id'])} {alert['offer_type']} "
+            f"{alert['direction'].lower()} ₹{alert['threshold']:g}")
+
+
+class AlertIndex:
+    """Active price alerts as sorted threshold arrays per (city_id, offer_type, direction)"""
+
+    def __init__(self):
+        self._thresholds: Dict[Tuple[str, str, str], List[Tuple[float, int]]] = {}
+        self._alerts: Dict[int, Dict] = {}
+        # Mutated from the DB worker threads, read from the event loop
+        self._lock = threading.RLock()
+
+    def __len__(self) -> int:
+        return len(self._alerts)
+
+    @staticmethod
+    def _key(alert: Dict) -> Tuple[str, str, str]:
+        return alert['city_id'], alert['offer_type'], alert['direction']
+
+    def load(self, alerts: Iterable[Dict]):
+        with self._lock:
+            self._thresholds.clear()
+            self._alerts.clear()
+            for alert in alerts:
+                self._alerts[alert['alert_id']] = dict(alert)
+                self._thresholds.setdefault(self._key(alert), []).append((alert['threshold'], alert['alert_id']))
+            for keys in self._thresholds.values():
+                keys.sort()
+
+    def add(self, alert: Dict):
+        with self._lock:
+            self._remove(alert['alert_id'])
+            self._alerts[alert['alert_id']] = dict(alert)
+            insort(self._thresholds.setdefault(self._key(alert), []), (alert['threshold'], alert['alert_id']))
+
+    def remove(self, alert_id: int) -> Optional[Dict]:
+        with self._lock:
+            return self._remove(alert_id)
+
+    def _remove(self, alert_id: int) -> Optional[Dict]:
+        alert = self._alerts.pop(alert_id, None)
+        if alert is None:
+            return None
+        key = self._key(alert)
+        keys = self._thresholds.get(key, [])
+        i = bisect_left(keys, (alert['threshold'], alert_id))
+        if i < len(keys) and keys[i] == (alert['threshold'], alert_id):
+            del keys[i]
+        if not keys:
+            self._thresholds.pop(key, None)
+        return alert
+
+    def triggered(self, city_id: str, offer_type: str, rate: float, now: Optional[str] = None) -> List[Dict]:
+        """Unexpired alerts an offer at ``rate`` satisfies"""
+        now = now or utc_timestamp()
+        hits = []
+        with self._lock:
+            below = self._thresholds.get((city_id, offer_type, BELOW), [])
+            above = self._thresholds.get((city_id, offer_type, ABOVE), [])
+            for keys, indexes in ((below, range(bisect_left(below, (rate,)), len(below))),
+                                  (above, range(bisect_right(above, (rate, float("inf")))))):
+                for i in indexes:
+                    alert = self._alerts[keys[i][1]]
+                    if alert['expiry_date'] > now:
+                        hits.append(dict(alert))
+        return hits
+
+
+class PriceAlertNotifier:
+    """Tells subscribers about new offers that cross their thresholds"""
+
+    def __init__(self, db, outbox, cards=None, burst: int = ALERT_NOTIFY_BURST,
+                 per_hour: float = ALERT_NOTIFY_PER_HOUR, dedup_window: float = ALERT_DEDUP_WINDOW):
+        self.db = db
+        self.outbox = outbox
+        self.cards = cards
+        self.burst = burst
+        self.rate = per_hour / 3600
+        self._buckets: Dict[int, TokenBucket] = {}
+        # (subscriber, offer owner, side, rate) recently announced
+        self._recent = LRUCache(maxsize=100_000, ttl=dedup_window)
+        self.sent = 0
+        self.duplicates = 0
+        self.rate_limited = 0
+
+    def offer_posted(self, offer: Dict):
+        """Queue alert messages for a newly created offer"""
+        alerts = self.db.alert_index.triggered(offer['city_id'], offer['offer_type'], offer['rate'])
+        by_user: Dict[int, List[Dict]] = {}
+        for alert in alerts:
+            if alert['user_id'] != offer['user_id']:
+                by_user.setdefault(alert['user_id'], []).append(alert)
+        if not by_user:
+            return
+
+        card = self.cards.get(offer) if self.cards is not None else build_offer_card(offer)
+        for user_id, user_alerts in by_user.items():
+            recent_key = (user_id, offer['user_id'], offer['offer_type'], offer['rate'])
+            if self._recent.get(recent_key) is not None:
+                self.duplicates += 1
+                continue
+            bucket = self._buckets.get(user_id)
+            if bucket is None:
+                bucket = self._buckets[user_id] = TokenBucket(self.rate, self.burst)
+            if bucket.delay() > 0:
+                self.rate_limited += 1
+                continue
+            bucket.consume()
+            self._recent.set(recent_key, True)
+            matched = ", ".join(html.escape(describe_alert(alert)) for alert in user_alerts)
+            self.outbox.send_message(
+                user_id, f"🔔 <b>Price alert</b> ({matched})\n\n{card.text}", BULK,
+                parse_mode='HTML', reply_markup=card.reply_markup
+            )
+            self.sent += 1
+        logger.info(f"Offer {offer['offer_id']} triggered {len(alerts)} price alerts")
+
+    def schedule(self, job_queue, interval: float = ALERT_PRUNE_INTERVAL):
+        job_queue.run_repeating(self.prune, interval=interval, first=interval, name="price_alert_expiry")
+
+    async def prune(self, context=None):
+        """Delete expired alerts and forget idle users' full token buckets"""
+        removed = await self.db.run(self.db.delete_expired_alerts)
+        for user_id, bucket in list(self._buckets.items()):
+            if bucket.delay() == 0 and bucket.tokens >= bucket.capacity:
+                del self._buckets[user_id]
+        if removed:
+            logger.info(f"Removed {removed} expired price alerts")
+
+    def stats(self) -> Dict:
+        return {'alerts': len(self.db.alert_index), 'sent': self.sent,
+                'duplicates': self.duplicates, 'rate_limited': self.rate_limited}
@@ -0,0 +1,377 @@
+# Historical rates for USDT-INR Exchange Bot
+#
+# Offers expire and get blocked, taking their prices with them, so every posted offer and
+# completed trade is also recorded in a time series per city:
+#
+#   <RATE_HISTORY_DIR>/<city_id>/<series>-<resolution>.ohlc
+#
+# where series is SELL or BUY (offer rates) or TRADE (completed trade prices) and
+# resolution is 1m, 1h or 1d. Each file is a small header followed by fixed-width records
+# (bucket start, open, high, low, close, volume, count, oldest and newest event) in time order. Every
+# event updates the current bucket of all three resolutions in place or appends a new one,
+# and reads binary-search the memory-mapped file and unpack just the requested slice. Each
+# open series holds a file and a map (two descriptors), so only the RATE_HISTORY_MAX_OPEN
+# most recently used series stay open; older ones are flushed and closed.
+#
+# Events recorded after commit by several DB workers can arrive slightly out of order. A
+# late event still lands in its bucket at every resolution (a bucket it missed is inserted),
+# moves a bucket's open if it is older than the event that set it, and its close only if it
+# is not older than the event that set that.
+#
+# Because coarser series already aggregate the finer ones, retention simply trims 1m and
+# 1h records older than RATE_HISTORY_RETENTION_DAYS; their data lives on in 1h/1d.
+#
+#   python rate_history.py backfill              # rebuild from the offers/transactions tables
+#   python rate_history.py show mumbai --days 30 # daily SELL rates for the last 30 days
+
+import argparse
+import calendar
+import logging
+import mmap
+import os
+import re
+import shutil
+import sqlite3
+import struct
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from config import DATABASE_PATH, RATE_HISTORY_DIR, RATE_HISTORY_MAX_OPEN, RATE_HISTORY_RETENTION_DAYS
+from expiry import SQLITE_TIMESTAMP
+
+logger = logging.getLogger(__name__)
+
+RESOLUTIONS = {'1m': 60, '1h': 3600, '1d': 86400}
+SERIES = ("SELL", "BUY", "TRADE")
+
+HEADER = struct.Struct("<4sHHQ")  # magic, format version, record size, record count
+MAGIC, FORMAT_VERSION = b"OHLC", 2
+RECORD = struct.Struct("<qdddddIII")  # start, open, high, low, close, volume, count, oldest and newest event
+GROW_RECORDS = 1024  # file growth step
+
+
+class Candle(NamedTuple):
+    start: int  # bucket start, unix seconds UTC
+    open: float
+    high: float
+    low: float
+    close: float
+    volume: float
+    count: int
+    oldest: int = 0  # seconds after ``start`` of the event that set ``open``
+    newest: int = 0  # seconds after ``start`` of the event that set ``close``
+
+
+def parse_timestamp(value: str) -> int:
+    """Unix seconds for a SQLite UTC timestamp string"""
+    return calendar.timegm(time.strptime(value[:19], SQLITE_TIMESTAMP))
+
+
+def merge(candle: Candle, at: int, price: float, volume: float) -> Candle:
+    offset = at - candle.start
+    open_, oldest = (price, offset) if offset < candle.oldest else (candle.open, candle.oldest)
+    close, newest = (price, offset) if offset >= candle.newest else (candle.close, candle.newest)
+    return Candle(candle.start, open_, max(candle.high, price), min(candle.low, price), close,
+                  candle.volume + volume, candle.count + 1, oldest, newest)
+
+
+class OHLCSeries:
+    """One memory-mapped file of fixed-width OHLC records in bucket order"""
+
+    def __init__(self, path: str, bucket_seconds: int):
+        self.path = path
+        self.bucket_seconds = bucket_seconds
+        self.late = 0  # events that arrived after a later bucket was started
+        if not os.path.exists(path):
+            with open(path, "wb") as f:
+                f.write(HEADER.pack(MAGIC, FORMAT_VERSION, RECORD.size, 0))
+                f.write(b"\0" * RECORD.size * GROW_RECORDS)
+        self._file = open(path, "r+b")
+        self._mm = mmap.mmap(self._file.fileno(), 0)
+        magic, version, record_size, self.count = HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC or version != FORMAT_VERSION or record_size != RECORD.size:
+            raise ValueError(f"{path} is not a rate history file")
+
+    def __len__(self) -> int:
+        return self.count
+
+    def _offset(self, index: int) -> int:
+        return HEADER.size + index * RECORD.size
+
+    def _read(self, index: int) -> Candle:
+        return Candle._make(RECORD.unpack_from(self._mm, self._offset(index)))
+
+    def _write(self, index: int, candle: Candle):
+        RECORD.pack_into(self._mm, self._offset(index), *candle)
+
+    def _set_count(self, count: int):
+        self.count = count
+        HEADER.pack_into(self._mm, 0, MAGIC, FORMAT_VERSION, RECORD.size, count)
+
+    def _start_at(self, index: int) -> int:
+        return struct.unpack_from("<q", self._mm, self._offset(index))[0]
+
+    def _search(self, start: int) -> int:
+        """Index of the first record with bucket start >= ``start``"""
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._start_at(mid) < start:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def add(self, at: int, price: float, volume: float):
+        """Fold one observation into its bucket"""
+        start = at - at % self.bucket_seconds
+        last = self.count - 1
+        if last >= 0 and self._start_at(last) >= start:
+            if self._start_at(last) == start:
+                index = last
+            else:
+                index = self._search(start)
+                self.late += 1
+            if self._start_at(index) == start:
+                self._write(index, merge(self._read(index), at, price, volume))
+            else:
+                self._insert(index, Candle(start, price, price, price, price, volume, 1, at - start, at - start))
+            return
+        self._insert(self.count, Candle(start, price, price, price, price, volume, 1, at - start, at - start))
+
+    def _insert(self, index: int, candle: Candle):
+        if self._offset(self.count + 1) > len(self._mm):
+            self._mm.resize(self._offset(self.count + GROW_RECORDS))
+        if index < self.count:
+            # Only late events get here, and their bucket is near the end
+            self._mm.move(self._offset(index + 1), self._offset(index), (self.count - index) * RECORD.size)
+        self._write(index, candle)
+        self._set_count(self.count + 1)
+
+    def range(self, start: int, end: int) -> List[Candle]:
+        """Buckets starting in [start, end), unpacked from one slice of the map"""
+        first, stop = self._search(start), self._search(end)
+        view = memoryview(self._mm)[self._offset(first):self._offset(stop)]
+        try:
+            return [Candle._make(values) for values in RECORD.iter_unpack(view)]
+        finally:
+            view.release()
+
+    def last(self, n: int) -> List[Candle]:
+        return [self._read(i) for i in range(max(0, self.count - n), self.count)]
+
+    def trim_before(self, start: int) -> int:
+        """Drop buckets starting before ``start``; returns how many were dropped"""
+        drop = self._search(start)
+        if drop:
+            keep = self.count - drop
+            self._mm.move(self._offset(0), self._offset(drop), keep * RECORD.size)
+            self._set_count(keep)
+            # Give back the space beyond one growth step
+            if len(self._mm) > self._offset(keep + 2 * GROW_RECORDS):
+                self._mm.resize(self._offset(keep + GROW_RECORDS))
+        return drop
+
+    def flush(self):
+        self._mm.flush()
+
+    def close(self):
+        self._mm.flush()
+        self._mm.close()
+        self._file.close()
+
+
+def _safe_name(city_id: str) -> str:
+    return re.sub(r"[^a-z0-9_-]", "_", city_id.lower()) or "_"
+
+
+class RateHistory:
+    """Per-city SELL/BUY/TRADE rate series at 1m, 1h and 1d resolution"""
+
+    def __init__(self, directory: str = RATE_HISTORY_DIR,
+                 retention_days: Optional[Dict[str, Optional[float]]] = None, max_open: int = RATE_HISTORY_MAX_OPEN):
+        self.directory = directory
+        self.retention_days = RATE_HISTORY_RETENTION_DAYS if retention_days is None else retention_days
+        self.max_open = max_open
+        # Open series, least recently used first
+        self._series: "OrderedDict[Tuple[str, str, str], OHLCSeries]" = OrderedDict()
+        # Offers and trades are recorded from the DB worker threads
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def _get(self, city_id: str, series: str, resolution: str, create: bool = True) -> Optional[OHLCSeries]:
+        """Open series for a city, opening it (and closing the least recently used) if needed; hold the lock"""
+        key = (_safe_name(city_id), series, resolution)
+        found = self._series.get(key)
+        if found is not None:
+            self._series.move_to_end(key)
+            return found
+        folder = os.path.join(self.directory, key[0])
+        path = os.path.join(folder, f"{series}-{resolution}.ohlc")
+        if not create and not os.path.exists(path):
+            return None
+        os.makedirs(folder, exist_ok=True)
+        found = self._series[key] = OHLCSeries(path, RESOLUTIONS[resolution])
+        while len(self._series) > self.max_open:
+            _, evicted = self._series.popitem(last=False)
+            evicted.close()
+        return found
+
+    def record(self, city_id: str, series: str, price: float, volume: float, at: Optional[int] = None):
+        at = int(time.time()) if at is None else at
+        with self._lock:
+            for resolution in RESOLUTIONS:
+                self._get(city_id, series, resolution).add(at, price, volume)
+
+    def record_offer(self, offer: Dict):
+        at = parse_timestamp(offer['created_date']) if offer.get('created_date') else None
+        self.record(offer['city_id'], offer['offer_type'], offer['rate'], offer['amount'], at)
+
+    def record_trade(self, city_id: str, rate: float, amount: float, completed_date: Optional[str] = None):
+        self.record(city_id, "TRADE", rate, amount, parse_timestamp(completed_date) if completed_date else None)
+
+    def history(self, city_id: str, series: str = "SELL", resolution: str = '1d', start: Optional[int] = None,
+                end: Optional[int] = None) -> List[Candle]:
+        """Buckets in [start, end); defaults to the last 30 buckets up to now"""
+        end = int(time.time()) + 1 if end is None else end
+        start = end - 30 * RESOLUTIONS[resolution] if start is None else start
+        with self._lock:
+            found = self._get(city_id, series, resolution, create=False)
+            return found.range(start, end) if found else []
+
+    def apply_retention(self, now: Optional[int] = None) -> int:
+        """Trim fine-grained buckets past their retention; coarser series keep the data.
+
+        Every series on disk is visited, so cities without recent events are trimmed too.
+        """
+        now = int(time.time()) if now is None else now
+        trimmed = 0
+        for city, series, resolution in self._on_disk():
+            days = self.retention_days.get(resolution)
+            if days:
+                with self._lock:
+                    trimmed += self._get(city, series, resolution).trim_before(now - int(days * 86400))
+        self.flush()
+        return trimmed
+
+    def flush(self):
+        with self._lock:
+            for found in self._series.values():
+                found.flush()
+
+    def close(self):
+        with self._lock:
+            for found in self._series.values():
+                found.close()
+            self._series.clear()
+
+    def _on_disk(self) -> List[Tuple[str, str, str]]:
+        """(city, series, resolution) of every series file in the store"""
+        found = []
+        for city in sorted(os.listdir(self.directory)):
+            folder = os.path.join(self.directory, city)
+            for name in sorted(os.listdir(folder)) if os.path.isdir(folder) else ():
+                match = re.fullmatch(r"(SELL|BUY|TRADE)-(1m|1h|1d)\.ohlc", name)
+                if match:
+                    found.append((city, match.group(1), match.group(2)))
+        return found
+
+
+def _batches(cursor: sqlite3.Cursor, size: int = 1000) -> Iterable[tuple]:
+    while True:
+        rows = cursor.fetchmany(size)
+        if not rows:
+            return
+        yield from rows
+
+
+def backfill(conn: sqlite3.Connection, directory: str = RATE_HISTORY_DIR) -> Tuple[int, int]:
+    """Rebuild the store from scratch by streaming offers and completed trades in time order.
+
+    The new store is built in a temporary directory next to ``directory`` and swapped in
+    when complete, so an interrupted backfill leaves no half-built store behind.
+    """
+    parent, name = os.path.split(os.path.abspath(directory))
+    os.makedirs(parent, exist_ok=True)
+    # Left over by a backfill that was killed
+    for leftover in os.listdir(parent):
+        if leftover.startswith((f".{name}-backfill-", f".{name}-old-")):
+            shutil.rmtree(os.path.join(parent, leftover), ignore_errors=True)
+    building = tempfile.mkdtemp(prefix=f".{name}-backfill-", dir=parent)
+    try:
+        offers, trades = _fill(conn, building)
+    except BaseException:
+        shutil.rmtree(building, ignore_errors=True)
+        raise
+    if os.path.isdir(directory):
+        retired = tempfile.mkdtemp(prefix=f".{name}-old-", dir=parent)
+        os.replace(directory, os.path.join(retired, "store"))
+        os.replace(building, directory)
+        shutil.rmtree(retired, ignore_errors=True)
+    else:
+        os.replace(building, directory)
+    return offers, trades
+
+
+def _fill(conn: sqlite3.Connection, directory: str) -> Tuple[int, int]:
+    history = RateHistory(directory, retention_days={})
+    offers = 0
+    for city_id, offer_type, rate, amount, created in _batches(conn.execute('''
+            SELECT city_id, offer_type, rate, amount, created_date FROM offers
+            WHERE city_id IS NOT NULL ORDER BY created_date, offer_id
+    ''')):
+        history.record(city_id, offer_type, rate, amount, parse_timestamp(created))
+        offers += 1
+    trades = 0
+    for city_id, rate, amount, completed in _batches(conn.execute('''
+            SELECT o.city_id, t.rate, t.amount, COALESCE(t.completed_date, t.created_date) AS at
+            FROM transactions t JOIN offers o ON o.offer_id = t.offer_id
+            WHERE t.status = 'COMPLETED' AND o.city_id IS NOT NULL
+            ORDER BY at, t.transaction_id
+    ''')):
+        history.record_trade(city_id, rate, amount, completed)
+        trades += 1
+    # Apply the normal retention once everything is in
+    history.retention_days = RATE_HISTORY_RETENTION_DAYS
+    history.apply_retention()
+    history.close()
+    return offers, trades
+
+
+if __name__ == "__main__":
+    from cities import gazetteer
+
+    parser = argparse.ArgumentParser(description="Rate history store")
+    parser.add_argument("--dir", default=RATE_HISTORY_DIR, help="rate history directory")
+    commands = parser.add_subparsers(dest="command", required=True)
+    fill = commands.add_parser("backfill", help="rebuild the store from the database")
+    fill.add_argument("--db", default=DATABASE_PATH, help="SQLite database path")
+    show = commands.add_parser("show", help="print a city's rate history")
+    show.add_argument("city")
+    show.add_argument("--series", choices=SERIES, default="SELL")
+    show.add_argument("--resolution", choices=list(RESOLUTIONS), default='1d')
+    show.add_argument("--days", type=float, default=30)
+    args = parser.parse_args()
+
+    if args.command == "backfill":
+        conn = sqlite3.connect(args.db)
+        try:
+            offers, trades = backfill(conn, args.dir)
+        finally:
+            conn.close()
+        print(f"Backfilled {offers} offers and {trades} trades into {args.dir}")
+    else:
+        history = RateHistory(args.dir)
+        now = int(time.time())
+        candles = history.history(gazetteer.city_id_for(args.city), args.series, args.resolution,
+                                  now - int(args.days * 86400), now + 1)
+        for c in candles:
+            print(f"{time.strftime(SQLITE_TIMESTAMP, time.gmtime(c.start))}  open {c.open:8.2f}  "
+                  f"high {c.high:8.2f}  low {c.low:8.2f}  close {c.close:8.2f}  "
+                  f"volume {c.volume:12,.2f}  n={c.count}")
+        if not candles:
+            print("No history for that city and period")
+        history.close()
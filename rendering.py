@@ -0,0 +1,185 @@
+# Message rendering for USDT-INR Exchange Bot
+#
+# A browse page is one HTML message listing several offers, with one inline keyboard row per
+# offer for contacting its owner plus the paging controls. Paging and refreshing edit that
+# message in place instead of sending a new card per offer.
+#
+# The HTML for each offer is built once per offer version and kept in a memory-bounded LRU
+# cache, so showing a popular offer again is a dict lookup. offers.version is bumped by
+# triggers whenever the offer or its owner's name/reputation changes (migration 6), which
+# makes stale cards unreachable; they simply age out of the cache.
+
+import html
+import re
+import sys
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+from telegram.constants import MessageLimit
+
+from cache import LRUCache
+from cities import gazetteer
+
+MAX_MESSAGE_LENGTH = MessageLimit.MAX_TEXT_LENGTH
+BUTTON_LABEL_LENGTH = 40
+# Rough footprint of the tuple, keyboard and button objects of one cached card
+CARD_OVERHEAD_BYTES = 1200
+
+
+def encode_offer_cursor(offer: Dict) -> str:
+    """Pack an offer's order book position (side, rate, offer_id) into compact callback data"""
+    return f"{offer['offer_type']}_{offer['rate']!r}_{offer['offer_id']}"
+
+
+def decode_offer_cursor(token: str) -> Optional[Tuple[str, float, int]]:
+    """Inverse of encode_offer_cursor; returns None for malformed data"""
+    match = re.fullmatch(r"(SELL|BUY)_([0-9.e+-]+)_(\d+)", token)
+    if not match:
+        return None
+    try:
+        return match.group(1), float(match.group(2)), int(match.group(3))
+    except ValueError:
+        return None
+
+
+def reputation_label(offer: Dict) -> str:
+    try:
+        return f"⭐{float(offer['reputation_score']):.1f}"
+    except (TypeError, ValueError):
+        return str(offer['reputation_score'])
+
+
+class OfferCard(NamedTuple):
+    """Pre-rendered views of one offer version"""
+    text: str  # standalone card
+    reply_markup: InlineKeyboardMarkup  # its contact button
+    block: str  # entry on a browse page, shown after its position number
+    button_label: str  # contact button label on a browse page, after its position number
+
+
+def build_offer_card(offer: Dict) -> OfferCard:
+    action = "Selling" if offer['offer_type'] == "SELL" else "Buying"
+    emoji = "💰" if offer['offer_type'] == "SELL" else "🔄"
+    username = html.escape(str(offer['username']))
+    city = html.escape(gazetteer.display_name(offer['city']))
+    rep_str = reputation_label(offer)
+    text = (
+        f"{emoji} <b>{action} {offer['amount']} USDT</b>\n"
+        f"Rate: ₹{offer['rate']} per USDT\n"
+        f"Range: {offer['min_order']}-{offer['max_order']} USDT\n"
+        f"By: @{username} ({rep_str})\n"
+        f"Location: {city}\n"
+        f"Offer ID: #{offer['offer_id']}\n"
+    )
+    reply_markup = InlineKeyboardMarkup([[
+        InlineKeyboardButton("💬 Contact User", callback_data=f"contact_{offer['user_id']}")
+    ]])
+    block = (
+        f"<b>₹{offer['rate']}</b> · {offer['amount']} USDT "
+        f"(limits {offer['min_order']}-{offer['max_order']})\n"
+        f"   @{username} {rep_str} · {city} · #{offer['offer_id']}\n"
+    )
+    return OfferCard(text, reply_markup, block, f"@{offer['username']} · ₹{offer['rate']}")
+
+
+def _card_weight(card: OfferCard) -> int:
+    return (sys.getsizeof(card.text) + sys.getsizeof(card.block) + sys.getsizeof(card.button_label)
+            + CARD_OVERHEAD_BYTES)
+
+
+class OfferCardCache:
+    """Rendered offer cards keyed by (offer_id, version), bounded by approximate memory use"""
+
+    def __init__(self, max_bytes: int = 8 * 1024 * 1024):
+        self._cache = LRUCache(maxsize=sys.maxsize, maxweight=max_bytes, weigher=_card_weight)
+
+    def __len__(self) -> int:
+        return len(self._cache)
+
+    def get(self, offer: Dict) -> OfferCard:
+        key = (offer['offer_id'], offer.get('version', 0))
+        card = self._cache.get(key)
+        if card is None:
+            card = build_offer_card(offer)
+            self._cache.set(key, card)
+        return card
+
+    def stats(self) -> Dict:
+        return self._cache.stats()
+
+
+def render_offer_block(offer: Dict, index: int, cards: Optional[OfferCardCache] = None) -> str:
+    """Compact HTML for one offer inside a browse page"""
+    card = cards.get(offer) if cards is not None else build_offer_card(offer)
+    return f"<b>{index}.</b> {card.block}"
+
+
+def _contact_button(offer: Dict, index: int, cards: Optional[OfferCardCache]) -> InlineKeyboardButton:
+    card = cards.get(offer) if cards is not None else build_offer_card(offer)
+    label = f"💬 {index}. {card.button_label}"
+    if len(label) > BUTTON_LABEL_LENGTH:
+        label = label[:BUTTON_LABEL_LENGTH - 1] + "…"
+    return InlineKeyboardButton(label, callback_data=f"contact_{offer['user_id']}")
+
+
+def render_browse_page(city_name: str, offer_type: str, offers: List[Dict], has_next: bool, has_prev: bool,
+                       cards: Optional[OfferCardCache] = None) -> Tuple[str, InlineKeyboardMarkup, List[Dict]]:
+    """Render a page of offers as one message.
+
+    Returns the HTML text, its keyboard and the offers that fit under Telegram's length limit;
+    paging cursors are taken from the rendered offers so nothing is skipped.
+    """
+    side = "Selling USDT, cheapest first" if offer_type == "SELL" else "Buying USDT, highest rate first"
+    header = f"🔍 <b>Offers in {html.escape(city_name)}</b>\n{side}:\n\n"
+    footer = "\nTap an offer below to contact the trader, then /trade &lt;offer ID&gt; &lt;amount&gt; to record the deal."
+
+    text = header
+    rendered = []
+    for offer in offers:
+        block = render_offer_block(offer, len(rendered) + 1, cards)
+        if len(text) + len(block) + len(footer) > MAX_MESSAGE_LENGTH:
+            has_next = True
+            break
+        text += block + "\n"
+        rendered.append(offer)
+    text = text.rstrip("\n") + "\n" + footer
+
+    keyboard = [[_contact_button(offer, i, cards)] for i, offer in enumerate(rendered, 1)]
+    nav = []
+    if has_prev and rendered:
+        nav.append(InlineKeyboardButton("◀ Prev", callback_data=f"browse_prev_{encode_offer_cursor(rendered[0])}"))
+    if has_next and rendered:
+        nav.append(InlineKeyboardButton("Next ▶", callback_data=f"browse_next_{encode_offer_cursor(rendered[-1])}"))
+    if nav:
+        keyboard.append(nav)
+    other = "BUY" if offer_type == "SELL" else "SELL"
+    keyboard.append([
+        InlineKeyboardButton("♻️ Refresh", callback_data=f"browse_side_{offer_type}"),
+        InlineKeyboardButton("🔄 Show buyers" if other == "BUY" else "💰 Show sellers",
+                             callback_data=f"browse_side_{other}"),
+    ])
+    return text, InlineKeyboardMarkup(keyboard), rendered
+
+
+def _side_line(label: str, side: Optional[Dict]) -> str:
+    if side is None:
+        return f"<b>{label}</b>: no offers"
+    # Offers with no amount left give a side without a weighted average
+    average = f" · avg ₹{side['weighted_average']:.2f}" if side['weighted_average'] is not None else ""
+    return (
+        f"<b>{label}</b>: best ₹{side['best']:.2f} · median ₹{side['median']:.2f}{average}\n"
+        f"   {side['count']} offer{'s' if side['count'] != 1 else ''}, {side['volume']:,.0f} USDT"
+    )
+
+
+def render_market(city_name: str, market: Dict) -> str:
+    """HTML summary of OrderBook.market() for /rates"""
+    lines = [
+        f"📊 <b>USDT market in {html.escape(city_name)}</b>\n",
+        _side_line("Sellers (ask)", market['SELL']),
+        _side_line("Buyers (bid)", market['BUY']),
+    ]
+    if market['spread'] is not None:
+        lines.append(f"\nSpread: ₹{market['spread']:.2f} ({market['spread_percent']:.2f}%)")
+    lines.append("\n<i>avg is weighted by offer amount</i>")
+    return "\n".join(lines)
@@ -0,0 +1,189 @@
+# Reputation engine for USDT-INR Exchange Bot
+#
+# Every user keeps a running (optionally time-decayed) sum and weight of the ratings they
+# received, so a new rating updates reputation_score in O(1):
+#
+#   score = (prior_mean * prior_weight + rating_sum) / (prior_weight + rating_weight)
+#
+# The prior pulls users with few ratings towards prior_mean (Bayesian average). With a
+# half-life, older ratings count for less: sum and weight are both scaled by
+# 0.5 ** (elapsed / half_life) before a new rating is added, and a periodic job (decay_all)
+# moves everyone's aggregates forward so scores of users without new ratings age too.
+#
+# The ratings table stays the source of truth; verify/rebuild stream it in one pass:
+#
+#   python reputation.py verify
+#   python reputation.py rebuild
+
+import argparse
+import logging
+import sqlite3
+from datetime import datetime, timezone
+from typing import Iterable, List, Optional, Tuple
+
+from config import (
+    DATABASE_PATH, REPUTATION_PRIOR_MEAN, REPUTATION_PRIOR_WEIGHT, REPUTATION_HALF_LIFE_DAYS
+)
+from expiry import SQLITE_TIMESTAMP, utc_timestamp
+
+logger = logging.getLogger(__name__)
+
+SCORE_TOLERANCE = 1e-6
+
+
+def _parse_timestamp(value: str) -> datetime:
+    return datetime.strptime(value[:19], SQLITE_TIMESTAMP).replace(tzinfo=timezone.utc)
+
+
+class ReputationEngine:
+    """Bayesian-smoothed reputation scores with optional exponential time decay"""
+
+    def __init__(self, prior_mean: float = REPUTATION_PRIOR_MEAN, prior_weight: float = REPUTATION_PRIOR_WEIGHT,
+                 half_life_days: Optional[float] = REPUTATION_HALF_LIFE_DAYS):
+        self.prior_mean = prior_mean
+        self.prior_weight = prior_weight
+        self.half_life_days = half_life_days or None
+
+    def score(self, rating_sum: float, rating_weight: float) -> float:
+        return (self.prior_mean * self.prior_weight + rating_sum) / (self.prior_weight + rating_weight)
+
+    def decay(self, since: Optional[str], now: str) -> float:
+        """Factor applied to aggregates last updated at ``since`` when moving them to ``now``"""
+        if self.half_life_days is None or not since:
+            return 1.0
+        elapsed = (_parse_timestamp(now) - _parse_timestamp(since)).total_seconds() / 86400
+        return 0.5 ** (max(elapsed, 0.0) / self.half_life_days)
+
+    def fold(self, rating_sum: float, rating_weight: float, updated: Optional[str], rating: float,
+             at: str) -> Tuple[float, float]:
+        """Aggregates after adding one rating given at ``at``"""
+        factor = self.decay(updated, at)
+        return rating_sum * factor + rating, rating_weight * factor + 1
+
+    def apply(self, cursor: sqlite3.Cursor, user_id: int, rating: float, at: Optional[str] = None) -> float:
+        """Add one rating to a user's stored aggregates and return the new score.
+
+        Call inside the transaction that inserts the rating.
+        """
+        at = at or utc_timestamp()
+        cursor.execute(
+            "SELECT rating_sum, rating_weight, rating_updated FROM users WHERE user_id = ?", (user_id,)
+        )
+        row = cursor.fetchone()
+        if row is None:
+            raise ValueError(f"Unknown user {user_id}")
+        rating_sum, rating_weight = self.fold(row[0], row[1], row[2], rating, at)
+        score = self.score(rating_sum, rating_weight)
+        cursor.execute('''
+            UPDATE users SET rating_sum = ?, rating_weight = ?, rating_updated = ?, reputation_score = ?
+            WHERE user_id = ?
+        ''', (rating_sum, rating_weight, at, score, user_id))
+        return score
+
+    def decay_all(self, conn: sqlite3.Connection, now: Optional[str] = None,
+                  min_change: float = SCORE_TOLERANCE) -> List[int]:
+        """Move every rated user's aggregates forward to ``now``; returns users whose score changed.
+
+        Users whose score would move by less than ``min_change`` are left as they are: decay
+        composes, so they catch up on the next pass or rating. Call inside a transaction.
+        """
+        if self.half_life_days is None:
+            return []
+        now = now or utc_timestamp()
+        updates = []
+        for user_id, rating_sum, rating_weight, updated, stored_score in conn.execute(
+                "SELECT user_id, rating_sum, rating_weight, rating_updated, reputation_score FROM users "
+                "WHERE rating_weight > 0 AND rating_updated < ?", (now,)):
+            factor = self.decay(updated, now)
+            score = self.score(rating_sum * factor, rating_weight * factor)
+            if abs(score - stored_score) >= min_change:
+                updates.append((rating_sum * factor, rating_weight * factor, now, score, user_id))
+        conn.executemany('''
+            UPDATE users SET rating_sum = ?, rating_weight = ?, rating_updated = ?, reputation_score = ?
+            WHERE user_id = ?
+        ''', updates)
+        return [update[-1] for update in updates]
+
+    def _stream(self, conn: sqlite3.Connection) -> Iterable[Tuple[int, float, float, Optional[str]]]:
+        """Yield (user_id, rating_sum, rating_weight, last_rating) per rated user from one ordered scan"""
+        current, rating_sum, rating_weight, updated = None, 0.0, 0.0, None
+        cursor = conn.execute(
+            "SELECT rated_user_id, rating, created_date FROM ratings ORDER BY rated_user_id, created_date, rating_id"
+        )
+        for user_id, rating, created in cursor:
+            if user_id != current:
+                if current is not None:
+                    yield current, rating_sum, rating_weight, updated
+                current, rating_sum, rating_weight, updated = user_id, 0.0, 0.0, None
+            rating_sum, rating_weight = self.fold(rating_sum, rating_weight, updated, rating, created)
+            updated = created
+        if current is not None:
+            yield current, rating_sum, rating_weight, updated
+
+    def recompute(self, conn: sqlite3.Connection, rebuild: bool = False) -> List[str]:
+        """Compare (or with ``rebuild``, overwrite) stored aggregates with the ratings history.
+
+        Returns human-readable discrepancies found before any rewrite.
+        """
+        problems = []
+        rated = set()
+        rewrites = []
+        for user_id, rating_sum, rating_weight, updated in self._stream(conn):
+            rated.add(user_id)
+            stored = conn.execute(
+                "SELECT rating_sum, rating_weight, reputation_score, rating_updated FROM users WHERE user_id = ?",
+                (user_id,)
+            ).fetchone()
+            if stored is None:
+                problems.append(f"ratings reference unknown user {user_id}")
+                continue
+            # decay_all may have moved the stored aggregates past the last rating
+            factor = self.decay(updated, stored[3]) if stored[3] and stored[3] > updated else 1.0
+            expected_sum, expected_weight = rating_sum * factor, rating_weight * factor
+            score = self.score(expected_sum, expected_weight)
+            if (abs(stored[0] - expected_sum) > SCORE_TOLERANCE or abs(stored[1] - expected_weight) > SCORE_TOLERANCE
+                    or abs(stored[2] - score) > SCORE_TOLERANCE):
+                problems.append(f"user {user_id}: stored score {stored[2]:.4f}, history gives {score:.4f}")
+            rewrites.append((rating_sum, rating_weight, updated, self.score(rating_sum, rating_weight), user_id))
+
+        unrated_score = self.score(0, 0)
+        for user_id, stored_score, rating_weight in conn.execute(
+                "SELECT user_id, reputation_score, rating_weight FROM users"):
+            if user_id not in rated and (abs(stored_score - unrated_score) > SCORE_TOLERANCE or rating_weight):
+                problems.append(f"user {user_id}: stored score {stored_score:.4f} without ratings, "
+                                f"expected {unrated_score:.4f}")
+
+        if rebuild:
+            conn.execute('''
+                UPDATE users SET rating_sum = 0, rating_weight = 0, rating_updated = NULL, reputation_score = ?
+            ''', (unrated_score,))
+            conn.executemany('''
+                UPDATE users SET rating_sum = ?, rating_weight = ?, rating_updated = ?, reputation_score = ?
+                WHERE user_id = ?
+            ''', rewrites)
+        return problems
+
+
+if __name__ == "__main__":
+    from migrations import apply_migrations
+
+    parser = argparse.ArgumentParser(description="Verify or rebuild reputation scores from the ratings table")
+    parser.add_argument("command", choices=["verify", "rebuild"])
+    parser.add_argument("--db", default=DATABASE_PATH, help="SQLite database path")
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(args.db)
+    apply_migrations(conn)
+    engine = ReputationEngine()
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        problems = engine.recompute(conn, rebuild=args.command == "rebuild")
+        conn.commit()
+    finally:
+        conn.close()
+    for problem in problems:
+        print(problem)
+    if args.command == "rebuild":
+        print(f"Rebuilt reputation scores ({len(problems)} corrected)")
+    else:
+        print("Reputation scores match the ratings history" if not problems else f"{len(problems)} mismatches")
@@ -0,0 +1,313 @@
+# Outbound message queue for USDT-INR Exchange Bot
+#
+# Every bulk or multi-message send goes through one queue that paces messages to stay inside
+# Telegram's limits: a global token bucket (~30 msg/s per bot), a per-chat bucket (about one
+# message per second in private chats with a small burst, 20/min in groups) and automatic
+# back-off when Telegram answers with RetryAfter. A RetryAfter pauses only the chat it came
+# from; when several chats are flood-controlled at once the limit is the bot's, and all
+# sending pauses. Interactive replies use a higher priority lane than bulk notifications.
+# Messages to the same chat are always delivered in order.
+#
+# A chat's bucket and pause outlive its queue: they are kept, least recently used first,
+# until the bucket has refilled and no pause is pending, so a chat that sends one message
+# at a time is paced the same as one with a backlog.
+
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from collections import OrderedDict, deque
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional, Tuple
+
+from telegram.error import NetworkError, RetryAfter, TimedOut
+
+logger = logging.getLogger(__name__)
+
+INTERACTIVE = 0
+BULK = 1
+
+MAX_NETWORK_RETRIES = 3
+GLOBAL_FLOOD_CHATS = 3  # chats under flood control at once that pause every chat
+
+
+class TokenBucket:
+    """Classic token bucket; ``rate`` tokens per second up to ``capacity``"""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self, now: Optional[float] = None) -> float:
+        """Seconds until one token is available"""
+        now = time.monotonic() if now is None else now
+        self._refill(now)
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def full(self, now: Optional[float] = None) -> bool:
+        now = time.monotonic() if now is None else now
+        self._refill(now)
+        return self.tokens >= self.capacity
+
+    def consume(self, now: Optional[float] = None):
+        now = time.monotonic() if now is None else now
+        self._refill(now)
+        self.tokens -= 1
+
+
+class _Job:
+    __slots__ = ("func", "kwargs", "priority", "future", "attempts")
+
+    def __init__(self, func: Callable[..., Awaitable[Any]], kwargs: Dict, priority: int,
+                 future: asyncio.Future):
+        self.func = func
+        self.kwargs = kwargs
+        self.priority = priority
+        self.future = future
+        self.attempts = 0
+
+
+class _Chat:
+    __slots__ = ("jobs", "in_flight", "scheduled")
+
+    def __init__(self):
+        self.jobs: Deque[_Job] = deque()
+        self.in_flight = False
+        self.scheduled = False
+
+
+class _Pacing:
+    __slots__ = ("bucket", "paused_until")
+
+    def __init__(self, bucket: TokenBucket):
+        self.bucket = bucket
+        self.paused_until = 0.0
+
+    def idle(self, now: float) -> bool:
+        """Nothing to remember: the bucket is full again and no pause is pending"""
+        return now >= self.paused_until and self.bucket.full(now)
+
+
+class OutboundQueue:
+    """Rate-limited, prioritized sender shared by all handlers"""
+
+    def __init__(self, bot, global_rate: float = 30, chat_rate: float = 1, chat_burst: int = 5,
+                 group_rate: float = 20 / 60, group_burst: int = 3, global_flood_chats: int = GLOBAL_FLOOD_CHATS):
+        self.bot = bot
+        self.global_bucket = TokenBucket(global_rate, global_rate)
+        self.chat_rate, self.chat_burst = chat_rate, chat_burst
+        self.group_rate, self.group_burst = group_rate, group_burst
+        self._chats: Dict[int, _Chat] = {}  # chats with queued or in-flight jobs
+        self._pacing: "OrderedDict[int, _Pacing]" = OrderedDict()  # least recently used first
+        self._ready: List[Tuple[int, int, int]] = []  # (priority, seq, chat_id)
+        self._waiting: List[Tuple[float, int, int]] = []  # (ready_at, seq, chat_id)
+        self._seq = itertools.count()
+        self.global_flood_chats = global_flood_chats
+        self._paused_until = 0.0  # every chat, after a bot-wide flood limit
+        self._flooded: Dict[int, float] = {}  # chat_id -> end of its RetryAfter
+        self._wakeup: Optional[asyncio.Event] = None
+        self._worker: Optional[asyncio.Task] = None
+        self._sends: set = set()
+        self.sent = 0
+        self.failed = 0
+        self.retry_after_hits = 0
+
+    def __len__(self) -> int:
+        return sum(len(chat.jobs) for chat in self._chats.values())
+
+    # Submitting
+
+    def submit(self, chat_id: int, func: Callable[..., Awaitable[Any]], priority: int = INTERACTIVE, /,
+               **kwargs) -> asyncio.Future:
+        """Queue ``func(**kwargs)`` for ``chat_id`` and return a future for its result.
+
+        Callers may ignore the future; failures are logged.
+        """
+        future = asyncio.get_running_loop().create_future()
+        chat = self._chats.get(chat_id)
+        if chat is None:
+            chat = self._chats[chat_id] = _Chat()
+        chat.jobs.append(_Job(func, kwargs, priority, future))
+        self._schedule(chat_id, chat)
+        return future
+
+    def send_message(self, chat_id: int, text: str, priority: int = INTERACTIVE, **kwargs) -> asyncio.Future:
+        return self.submit(chat_id, self.bot.send_message, priority, chat_id=chat_id, text=text, **kwargs)
+
+    def send_document(self, chat_id: int, document, priority: int = INTERACTIVE, **kwargs) -> asyncio.Future:
+        async def send(**send_kwargs):
+            if hasattr(document, "seek"):
+                # A file object is read by each attempt; a retry must start from the top again
+                document.seek(0)
+            return await self.bot.send_document(**send_kwargs)
+        return self.submit(chat_id, send, priority, chat_id=chat_id, document=document, **kwargs)
+
+    # Scheduling
+
+    def _pacing_for(self, chat_id: int) -> _Pacing:
+        pacing = self._pacing.get(chat_id)
+        if pacing is None:
+            if chat_id < 0:
+                bucket = TokenBucket(self.group_rate, self.group_burst)
+            else:
+                bucket = TokenBucket(self.chat_rate, self.chat_burst)
+            pacing = self._pacing[chat_id] = _Pacing(bucket)
+        else:
+            self._pacing.move_to_end(chat_id)
+        return pacing
+
+    def _forget_idle_pacing(self):
+        """Drop pacing state of the least recently used chats that no longer need it"""
+        now = time.monotonic()
+        while self._pacing:
+            chat_id, pacing = next(iter(self._pacing.items()))
+            if chat_id in self._chats or not pacing.idle(now):
+                break
+            del self._pacing[chat_id]
+
+    def _schedule(self, chat_id: int, chat: _Chat):
+        """Make a chat eligible once its head job may be sent"""
+        if chat.scheduled or chat.in_flight or not chat.jobs:
+            return
+        chat.scheduled = True
+        pacing = self._pacing_for(chat_id)
+        delay = max(pacing.bucket.delay(), pacing.paused_until - time.monotonic())
+        if delay > 0:
+            heapq.heappush(self._waiting, (time.monotonic() + delay, next(self._seq), chat_id))
+        else:
+            # Jobs of one chat go out in order, so the head job decides the chat's priority
+            heapq.heappush(self._ready, (chat.jobs[0].priority, next(self._seq), chat_id))
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    def _promote_waiting(self, now: float):
+        while self._waiting and self._waiting[0][0] <= now:
+            _, _, chat_id = heapq.heappop(self._waiting)
+            chat = self._chats.get(chat_id)
+            if chat is not None:
+                chat.scheduled = False
+                self._schedule(chat_id, chat)
+
+    async def start(self):
+        self._wakeup = asyncio.Event()
+        self._worker = asyncio.create_task(self._run())
+
+    async def stop(self, timeout: float = 10):
+        """Give queued messages up to ``timeout`` seconds to go out, then stop"""
+        deadline = time.monotonic() + timeout
+        while (len(self) or self._sends) and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+        if len(self):
+            logger.warning(f"Outbound queue stopped with {len(self)} unsent messages")
+
+    async def _run(self):
+        while True:
+            now = time.monotonic()
+            self._promote_waiting(now)
+
+            wait = None
+            if now < self._paused_until:
+                wait = self._paused_until - now
+            elif not self._ready:
+                wait = self._waiting[0][0] - now if self._waiting else None
+            else:
+                wait = self.global_bucket.delay(now) or None
+                if wait is None:
+                    _, _, chat_id = heapq.heappop(self._ready)
+                    self._dispatch(chat_id)
+                    continue
+
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=wait)
+            except asyncio.TimeoutError:
+                pass
+
+    def _dispatch(self, chat_id: int):
+        chat = self._chats[chat_id]
+        chat.scheduled = False
+        if not chat.jobs:
+            return
+        job = chat.jobs.popleft()
+        chat.in_flight = True
+        self.global_bucket.consume()
+        self._pacing_for(chat_id).bucket.consume()
+        task = asyncio.create_task(self._send(chat_id, chat, job))
+        self._sends.add(task)
+        task.add_done_callback(self._sends.discard)
+
+    async def _send(self, chat_id: int, chat: _Chat, job: _Job):
+        job.attempts += 1
+        try:
+            result = await job.func(**job.kwargs)
+        except RetryAfter as e:
+            self.retry_after_hits += 1
+            retry_after = e.retry_after.total_seconds() if hasattr(e.retry_after, "total_seconds") else e.retry_after
+            self._flood_control(chat_id, retry_after)
+            chat.jobs.appendleft(job)
+        except (TimedOut, NetworkError) as e:
+            if job.attempts < MAX_NETWORK_RETRIES:
+                chat.jobs.appendleft(job)
+            else:
+                self._fail(chat_id, job, e)
+        except Exception as e:
+            self._fail(chat_id, job, e)
+        else:
+            self.sent += 1
+            if not job.future.done():
+                job.future.set_result(result)
+        finally:
+            chat.in_flight = False
+            if chat.jobs:
+                self._schedule(chat_id, chat)
+            else:
+                self._chats.pop(chat_id, None)
+                self._forget_idle_pacing()
+            if self._wakeup is not None:
+                self._wakeup.set()
+
+    def _flood_control(self, chat_id: int, retry_after: float):
+        """Pause the chat for ``retry_after`` seconds, or every chat if the limit looks bot-wide"""
+        now = time.monotonic()
+        until = now + retry_after
+        pacing = self._pacing_for(chat_id)
+        pacing.paused_until = max(pacing.paused_until, until)
+        self._flooded = {flooded: end for flooded, end in self._flooded.items() if end > now}
+        self._flooded[chat_id] = until
+        if len(self._flooded) >= self.global_flood_chats:
+            logger.warning(f"Flood control for {len(self._flooded)} chats: pausing all sending for {retry_after}s")
+            self._paused_until = max(self._paused_until, until)
+        else:
+            logger.warning(f"Flood control for chat {chat_id}: retrying in {retry_after}s")
+
+    def _fail(self, chat_id: int, job: _Job, error: Exception):
+        self.failed += 1
+        logger.warning(f"Could not send to chat {chat_id}: {error}")
+        if not job.future.done():
+            job.future.set_exception(error)
+            # Nobody may be awaiting the future; mark the exception as retrieved
+            job.future.exception()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'queued': len(self),
+            'chats': len(self._chats),
+            'paced_chats': len(self._pacing),
+            'in_flight': len(self._sends),
+            'sent': self.sent,
+            'failed': self.failed,
+            'retry_after': self.retry_after_hits,
+        }
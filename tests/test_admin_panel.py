@@ -0,0 +1,43 @@
+import sqlite3
+
+import pytest
+
+from admin_panel import AdminPanel
+from migrations import apply_migrations, rebuild_daily_stats
+
+
+@pytest.fixture
+def panel(tmp_path):
+    path = str(tmp_path / "bot.db")
+    conn = sqlite3.connect(path)
+    apply_migrations(conn)
+    conn.execute("INSERT INTO users (user_id, username, registration_date) VALUES (1, 'old', '2026-01-01 10:00:00')")
+    conn.executemany("INSERT INTO users (user_id, username) VALUES (?, ?)", [(2, "today"), (3, "gone")])
+    conn.executemany("INSERT INTO offers (offer_id, user_id, offer_type, amount, rate, city, status) "
+                     "VALUES (?, 1, 'SELL', 100, 88, 'Mumbai', ?)",
+                     [(1, "ACTIVE"), (2, "ACTIVE"), (3, "ACTIVE")])
+    conn.executemany("INSERT INTO transactions (transaction_id, buyer_id, seller_id, offer_id, amount, rate) "
+                     "VALUES (?, 2, 1, 1, 10, 88)", [(1,), (2,)])
+    conn.execute("UPDATE offers SET status = 'EXPIRED' WHERE offer_id = 2")
+    conn.execute("DELETE FROM offers WHERE offer_id = 3")
+    conn.execute("DELETE FROM users WHERE user_id = 3")
+    conn.execute("UPDATE transactions SET status = 'COMPLETED', completed_date = CURRENT_TIMESTAMP "
+                 "WHERE transaction_id = 1")
+    conn.commit()
+    conn.close()
+    return AdminPanel(path)
+
+
+def test_stats_follow_every_write(panel):
+    assert panel.get_stats() == {
+        'total_users': 2, 'new_users_today': 1, 'active_offers': 1, 'total_transactions': 2,
+        'transactions_today': 1, 'offers_created_today': 2, 'transactions_initiated_today': 2,
+    }
+
+
+def test_triggers_agree_with_a_rebuild(panel):
+    conn = sqlite3.connect(panel.db_path)
+    maintained = conn.execute("SELECT * FROM daily_stats ORDER BY day").fetchall()
+    rebuild_daily_stats(conn.cursor())
+    assert conn.execute("SELECT * FROM daily_stats ORDER BY day").fetchall() == maintained
+    conn.close()
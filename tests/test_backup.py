@@ -0,0 +1,80 @@
+import os
+import sqlite3
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from backup import SNAPSHOT_TIME, BackupManager, restore, verify
+from migrations import apply_migrations
+
+
+@pytest.fixture
+def live_db(tmp_path):
+    path = str(tmp_path / "bot.db")
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA journal_mode=WAL")
+    apply_migrations(conn)
+    conn.executemany("INSERT INTO users (user_id, username) VALUES (?, ?)", [(i, f"user{i}") for i in range(50)])
+    conn.commit()
+    yield path, conn
+    conn.close()
+
+
+def test_snapshot_of_a_live_database_verifies_and_restores(live_db, tmp_path):
+    path, conn = live_db
+    # A write still open on another connection is not part of the snapshot
+    conn.execute("INSERT INTO users (user_id, username) VALUES (999, 'uncommitted')")
+    manager = BackupManager(path, str(tmp_path / "backups"), pages=4, sleep=0)
+    snapshot = manager.snapshot()
+    conn.rollback()
+
+    report = verify(snapshot)
+    assert report['rows']['users'] == 50 and report['schema_version'] > 0
+
+    target = str(tmp_path / "restored.db")
+    assert restore(snapshot, target) is None
+    restored = sqlite3.connect(target)
+    assert restored.execute("SELECT COUNT(*) FROM users").fetchone() == (50,)
+    restored.close()
+
+    with pytest.raises(ValueError):
+        restore(snapshot, target)
+    open(target + "-wal", "wb").close()
+    moved = restore(snapshot, target, force=True)
+    assert os.path.exists(moved) and os.path.exists(moved + "-wal.old")
+    assert not os.path.exists(target + "-wal")
+
+
+def test_damaged_snapshot_fails_verification(live_db, tmp_path):
+    path, _ = live_db
+    snapshot = BackupManager(path, str(tmp_path / "backups")).snapshot()
+    with open(snapshot, "r+b") as f:
+        f.seek(20)
+        byte = f.read(1)
+        f.seek(20)
+        f.write(bytes([byte[0] ^ 0xFF]))
+    with pytest.raises(ValueError):
+        verify(snapshot)
+    with pytest.raises(ValueError):
+        restore(snapshot, str(tmp_path / "restored.db"))
+
+
+def test_rotation_keeps_recent_daily_and_weekly_snapshots(tmp_path):
+    directory = tmp_path / "backups"
+    directory.mkdir()
+    now = datetime(2026, 10, 14, 12, 0, tzinfo=timezone.utc)  # a Wednesday
+    ages = [timedelta(hours=0), timedelta(hours=1), timedelta(hours=2), timedelta(days=1), timedelta(days=2),
+            timedelta(days=5), timedelta(days=10), timedelta(days=20)]
+    paths = []
+    for age in ages:
+        path = directory / f"bot-{(now - age).strftime(SNAPSHOT_TIME)}.db.gz"
+        path.write_bytes(b"")
+        (directory / (path.name + ".sha256")).write_text("0  x\n")
+        paths.append(str(path))
+
+    manager = BackupManager(str(tmp_path / "bot.db"), str(directory), keep_recent=2, keep_daily=3, keep_weekly=2)
+    removed = manager.rotate(now)
+    # Two most recent; newest of Oct 14, 13 and 12; newest of ISO weeks 41 and 40
+    assert sorted(removed) == sorted([paths[2], paths[7]])
+    assert [path for path, _ in manager.snapshots()] == [p for p in paths if p not in removed]
+    assert not os.path.exists(paths[7] + ".sha256")
@@ -0,0 +1,22 @@
+import pytest
+
+from cities import FUZZY_THRESHOLD, gazetteer
+
+
+@pytest.mark.parametrize("text, city_id", [
+    ("Mumbai", "mumbai"), ("  bombay ", "mumbai"), ("Dilli", "delhi"), ("thiruvanan", "thiruvananthapuram"),
+])
+def test_exact_names_aliases_and_unique_prefixes_resolve(text, city_id):
+    assert gazetteer.resolve(text) == city_id
+
+
+@pytest.mark.parametrize("text", ["Rampur", "Mumbay", "ram nagar"])
+def test_near_misses_do_not_resolve(text):
+    assert gazetteer.resolve(text) is None
+    assert gazetteer.city_id_for(text) == text.lower().replace(" ", "-")
+
+
+def test_near_misses_are_offered_as_suggestions():
+    assert gazetteer.suggest("Mumbay", min_score=FUZZY_THRESHOLD) == ["Mumbai"]
+    assert gazetteer.suggest("Rampur", min_score=FUZZY_THRESHOLD) == ["Raipur"]
+    assert gazetteer.suggest("ram nagar", min_score=FUZZY_THRESHOLD) == []
@@ -0,0 +1,79 @@
+import csv
+import sqlite3
+
+import pytest
+
+from data_transfer import connect_for_import, export_all, import_all, import_table
+from migrations import apply_migrations, rebuild_daily_stats
+from reputation import ReputationEngine
+
+
+def rows(conn, query):
+    return conn.execute(query).fetchall()
+
+
+@pytest.fixture
+def source(tmp_path):
+    path = str(tmp_path / "source.db")
+    conn = sqlite3.connect(path)
+    apply_migrations(conn)
+    conn.executemany("INSERT INTO users (user_id, username, registration_date) VALUES (?, ?, ?)",
+                     [(1, "buyer", "2026-01-01 09:00:00"), (2, "seller", "2026-01-02 09:00:00")])
+    conn.execute("INSERT INTO offers (offer_id, user_id, offer_type, amount, rate, city, city_id, payment_methods, "
+                 "created_date) VALUES (1, 2, 'SELL', 500, 88, 'Mumbai', 'mumbai', '[\"UPI\"]', '2026-01-03 10:00:00')")
+    conn.executemany(
+        "INSERT INTO transactions (transaction_id, buyer_id, seller_id, offer_id, amount, rate, total_inr, status, "
+        "created_date, completed_date) VALUES (?, 1, 2, 1, 100, 88, 8800, ?, ?, ?)",
+        [(1, "INITIATED", "2026-01-04 10:00:00", None),
+         (2, "COMPLETED", "2026-01-05 10:00:00", "2026-01-05 11:00:00")]
+    )
+    conn.executemany("INSERT INTO ratings (transaction_id, rater_id, rated_user_id, rating, created_date) "
+                     "VALUES (2, ?, ?, ?, '2026-01-05 12:00:00')", [(1, 2, 5), (2, 1, 3)])
+    ReputationEngine().recompute(conn, rebuild=True)
+    conn.commit()
+    conn.close()
+    return path
+
+
+@pytest.fixture
+def dump(source, tmp_path):
+    directory = str(tmp_path / "dump")
+    export_all(source, directory)
+    return directory
+
+
+def test_round_trip_keeps_ratings_and_reputation(source, dump, tmp_path):
+    target = str(tmp_path / "target.db")
+    results = import_all(target, dump)
+    assert [(r.table, r.inserted, r.rejected) for r in results] == [
+        ("users", 2, 0), ("offers", 1, 0), ("transactions", 2, 0), ("ratings", 2, 0)]
+
+    src, dst = sqlite3.connect(source), sqlite3.connect(target)
+    for table in ("users", "ratings", "transactions", "daily_stats"):
+        assert rows(src, f"SELECT * FROM {table} ORDER BY 1") == rows(dst, f"SELECT * FROM {table} ORDER BY 1")
+    assert ReputationEngine().recompute(dst) == []
+
+
+def test_update_reimport_keeps_counters_and_daily_stats(dump, tmp_path):
+    target = str(tmp_path / "target.db")
+    import_all(target, dump)
+
+    path = str(tmp_path / "changed.csv")
+    with open(f"{dump}/transactions.csv", newline="") as f:
+        records = list(csv.DictReader(f))
+    records[0].update(status="COMPLETED", completed_date="2026-01-06 09:00:00", created_date="2026-02-01 00:00:00")
+    with open(path, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=list(records[0]))
+        writer.writeheader()
+        writer.writerows(records)
+
+    conn = connect_for_import(target)
+    result = import_table(conn, "transactions", path, on_conflict="update")
+    assert (result.inserted, result.rejected) == (2, 0)
+
+    assert rows(conn, "SELECT user_id, tx_count, trades_completed FROM users ORDER BY 1") == [(1, 2, 2), (2, 2, 2)]
+    assert rows(conn, "SELECT created_date FROM transactions WHERE transaction_id = 1") == [("2026-01-04 10:00:00",)]
+    stats = rows(conn, "SELECT * FROM daily_stats ORDER BY 1")
+    rebuild_daily_stats(conn.cursor())
+    assert stats == rows(conn, "SELECT * FROM daily_stats ORDER BY 1")
+    conn.close()
@@ -0,0 +1,123 @@
+import asyncio
+import sqlite3
+import threading
+
+import pytest
+
+from usdt_exchange_bot import DatabaseManager
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    # The rate history directory is relative to the working directory
+    monkeypatch.chdir(tmp_path)
+    db = DatabaseManager(str(tmp_path / "bot.db"), pool_size=2)
+    yield db
+    db.close()
+
+
+def test_async_calls_run_on_the_db_threads(db):
+    async def scenario():
+        loop_thread = threading.get_ident()
+        await asyncio.gather(*(db.create_user_async(i, f"user{i}", "+91", "Mumbai") for i in range(1, 9)))
+        users = await asyncio.gather(*(db.get_user_async(i) for i in range(1, 9)))
+        threads = await asyncio.gather(*(db.run(threading.get_ident) for _ in range(8)))
+        return loop_thread, users, threads
+
+    loop_thread, users, threads = asyncio.run(scenario())
+    assert [user['username'] for user in users] == [f"user{i}" for i in range(1, 9)]
+    assert loop_thread not in threads and len(set(threads)) <= 2
+
+
+def test_pooled_connections_are_long_lived_and_survive_errors(db):
+    with db.pool.connection() as conn:
+        assert conn.execute("PRAGMA journal_mode").fetchone() == ("wal",)
+        first = conn
+    with pytest.raises(sqlite3.IntegrityError):
+        with db.pool.connection() as conn:
+            conn.execute("INSERT INTO users (user_id, username) VALUES (1, 'a')")
+            conn.execute("INSERT INTO users (user_id, username) VALUES (1, 'b')")
+    # The failed insert was rolled back and both connections are back in the pool
+    assert db.get_user(1) is None
+    borrowed = [db.pool._pool.get_nowait() for _ in range(2)]
+    for conn in borrowed:
+        db.pool._pool.put(conn)
+    assert first in borrowed
+
+
+def test_user_cache_is_read_through_and_invalidated_on_writes(db):
+    db.create_user(1, "trader", "+91", "Mumbai")
+    user = db.get_user(1)
+    user['username'] = "changed by the caller"
+    assert db.get_user(1)['username'] == "trader"
+    assert db.user_cache.stats()['hits'] == 1
+
+    db.block_user(1)
+    assert db.get_user(1)['is_blocked'] == 1
+
+
+def offer_data(**overrides):
+    data = {'type': "SELL", 'amount': 500, 'rate': 88.5, 'min_order': 50, 'max_order': 500, 'city': "Mumbai",
+            'payment_methods': ["UPI"], 'terms': ""}
+    data.update(overrides)
+    return data
+
+
+def test_due_offers_expire_in_bulk(db):
+    db.create_user(1, "trader", "+91", "Mumbai")
+    first = db.create_offer(1, offer_data())
+    second = db.create_offer(1, offer_data(rate=89.0))
+    with db.pool.connection() as conn:
+        conn.execute("UPDATE offers SET expiry_date = '2000-01-01 00:00:00' WHERE offer_id = ?", (first,))
+        conn.commit()
+
+    expired = db.expire_due_offers("2026-01-01 00:00:00")
+    assert [offer['offer_id'] for offer in expired] == [first]
+    assert [offer['offer_id'] for offer in db.get_offers()] == [second]
+    assert [offer['offer_id'] for offer in db.order_book.page("mumbai", "SELL", limit=10)[0]] == [second]
+
+
+@pytest.fixture
+def trades(db):
+    for user_id, name in ((1, "me"), (2, "alice"), (3, "bob")):
+        db.create_user(user_id, name, "+91", "Mumbai")
+    rows = []
+    for i in range(1, 24):
+        buyer, seller = [(1, 2), (3, 1), (1, 1), (2, 3)][i % 4]
+        status = "COMPLETED" if i % 3 else "INITIATED"
+        # Several trades share a timestamp so the cursor has to break ties by id
+        rows.append((i, buyer, seller, 10 * i, 88.0, 880.0 * i, status, f"2026-01-{1 + i // 3:02d} 10:00:00"))
+    with db.pool.connection() as conn:
+        conn.executemany("INSERT INTO transactions (transaction_id, buyer_id, seller_id, amount, rate, total_inr, "
+                         "status, created_date) VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows)
+        conn.commit()
+    return rows
+
+
+def test_transaction_pages_cover_history_newest_first(db, trades):
+    expected = sorted((row for row in trades if 1 in row[1:3]), key=lambda row: (row[7], row[0]), reverse=True)
+    seen, before = [], None
+    while True:
+        page, has_more = db.get_transactions_page(1, {'status': None}, before, limit=4)
+        seen += page
+        if not has_more:
+            break
+        before = (page[-1]['created_date'], page[-1]['transaction_id'])
+    assert [tx['transaction_id'] for tx in seen] == [row[0] for row in expected]
+    assert {tx['counterparty'] for tx in seen if tx['buyer_id'] == tx['seller_id']} == {"me"}
+
+    totals = db.get_transaction_totals(1, {'status': "COMPLETED"})
+    completed = [row for row in expected if row[6] == "COMPLETED"]
+    assert totals['count'] == len(completed)
+    assert totals['bought_usdt'] == sum(row[3] for row in completed if row[1] == 1)
+    assert totals['sold_usdt'] == sum(row[3] for row in completed if row[1] != 1)
+
+
+def test_csv_export_streams_running_positions(db, trades):
+    with db.export_transactions_csv(1, {'status': None}, batch_size=3) as output:
+        lines = output.read().decode("utf-8").splitlines()
+    header, rows = lines[0].split(","), [line.split(",") for line in lines[1:]]
+    assert header[-2:] == ["running_usdt", "running_inr"]
+    assert len(rows) == sum(1 in row[1:3] for row in trades)
+    totals = db.get_transaction_totals(1, {'status': "COMPLETED"})
+    assert float(rows[-1][-2]) == totals['bought_usdt'] - totals['sold_usdt']
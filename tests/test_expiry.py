@@ -0,0 +1,55 @@
+import asyncio
+
+from expiry import ExpiryHeap, OfferExpiryScheduler
+from send_queue import BULK
+
+
+def test_heap_pops_only_due_offers():
+    heap = ExpiryHeap()
+    heap.load([{'offer_id': 1, 'expiry_date': "2026-01-03 00:00:00"},
+               {'offer_id': 2, 'expiry_date': "2026-01-01 00:00:00"},
+               {'offer_id': 3, 'expiry_date': None}])
+    heap.push("2026-01-02 00:00:00", 4)
+    assert not heap.has_due("2025-12-31 23:59:59")
+    assert heap.has_due("2026-01-01 00:00:00")
+    assert heap.pop_due("2026-01-02 12:00:00") == [2, 4]
+    assert len(heap) == 1
+
+
+class FakeDB:
+    def __init__(self, expired):
+        self.expiry_heap = ExpiryHeap()
+        self.expiry_heap.push("2000-01-01 00:00:00", 0)
+        self.expired = expired
+        self.calls = 0
+
+    async def run(self, func):
+        return func()
+
+    def expire_due_offers(self):
+        self.calls += 1
+        self.expiry_heap.pop_due("9999")
+        return self.expired
+
+
+class FakeOutbox:
+    def __init__(self):
+        self.sent = []
+
+    def send_message(self, chat_id, text, priority, **kwargs):
+        self.sent.append((chat_id, text.count("USDT at"), priority))
+
+
+def expired_offer(offer_id, user_id):
+    return {'offer_id': offer_id, 'user_id': user_id, 'offer_type': "SELL", 'amount': 100, 'rate': 88.0}
+
+
+def test_owners_get_one_bulk_notice_each_and_idle_checks_skip_the_database():
+    db = FakeDB([expired_offer(1, 7), expired_offer(2, 8), expired_offer(3, 7)])
+    outbox = FakeOutbox()
+    scheduler = OfferExpiryScheduler(db, outbox=outbox)
+
+    asyncio.run(scheduler.check(None))
+    assert sorted(outbox.sent) == [(7, 2, BULK), (8, 1, BULK)]
+    asyncio.run(scheduler.check(None))
+    assert db.calls == 1
@@ -0,0 +1,82 @@
+import asyncio
+
+from fanout import NewOfferFanout
+
+
+class FakeDB:
+    def __init__(self, subscribers, order_book):
+        self.subscribers = subscribers
+        self.order_book = order_book
+
+    async def run(self, fn, *args):
+        await asyncio.sleep(0)
+        return fn(*args)
+
+    def get_subscriber_batch(self, city_id, offer_type, after, limit):
+        return [user_id for user_id in self.subscribers if user_id > after][:limit]
+
+
+class FakeOutbox:
+    def __init__(self):
+        self.sent = []
+        self.stopped = False
+
+    def send_message(self, chat_id, text, lane, **kwargs):
+        assert not self.stopped, "message queued after outbox.stop()"
+        self.sent.append(chat_id)
+
+    def __len__(self):
+        return 0
+
+
+def offer(offer_id, user_id):
+    return {'offer_id': offer_id, 'user_id': user_id, 'city_id': "mumbai", 'offer_type': "SELL", 'rate': 88.0}
+
+
+def make_fanout(subscribers, offers, **kwargs):
+    db, outbox = FakeDB(subscribers, {o['offer_id'] for o in offers}), FakeOutbox()
+    fanout = NewOfferFanout(db, outbox, quiet_hours=None, **kwargs)
+    fanout.render = lambda offers: ("text", None)
+    return fanout, outbox
+
+
+def test_digest_skips_every_poster():
+    offers = [offer(1, 2), offer(2, 4)]
+    fanout, outbox = make_fanout(list(range(1, 7)), offers, coalesce_seconds=0)
+
+    async def scenario():
+        for o in offers:
+            fanout.offer_posted(o)
+        await asyncio.sleep(0.05)
+
+    asyncio.run(scenario())
+    assert outbox.sent == [1, 3, 5, 6]
+
+
+def test_stop_waits_for_running_delivery():
+    offers = [offer(1, 1)]
+    fanout, outbox = make_fanout(list(range(2, 1000)), offers, coalesce_seconds=0, batch_size=10)
+
+    async def scenario():
+        fanout.offer_posted(offers[0])
+        while not outbox.sent:
+            await asyncio.sleep(0)
+        await fanout.stop()
+        outbox.stopped = True
+        await asyncio.sleep(0.05)
+
+    asyncio.run(scenario())
+    assert len(outbox.sent) == 998
+
+
+def test_stop_drops_held_offers():
+    offers = [offer(1, 1)]
+    fanout, outbox = make_fanout([2, 3], offers, coalesce_seconds=60)
+
+    async def scenario():
+        fanout.offer_posted(offers[0])
+        await asyncio.sleep(0)
+        await fanout.stop()
+
+    asyncio.run(scenario())
+    assert outbox.sent == [] and fanout.stats()['held'] == 0
@@ -0,0 +1,68 @@
+import random
+
+import pytest
+
+from matching import MatchingEngine, _brute_force, _random_offer
+from order_book import OrderBook
+
+MID, SPREAD = 88.0, 0.5
+
+
+@pytest.fixture
+def market():
+    rng = random.Random(3)
+    offers = [_random_offer(rng, i, side, MID, SPREAD) for i, side in enumerate(["SELL", "BUY"] * 1500, 1)]
+    # A few users with many offers, so owner exclusion skips several candidates in a row
+    for offer in offers[::7]:
+        offer['user_id'] = offer['offer_id'] % 5
+    book = OrderBook()
+    book.load(offers)
+    return rng, offers, book
+
+
+def test_find_matches_brute_force(market):
+    rng, offers, book = market
+    engine = MatchingEngine(book, limit=3)
+    queries = [_random_offer(rng, 10 ** 5 + i, rng.choice(["SELL", "BUY"]), MID, SPREAD) for i in range(300)]
+    # Aggressive offers priced through the whole opposite side
+    queries += [dict(q, rate=MID + 10 if q['offer_type'] == "BUY" else MID - 10) for q in queries[:50]]
+    queries += [dict(q, user_id=q['offer_id'] % 5) for q in queries[:50]]
+    # Sizes at band edges and outside every offer's range
+    queries += [dict(q, min_order=size, max_order=size, amount=size)
+                for q, size in zip(queries[:60], [1, 16, 31.5, 32, 64, 100000] * 10)]
+    for query in queries:
+        found = [match.counter['offer_id'] for match in engine.find(query)]
+        assert found == _brute_force(offers, query, engine.limit)
+
+
+def test_match_behind_many_unusable_offers_is_found():
+    def sell(offer_id, user_id, rate, min_order, max_order):
+        return {'offer_id': offer_id, 'user_id': user_id, 'username': f"user{user_id}", 'offer_type': "SELL",
+                'amount': max_order, 'min_order': min_order, 'max_order': max_order, 'rate': rate,
+                'city_id': "mumbai"}
+
+    offers = [sell(i, 7, 87.0, 10, 100) for i in range(1, 501)]  # the poster's own offers
+    offers += [sell(i, i, 87.5, 1000, 5000) for i in range(501, 1001)]  # too large
+    offers += [sell(1001, 9, 88.0, 50, 100)]
+    book = OrderBook()
+    book.load(offers)
+    buy = {'offer_id': 2000, 'user_id': 7, 'username': "user7", 'offer_type': "BUY", 'amount': 100,
+           'min_order': 20, 'max_order': 100, 'rate': 88.0, 'city_id': "mumbai"}
+    assert [match.counter['offer_id'] for match in MatchingEngine(book).find(buy)] == [1001]
+
+
+def test_size_cells_follow_adds_and_removes(market):
+    rng, offers, book = market
+    live = {offer['offer_id']: offer for offer in offers}
+    for offer_id in rng.sample(sorted(live), 1000):
+        book.remove(offer_id)
+        del live[offer_id]
+    for i in range(500):
+        offer = _random_offer(rng, 20000 + i, rng.choice(["SELL", "BUY"]), MID, SPREAD)
+        book.add(offer)
+        live[offer['offer_id']] = offer
+    engine = MatchingEngine(book)
+    for i in range(200):
+        query = _random_offer(rng, 30000 + i, rng.choice(["SELL", "BUY"]), MID, SPREAD)
+        assert ([m.counter['offer_id'] for m in engine.find(query)]
+                == _brute_force(list(live.values()), query, engine.limit))
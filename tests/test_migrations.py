@@ -0,0 +1,120 @@
+import sqlite3
+
+import pytest
+
+import migrations
+from migrations import apply_migrations, rebuild_trade_counters
+from reputation import ReputationEngine
+
+
+@pytest.fixture
+def conn(tmp_path):
+    conn = sqlite3.connect(tmp_path / "bot.db")
+    apply_migrations(conn)
+    conn.executemany("INSERT INTO users (user_id, username) VALUES (?, ?)",
+                     [(1, "buyer"), (2, "seller"), (3, "other")])
+    conn.execute("INSERT INTO transactions (transaction_id, buyer_id, seller_id, amount, rate, status) "
+                 "VALUES (1, 1, 2, 100, 88, 'INITIATED')")
+    conn.commit()
+    yield conn
+    conn.close()
+
+
+def counters(conn):
+    return conn.execute("SELECT user_id, tx_count, trades_completed FROM users ORDER BY user_id").fetchall()
+
+
+def recounted(conn):
+    rebuild_trade_counters(conn.cursor())
+    return counters(conn)
+
+
+def test_completion_counted_once_when_rewritten_with_same_parties(conn):
+    # What data_transfer's upsert does: every column is assigned, only the status changes
+    conn.execute("UPDATE transactions SET buyer_id = 1, seller_id = 2, status = 'COMPLETED' "
+                 "WHERE transaction_id = 1")
+    assert counters(conn) == [(1, 1, 1), (2, 1, 1), (3, 0, 0)]
+    assert counters(conn) == recounted(conn)
+
+
+def test_status_and_party_change_in_one_update(conn):
+    conn.execute("UPDATE transactions SET seller_id = 3, status = 'COMPLETED' WHERE transaction_id = 1")
+    assert counters(conn) == [(1, 1, 1), (2, 0, 0), (3, 1, 1)]
+    assert counters(conn) == recounted(conn)
+
+
+def test_party_change_moves_completion(conn):
+    conn.execute("UPDATE transactions SET status = 'COMPLETED' WHERE transaction_id = 1")
+    conn.execute("UPDATE transactions SET buyer_id = 3 WHERE transaction_id = 1")
+    assert counters(conn) == [(1, 0, 0), (2, 1, 1), (3, 1, 1)]
+    conn.execute("UPDATE transactions SET status = 'CANCELLED' WHERE transaction_id = 1")
+    assert counters(conn) == [(1, 0, 0), (2, 1, 0), (3, 1, 0)]
+    assert counters(conn) == recounted(conn)
+
+
+def test_unrated_users_default_to_the_reputation_prior(tmp_path, monkeypatch):
+    conn = sqlite3.connect(tmp_path / "old.db")
+    monkeypatch.setattr(migrations, "MIGRATIONS", [m for m in migrations.MIGRATIONS if m[0] <= 14])
+    apply_migrations(conn)
+    conn.execute("INSERT INTO users (user_id, username) VALUES (1, 'imported')")
+    conn.commit()
+    monkeypatch.undo()
+
+    assert apply_migrations(conn) == 15
+    conn.execute("INSERT INTO users (user_id, username) VALUES (2, 'new')")
+    prior = ReputationEngine().score(0, 0)
+    assert conn.execute("SELECT reputation_score FROM users ORDER BY user_id").fetchall() == [(prior,), (prior,)]
+    assert ReputationEngine().recompute(conn) == []
+    assert conn.execute("PRAGMA integrity_check").fetchone() == ("ok",)
+    conn.close()
+
+
+def plan(conn, query, params=()):
+    return " ".join(row[-1] for row in conn.execute(f"EXPLAIN QUERY PLAN {query}", params))
+
+
+def test_fresh_database_reaches_latest_version_once(tmp_path):
+    conn = sqlite3.connect(tmp_path / "new.db")
+    latest = migrations.MIGRATIONS[-1][0]
+    assert apply_migrations(conn) == latest
+    assert apply_migrations(conn) == latest
+    assert conn.execute("SELECT COUNT(*) FROM schema_version").fetchone() == (latest,)
+    conn.close()
+
+
+def test_hot_queries_use_their_indexes(conn):
+    assert "idx_offers_status_expiry" in plan(
+        conn, "SELECT offer_id FROM offers WHERE status = 'ACTIVE' AND expiry_date <= ?", ("2026-01-01",))
+    assert "idx_offers_user_status_created" in plan(
+        conn, "SELECT offer_id FROM offers WHERE user_id = ? AND status = 'ACTIVE' ORDER BY created_date DESC", (1,))
+    assert "idx_transactions_completed" in plan(
+        conn, "SELECT COUNT(*) FROM transactions WHERE completed_date >= ?", ("2026-01-01",))
+
+
+def test_failed_migration_is_rolled_back(tmp_path, monkeypatch):
+    def broken(cursor):
+        cursor.execute("CREATE TABLE half_done (x INTEGER)")
+        raise RuntimeError("boom")
+
+    conn = sqlite3.connect(tmp_path / "bot.db")
+    monkeypatch.setattr(migrations, "MIGRATIONS", migrations.MIGRATIONS[:2] + [(3, "broken", broken)])
+    with pytest.raises(RuntimeError):
+        apply_migrations(conn)
+    assert migrations.get_schema_version(conn) == 2
+    assert conn.execute("SELECT name FROM sqlite_master WHERE name = 'half_done'").fetchone() is None
+    conn.close()
+
+
+def test_offer_version_follows_what_its_card_shows(conn):
+    conn.execute("INSERT INTO offers (offer_id, user_id, offer_type, amount, rate, city) "
+                 "VALUES (1, 2, 'SELL', 500, 88, 'Mumbai')")
+
+    def version():
+        return conn.execute("SELECT version FROM offers WHERE offer_id = 1").fetchone()[0]
+
+    conn.execute("UPDATE offers SET rate = 88.5 WHERE offer_id = 1")
+    assert version() == 2
+    conn.execute("UPDATE users SET username = 'seller2' WHERE user_id = 2")
+    assert version() == 3
+    conn.execute("UPDATE users SET username = 'seller2', last_active = CURRENT_TIMESTAMP WHERE user_id = 2")
+    assert version() == 3
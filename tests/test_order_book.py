@@ -0,0 +1,91 @@
+import random
+
+import pytest
+
+from order_book import OrderBook, market_differences, market_from_offers
+
+CITIES = ["mumbai", "delhi"]
+
+
+def random_offer(rng, offer_id):
+    return {
+        'offer_id': offer_id, 'user_id': rng.randint(1, 300), 'city_id': rng.choice(CITIES),
+        'offer_type': rng.choice(["SELL", "BUY"]), 'rate': round(rng.uniform(85, 92), 2),
+        'amount': rng.choice([50, 100, 250.5, 1000, 5000]), 'min_order': 10, 'max_order': 1000,
+    }
+
+
+@pytest.fixture
+def churned():
+    """A book and the offers it should hold after random adds, removals and user removals"""
+    rng = random.Random(7)
+    book, live, next_id = OrderBook(), {}, 1
+    for _ in range(5000):
+        action = rng.random()
+        if action < 0.55 or not live:
+            offer = random_offer(rng, next_id)
+            next_id += 1
+            book.add(offer)
+            live[offer['offer_id']] = offer
+        elif action < 0.9:
+            book.remove(live.pop(rng.choice(list(live)))['offer_id'])
+        else:
+            user_id = rng.choice(list(live.values()))['user_id']
+            for removed in book.remove_user(user_id):
+                del live[removed['offer_id']]
+        city_id = rng.choice(CITIES)
+        assert not market_differences(book.market(city_id), market_from_offers(live.values(), city_id))
+    return book, live
+
+
+def test_market_matches_brute_force_after_every_change(churned):
+    book, live = churned
+    for city_id in CITIES + ["pune"]:
+        assert not market_differences(book.market(city_id), market_from_offers(live.values(), city_id))
+
+
+def test_consistent_book_has_no_problems(churned):
+    book, live = churned
+    assert book.check_consistency(live.values()) == []
+
+
+def test_check_consistency_reports_drift(churned):
+    book, live = churned
+    missing, stale = list(live.values())[:2]
+    book.remove(missing['offer_id'])
+    book._totals[(stale['city_id'], stale['offer_type'])][0] += 10
+    extra = dict(stale, offer_id=10 ** 6)
+    book.add(extra)
+
+    problems = book.check_consistency(live.values())
+    assert f"offer {missing['offer_id']} is active in the DB but missing from the book" in problems
+    assert f"offer {extra['offer_id']} is in the book but not active in the DB" in problems
+    assert any(problem.startswith(f"market {stale['city_id']}: {stale['offer_type']} volume") for problem in problems)
+
+
+def test_reconcile_rebuilds_a_drifted_book(churned):
+    book, live = churned
+    book.remove(next(iter(live)))
+    assert book.reconcile(lambda: list(live.values()))
+    assert book.check_consistency(live.values()) == []
+    assert book.reconcile(lambda: list(live.values())) == []
+
+
+def test_reconcile_ignores_an_offer_the_book_catches_up_on(churned):
+    book, live = churned
+    offer = random_offer(random.Random(1), 10 ** 6)
+    live[offer['offer_id']] = offer
+    changes = book._changes
+
+    reads = []
+
+    def load():
+        # Committed to the DB before the first read; the worker adds it to the book after it
+        reads.append(1)
+        if len(reads) == 2:
+            book.add(offer)
+        return list(live.values())
+
+    assert book.reconcile(load) == []
+    assert len(reads) == 2
+    assert book._changes == changes + 1  # only the add, no rebuild
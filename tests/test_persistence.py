@@ -0,0 +1,25 @@
+import asyncio
+from datetime import datetime
+
+from persistence import USER, SQLitePersistence
+
+
+class FakeDB:
+    def __init__(self):
+        self.writes = []
+
+    async def run(self, fn, *args):
+        self.writes.append(args[0])
+
+
+def test_non_json_values_are_refused():
+    db = FakeDB()
+    persistence = SQLitePersistence(db)
+
+    async def scenario():
+        await persistence.update_user_data(1, {'offer': {'rate': 88.5}, 'step': [1, 2]})
+        await persistence.update_user_data(2, {'since': datetime(2026, 1, 1)})
+        await persistence.flush()
+
+    asyncio.run(scenario())
+    assert db.writes == [{(USER, "1"): '{"offer":{"rate":88.5},"step":[1,2]}'}]
@@ -0,0 +1,78 @@
+import random
+
+from price_alerts import ABOVE, BELOW, AlertIndex, PriceAlertNotifier
+
+FUTURE = "2099-01-01 00:00:00"
+
+
+def alert(alert_id, user_id, direction, threshold, expiry_date=FUTURE, offer_type="SELL"):
+    return {'alert_id': alert_id, 'user_id': user_id, 'city_id': "mumbai", 'offer_type': offer_type,
+            'direction': direction, 'threshold': threshold, 'expiry_date': expiry_date}
+
+
+def crosses(a, rate):
+    return rate <= a['threshold'] if a['direction'] == BELOW else rate >= a['threshold']
+
+
+def test_triggered_matches_a_linear_scan():
+    rng = random.Random(5)
+    alerts = [alert(i, i, rng.choice([BELOW, ABOVE]), round(rng.uniform(86, 90), 1),
+                    offer_type=rng.choice(["SELL", "BUY"])) for i in range(1, 400)]
+    index = AlertIndex()
+    index.load(alerts[:200])
+    for a in alerts[200:]:
+        index.add(a)
+    for a in alerts[::5]:
+        index.remove(a['alert_id'])
+    live = [a for a in alerts if a['alert_id'] % 5 != 1]
+    for rate in [86.0, 87.3, 88.0, 88.05, 90.0] + [round(rng.uniform(85, 91), 1) for _ in range(50)]:
+        found = sorted(a['alert_id'] for a in index.triggered("mumbai", "SELL", rate))
+        assert found == sorted(a['alert_id'] for a in live if a['offer_type'] == "SELL" and crosses(a, rate))
+
+
+def test_expired_alerts_are_skipped():
+    index = AlertIndex()
+    index.load([alert(1, 1, BELOW, 88.0, "2026-01-01 00:00:00"), alert(2, 2, BELOW, 88.0)])
+    assert [a['alert_id'] for a in index.triggered("mumbai", "SELL", 88.0, now="2026-06-01 00:00:00")] == [2]
+
+
+class FakeDB:
+    def __init__(self, alerts):
+        self.alert_index = AlertIndex()
+        self.alert_index.load(alerts)
+
+
+class FakeOutbox:
+    def __init__(self):
+        self.sent = []
+
+    def send_message(self, chat_id, text, priority, **kwargs):
+        self.sent.append(chat_id)
+
+
+def offer(offer_id, user_id, rate):
+    return {'offer_id': offer_id, 'user_id': user_id, 'username': f"user{user_id}", 'offer_type': "SELL",
+            'amount': 100, 'rate': rate, 'min_order': 10, 'max_order': 100, 'city': "Mumbai",
+            'city_id': "mumbai", 'reputation_score': 4.0}
+
+
+def test_one_message_per_user_and_reposts_are_not_announced_again():
+    db = FakeDB([alert(1, 7, BELOW, 88.0), alert(2, 7, BELOW, 89.0), alert(3, 8, BELOW, 88.0),
+                 alert(4, 9, ABOVE, 90.0)])
+    outbox = FakeOutbox()
+    notifier = PriceAlertNotifier(db, outbox)
+    notifier.offer_posted(offer(1, 8, 87.5))  # user 8 posted it: not told about their own offer
+    assert outbox.sent == [7]
+    notifier.offer_posted(offer(2, 8, 87.5))  # the same offer reposted
+    assert outbox.sent == [7] and notifier.duplicates == 1
+    notifier.offer_posted(offer(3, 8, 87.0))
+    assert outbox.sent == [7, 7]
+
+
+def test_notifications_are_rate_limited_per_user():
+    db = FakeDB([alert(1, 7, BELOW, 88.0)])
+    outbox = FakeOutbox()
+    notifier = PriceAlertNotifier(db, outbox, burst=2, per_hour=1)
+    for i in range(5):
+        notifier.offer_posted(offer(i, 100 + i, 87.0))
+    assert outbox.sent == [7, 7] and notifier.rate_limited == 3
@@ -0,0 +1,110 @@
+import os
+import sqlite3
+
+import pytest
+
+import rate_history
+from migrations import apply_migrations
+from rate_history import RateHistory, backfill, parse_timestamp
+
+
+@pytest.fixture
+def conn(tmp_path):
+    conn = sqlite3.connect(tmp_path / "bot.db")
+    apply_migrations(conn)
+    conn.execute("INSERT INTO users (user_id, username) VALUES (1, 'seller')")
+    conn.executemany(
+        "INSERT INTO offers (offer_id, user_id, offer_type, amount, rate, city, city_id, payment_methods, "
+        "created_date) VALUES (?, 1, 'SELL', 100, ?, 'Mumbai', 'mumbai', '[]', ?)",
+        [(1, 88.0, "2026-05-01 10:00:00"), (2, 89.0, "2026-05-01 10:00:30"), (3, 87.5, "2026-05-02 09:00:00")]
+    )
+    conn.commit()
+    yield conn
+    conn.close()
+
+
+def daily(directory):
+    history = RateHistory(directory, retention_days={})
+    try:
+        return history.history("mumbai", "SELL", "1d", 0, 2 ** 40)
+    finally:
+        history.close()
+
+
+def test_backfill_builds_the_store(conn, tmp_path):
+    store = str(tmp_path / "rates")
+    assert backfill(conn, store) == (3, 0)
+    candles = daily(store)
+    assert [(c.open, c.high, c.low, c.close, c.count) for c in candles] == [(88.0, 89.0, 88.0, 89.0, 2),
+                                                                            (87.5, 87.5, 87.5, 87.5, 1)]
+    assert sorted(os.listdir(tmp_path)) == ["bot.db", "rates"]
+
+
+def test_interrupted_backfill_keeps_the_previous_store(conn, tmp_path, monkeypatch):
+    store = str(tmp_path / "rates")
+    backfill(conn, store)
+    before = daily(store)
+
+    def crash(conn, directory):
+        RateHistory(directory).record("mumbai", "SELL", 1.0, 1.0, parse_timestamp("2026-05-03 00:00:00"))
+        raise KeyboardInterrupt
+
+    monkeypatch.setattr(rate_history, "_fill", crash)
+    with pytest.raises(KeyboardInterrupt):
+        backfill(conn, store)
+    assert daily(store) == before
+    assert sorted(os.listdir(tmp_path)) == ["bot.db", "rates"]
+
+
+def test_backfill_clears_leftovers_of_a_killed_run(conn, tmp_path):
+    os.makedirs(tmp_path / ".rates-backfill-abc" / "mumbai")
+    backfill(conn, str(tmp_path / "rates"))
+    assert sorted(os.listdir(tmp_path)) == ["bot.db", "rates"]
+
+
+def test_late_event_reaches_every_resolution_and_keeps_the_latest_close(tmp_path):
+    history = RateHistory(str(tmp_path / "rates"), retention_days={})
+    t = parse_timestamp("2026-05-01 10:00:00")
+    history.record("mumbai", "TRADE", 88.0, 10, t)
+    history.record("mumbai", "TRADE", 89.0, 10, t + 125)  # 10:02
+    history.record("mumbai", "TRADE", 87.0, 10, t + 70)  # 10:01, recorded late
+    history.record("mumbai", "TRADE", 86.0, 10, t + 5)  # 10:00, recorded late
+
+    minutes = history.history("mumbai", "TRADE", "1m", t, t + 3600)
+    assert [(c.start - t, c.open, c.close, c.count) for c in minutes] == [(0, 88.0, 86.0, 2), (60, 87.0, 87.0, 1),
+                                                                          (120, 89.0, 89.0, 1)]
+    for resolution in ("1h", "1d"):
+        [candle] = history.history("mumbai", "TRADE", resolution, 0, t + 86400)
+        assert (candle.high, candle.low, candle.close, candle.volume, candle.count) == (89.0, 86.0, 89.0, 40, 4)
+    assert sum(c.count for c in minutes) == 4
+    history.close()
+
+
+def test_open_series_are_bounded(tmp_path):
+    history = RateHistory(str(tmp_path / "rates"), retention_days={'1m': 1}, max_open=4)
+    t = parse_timestamp("2026-05-01 10:00:00")
+    fds = len(os.listdir("/proc/self/fd"))
+    for i in range(20):
+        history.record(f"town{i}", "SELL", 88.0 + i, 10, t)
+    assert len(os.listdir("/proc/self/fd")) - fds <= 2 * 4
+    assert history.apply_retention(t + 3 * 86400) == 20
+    assert len(os.listdir("/proc/self/fd")) - fds <= 2 * 4
+    # Closed series reopen with their data
+    for i in range(20):
+        [candle] = history.history(f"town{i}", "SELL", "1h", t, t + 3600)
+        assert candle.close == 88.0 + i
+    history.close()
+    assert len(os.listdir("/proc/self/fd")) == fds
+
+
+def test_late_event_older_than_the_first_sets_open(tmp_path):
+    history = RateHistory(str(tmp_path / "rates"), retention_days={})
+    t = parse_timestamp("2026-05-01 10:00:00")
+    history.record("mumbai", "SELL", 88.0, 10, t + 30)
+    history.record("mumbai", "SELL", 89.0, 10, t + 40)
+    history.record("mumbai", "SELL", 86.0, 10, t + 10)  # replayed out of order
+    history.record("mumbai", "SELL", 87.0, 10, t + 20)
+    for resolution in ("1m", "1h", "1d"):
+        [candle] = history.history("mumbai", "SELL", resolution, 0, t + 86400)
+        assert (candle.open, candle.close, candle.low, candle.high) == (86.0, 89.0, 86.0, 89.0)
+    history.close()
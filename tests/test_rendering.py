@@ -0,0 +1,71 @@
+from rendering import (BUTTON_LABEL_LENGTH, MAX_MESSAGE_LENGTH, OfferCardCache, decode_offer_cursor,
+                       encode_offer_cursor, render_browse_page, render_market, render_offer_block)
+
+
+def offer(offer_id, rate=88.5, version=1):
+    return {'offer_id': offer_id, 'user_id': 7, 'username': "trader<7>", 'offer_type': "SELL", 'amount': 500,
+            'rate': rate, 'min_order': 50, 'max_order': 500, 'city': "Mumbai", 'city_id': "mumbai",
+            'reputation_score': 4.25, 'version': version}
+
+
+def test_page_is_one_message_with_a_contact_row_per_offer():
+    offers = [offer(1), offer(2, 89.0)]
+    text, keyboard, rendered = render_browse_page("Mumbai", "SELL", offers, True, True)
+    rows = keyboard.inline_keyboard
+    assert [row[0].callback_data for row in rows[:2]] == ["contact_7", "contact_7"]
+    assert all(len(row[0].text) <= BUTTON_LABEL_LENGTH for row in rows[:2])
+    assert [button.callback_data for button in rows[2]] == [f"browse_prev_{encode_offer_cursor(offers[0])}",
+                                                            f"browse_next_{encode_offer_cursor(offers[1])}"]
+
+
+def test_offers_that_do_not_fit_roll_over_to_the_next_page():
+    offers = [dict(offer(i), username="x" * 200) for i in range(1, 41)]
+    text, keyboard, rendered = render_browse_page("Mumbai", "SELL", offers, False, False)
+    assert len(text) <= MAX_MESSAGE_LENGTH
+    assert 0 < len(rendered) < len(offers)
+    nav = keyboard.inline_keyboard[len(rendered)]
+    assert nav[0].callback_data == f"browse_next_{encode_offer_cursor(rendered[-1])}"
+
+
+def test_offer_cursor_round_trip():
+    assert decode_offer_cursor(encode_offer_cursor(offer(12, 88.25))) == ("SELL", 88.25, 12)
+    assert decode_offer_cursor("SELL_abc_1") is None
+    assert decode_offer_cursor("HOLD_88.0_1") is None
+
+
+def test_cached_block_is_complete_html_and_index_is_separate():
+    cards = OfferCardCache()
+    card = cards.get(offer(1))
+    assert card.block.count("<b>") == card.block.count("</b>")
+    assert "trader&lt;7&gt;" in card.block
+    assert render_offer_block(offer(1), 3, cards) == f"<b>3.</b> {card.block}"
+
+
+def test_cards_follow_the_offer_version():
+    cards = OfferCardCache()
+    assert cards.get(offer(1)) is cards.get(offer(1))
+    assert "₹89.0" in cards.get(offer(1, rate=89.0, version=2)).block
+
+
+def test_browse_page_numbers_offers_in_order():
+    text, keyboard, rendered = render_browse_page("Mumbai", "SELL", [offer(1), offer(2, 89.0)], False, False)
+    assert text.index("<b>1.</b>") < text.index("<b>2.</b>")
+    assert [o['offer_id'] for o in rendered] == [1, 2]
+
+
+def test_market_side_without_volume_has_no_average():
+    side = {'count': 1, 'best': 88.0, 'median': 88.0, 'volume': 0.0, 'weighted_average': None}
+    text = render_market("Mumbai", {'SELL': side, 'BUY': None, 'spread': None, 'spread_percent': None})
+    assert "best ₹88.00" in text and "avg ₹" not in text
+    assert "no offers" in text
+
+
+def test_cache_stays_under_its_memory_budget():
+    cards = OfferCardCache(max_bytes=20_000)
+    for i in range(1, 101):
+        cards.get(offer(i))
+    stats = cards.stats()
+    assert 1 < len(cards) < 100
+    assert stats['weight'] <= 20_000 and stats['evictions'] == 100 - len(cards)
+    cards.get(offer(100))
+    assert cards.stats()['hits'] == 1
@@ -0,0 +1,48 @@
+import sqlite3
+
+import pytest
+
+from migrations import apply_migrations
+from reputation import ReputationEngine
+
+
+@pytest.fixture
+def conn():
+    conn = sqlite3.connect(":memory:")
+    apply_migrations(conn)
+    conn.executemany("INSERT INTO users (user_id, username) VALUES (?, ?)", [(1, "a"), (2, "b"), (3, "c")])
+    conn.execute("INSERT INTO transactions (transaction_id, buyer_id, seller_id, status) "
+                 "VALUES (1, 1, 2, 'COMPLETED')")
+    conn.executemany("INSERT INTO ratings (transaction_id, rater_id, rated_user_id, rating, created_date) "
+                     "VALUES (1, ?, ?, 5, '2026-01-01 00:00:00')", [(1, 2), (2, 1)])
+    return conn
+
+
+def score(conn, user_id):
+    return conn.execute("SELECT reputation_score FROM users WHERE user_id = ?", (user_id,)).fetchone()[0]
+
+
+def test_decay_all_ages_scores_without_new_ratings(conn):
+    engine = ReputationEngine(prior_mean=4.0, prior_weight=5, half_life_days=30)
+    engine.recompute(conn, rebuild=True)
+    fresh = score(conn, 2)
+
+    assert sorted(engine.decay_all(conn, "2026-01-31 00:00:00")) == [1, 2]
+    aged = score(conn, 2)
+    assert 4.0 < aged < fresh
+    assert aged == pytest.approx(engine.score(2.5, 0.5))
+    assert score(conn, 3) == pytest.approx(engine.score(0, 0))
+    # Aged aggregates still agree with the ratings history
+    assert engine.recompute(conn) == []
+
+    # Decay composes: a later rating lands on the same score as folding from the history
+    conn.execute("INSERT INTO ratings (transaction_id, rater_id, rated_user_id, rating, created_date) "
+                 "VALUES (1, 3, 2, 1, '2026-03-02 00:00:00')")
+    engine.apply(conn.cursor(), 2, 1, "2026-03-02 00:00:00")
+    assert engine.recompute(conn) == []
+
+
+def test_decay_all_without_half_life_is_a_no_op(conn):
+    engine = ReputationEngine(half_life_days=None)
+    engine.recompute(conn, rebuild=True)
+    assert engine.decay_all(conn, "2030-01-01 00:00:00") == []
@@ -0,0 +1,94 @@
+import asyncio
+import time
+
+from telegram.error import RetryAfter
+
+from send_queue import BULK, INTERACTIVE, OutboundQueue, TokenBucket
+
+
+class FloodedBot:
+    """Answers the first message to each chat in ``flooded`` with RetryAfter"""
+
+    def __init__(self, flooded, retry_after=1):
+        self.flooded = set(flooded)
+        self.retry_after = retry_after
+        self.sent = []
+        self.texts = []
+
+    async def send_message(self, chat_id, text, **kwargs):
+        if chat_id in self.flooded:
+            self.flooded.discard(chat_id)
+            raise RetryAfter(self.retry_after)
+        self.sent.append((chat_id, time.monotonic()))
+        self.texts.append((chat_id, text))
+
+
+async def deliver(outbox, chat_ids):
+    await outbox.start()
+    start = time.monotonic()
+    await asyncio.gather(*(outbox.send_message(chat_id, "hi") for chat_id in chat_ids))
+    await outbox.stop()
+    return start
+
+
+def test_retry_after_pauses_only_that_chat():
+    bot = FloodedBot({1})
+    outbox = OutboundQueue(bot, global_flood_chats=3)
+    start = asyncio.run(deliver(outbox, [1, 2, 3]))
+    sent = {chat_id: at - start for chat_id, at in bot.sent}
+    assert sent[2] < 0.5 and sent[3] < 0.5
+    assert sent[1] >= 1
+    assert outbox.retry_after_hits == 1
+
+
+def test_retry_after_in_many_chats_pauses_everything():
+    bot = FloodedBot({1, 2})
+    outbox = OutboundQueue(bot, global_flood_chats=2)
+
+    async def run():
+        await outbox.start()
+        start = time.monotonic()
+        first = [outbox.send_message(chat_id, "hi") for chat_id in (1, 2)]
+        while outbox.retry_after_hits < 2:
+            await asyncio.sleep(0.01)
+        await outbox.send_message(3, "hi")
+        await asyncio.gather(*first)
+        await outbox.stop()
+        return start
+
+    start = asyncio.run(run())
+    sent = {chat_id: at - start for chat_id, at in bot.sent}
+    assert sent[3] >= 0.9
+
+
+def test_chat_pacing_survives_an_empty_queue():
+    bot = FloodedBot(set())
+    outbox = OutboundQueue(bot, chat_rate=2, chat_burst=1)
+
+    async def run():
+        await outbox.start()
+        await outbox.send_message(1, "hi")
+        await outbox.send_message(1, "hi")  # queued after the first one drained
+        await outbox.stop()
+
+    asyncio.run(run())
+    (_, first), (_, second) = bot.sent
+    assert second - first >= 0.45
+
+
+def test_head_job_decides_chat_priority():
+    bot = FloodedBot(set())
+    outbox = OutboundQueue(bot)
+    outbox.global_bucket = TokenBucket(20, 1)  # one send at a time so order is observable
+
+    async def run():
+        outbox.send_message(1, "bulk 1", BULK)
+        outbox.send_message(1, "bulk 2", BULK)
+        outbox.send_message(2, "bulk", BULK)
+        outbox.send_message(1, "reply", INTERACTIVE)
+        await outbox.start()
+        await outbox.stop()
+
+    asyncio.run(run())
+    assert bot.texts == [(1, "bulk 1"), (2, "bulk"), (1, "bulk 2"), (1, "reply")]
+
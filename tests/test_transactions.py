@@ -0,0 +1,44 @@
+import asyncio
+import json
+from types import SimpleNamespace
+
+from usdt_exchange_bot import USDTExchangeBot
+
+TX = {'transaction_id': 5, 'created_date': "2026-01-02 10:00:00", 'side': "BUY", 'amount': 100, 'rate': 88.5,
+      'total_inr': 8850.0, 'counterparty': "seller", 'status': "COMPLETED"}
+
+
+class FakeDB:
+    def __init__(self):
+        self.totals_queries = 0
+
+    async def get_transactions_page_async(self, user_id, filters, before):
+        return [TX], True
+
+    async def get_transaction_totals_async(self, user_id, filters):
+        self.totals_queries += 1
+        return {'count': 1, 'bought_usdt': 100.0, 'paid_inr': 8850.0, 'sold_usdt': 0.0, 'received_inr': 0.0}
+
+
+def test_totals_cache_survives_persistence_round_trip():
+    bot = object.__new__(USDTExchangeBot)
+    bot.db = FakeDB()
+
+    async def edit_message_text(*args, **kwargs):
+        pass
+
+    update = SimpleNamespace(effective_user=SimpleNamespace(id=1),
+                             callback_query=SimpleNamespace(edit_message_text=edit_message_text))
+    context = SimpleNamespace(user_data={'tx_filter': {'status': "COMPLETED", 'days': 30}})
+    before = (TX['created_date'], TX['transaction_id'])
+
+    async def scenario():
+        await bot.show_transactions(update, context)
+        # What the bot sees after a restart: user_data as stored by the JSON persistence
+        context.user_data = json.loads(json.dumps(context.user_data))
+        await bot.show_transactions(update, context, before)
+        context.user_data['tx_filter']['days'] = 7
+        await bot.show_transactions(update, context, before)
+
+    asyncio.run(scenario())
+    assert bot.db.totals_queries == 2
@@ -0,0 +1,52 @@
+import asyncio
+from datetime import datetime, timezone
+
+from telegram import Chat, Message, Update, User
+
+from update_processor import PerChatUpdateProcessor
+
+
+def update(update_id, chat_id):
+    user = User(chat_id, f"user{chat_id}", False)
+    message = Message(update_id, datetime.now(timezone.utc), Chat(chat_id, Chat.PRIVATE), from_user=user)
+    return Update(update_id, message=message)
+
+
+def test_same_chat_in_order_other_chats_in_parallel():
+    processor = PerChatUpdateProcessor(max_concurrent_updates=2)
+    log = []
+
+    async def handle(name, delay):
+        await asyncio.sleep(delay)
+        log.append(name)
+
+    async def scenario():
+        await processor.initialize()
+        await asyncio.gather(
+            processor.process_update(update(1, 10), handle("a1", 0.05)),
+            processor.process_update(update(2, 10), handle("a2", 0)),
+            processor.process_update(update(3, 20), handle("b1", 0)),
+        )
+
+    asyncio.run(scenario())
+    assert log == ["b1", "a1", "a2"]
+    assert processor.stats()['active_chats'] == 0
+
+
+def test_busy_chat_does_not_hold_running_slots():
+    processor = PerChatUpdateProcessor(max_concurrent_updates=2)
+    log = []
+
+    async def handle(name, delay):
+        await asyncio.sleep(delay)
+        log.append(name)
+
+    async def scenario():
+        await processor.initialize()
+        busy = [processor.process_update(update(i, 10), handle(f"a{i}", 0.02)) for i in range(1, 6)]
+        await asyncio.gather(*busy, processor.process_update(update(6, 20), handle("b", 0)))
+
+    asyncio.run(scenario())
+    # The other chat goes first although five updates of chat 10 arrived before it
+    assert log == ["b", "a1", "a2", "a3", "a4", "a5"]
+    assert processor.stats()['peak_chat_depth'] == 5
@@ -0,0 +1,32 @@
+import sys
+
+import pytest
+
+from usdt_exchange_bot import check_webhook_settings, parse_args
+
+URL = "https://bot.example.com/telegram"
+
+
+def test_webhook_requires_url_and_secret():
+    with pytest.raises(ValueError):
+        check_webhook_settings(URL, None)
+    with pytest.raises(ValueError):
+        check_webhook_settings(URL, "")
+    with pytest.raises(ValueError):
+        check_webhook_settings(None, "s3cret_token-1")
+    check_webhook_settings(URL, "s3cret_token-1")
+
+
+def test_secret_must_be_valid_for_telegram():
+    with pytest.raises(ValueError):
+        check_webhook_settings(URL, "has spaces")
+    with pytest.raises(ValueError):
+        check_webhook_settings(URL, "x" * 257)
+
+
+def test_cli_refuses_webhook_mode_without_secret(monkeypatch):
+    monkeypatch.setattr(sys, "argv", ["usdt_exchange_bot.py", "--mode", "webhook", "--webhook-url", URL])
+    with pytest.raises(SystemExit):
+        parse_args()
+    monkeypatch.setattr(sys, "argv", ["usdt_exchange_bot.py", "--mode", "polling"])
+    assert parse_args().mode == "polling"
@@ -0,0 +1,84 @@
+import asyncio
+import sqlite3
+from contextlib import contextmanager
+
+import pytest
+
+from write_behind import WriteBehindQueue
+
+
+class FakeDB:
+    """Just enough of DatabaseManager for the queue: a one-connection pool and run()"""
+
+    def __init__(self, path):
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("CREATE TABLE audit_log (user_id INTEGER, action TEXT NOT NULL, details TEXT, "
+                          "created_date TIMESTAMP)")
+        self.conn.commit()
+        self.pool = self
+        self.fail_with = None
+
+    @contextmanager
+    def connection(self):
+        try:
+            yield self.conn
+        except Exception:
+            self.conn.rollback()
+            raise
+
+    async def run(self, func, *args):
+        if self.fail_with is not None:
+            raise self.fail_with
+        return func(*args)
+
+    def actions(self):
+        return [row[0] for row in self.conn.execute("SELECT action FROM audit_log ORDER BY rowid")]
+
+
+@pytest.fixture
+def db(tmp_path):
+    return FakeDB(tmp_path / "bot.db")
+
+
+def test_bad_statement_is_dropped_without_blocking_the_batch(db):
+    queue = WriteBehindQueue(db)
+    queue.audit(1, "first")
+    queue.enqueue("INSERT INTO audit_log (user_id, action) VALUES (?, ?)", (2, None))  # NOT NULL
+    queue.enqueue("INSERT INTO missing_table VALUES (?)", (1,))
+    queue.audit(3, "last")
+    asyncio.run(queue.flush())
+    assert db.actions() == ["first", "last"]
+    assert len(queue) == 0 and queue.dropped == 2
+
+    queue.audit(4, "later")
+    asyncio.run(queue.flush())
+    assert db.actions() == ["first", "last", "later"]
+
+
+def test_batch_failures_are_retried_then_dropped(db):
+    queue = WriteBehindQueue(db, max_retries=3)
+    queue.audit(1, "kept")
+    db.fail_with = sqlite3.OperationalError("database is locked")
+    for attempt in range(2):
+        with pytest.raises(sqlite3.OperationalError):
+            asyncio.run(queue.flush())
+        assert len(queue) == 1
+    db.fail_with = None
+    asyncio.run(queue.flush())
+    assert db.actions() == ["kept"]
+
+    queue.audit(2, "lost")
+    db.fail_with = sqlite3.OperationalError("database is locked")
+    for attempt in range(3):
+        with pytest.raises(sqlite3.OperationalError):
+            asyncio.run(queue.flush())
+    assert len(queue) == 0 and queue.dropped == 1
+
+
+def test_buffer_is_bounded(db):
+    queue = WriteBehindQueue(db, max_queued=3)
+    for i in range(5):
+        queue.audit(i, f"action {i}")
+    assert len(queue) == 3 and queue.dropped == 2
+    asyncio.run(queue.flush())
+    assert db.actions() == ["action 0", "action 1", "action 2"]
@@ -0,0 +1,108 @@
+# Concurrent update processing for USDT-INR Exchange Bot
+#
+# Updates from different chats run in parallel, while updates from the same chat are
+# processed strictly in arrival order so ConversationHandler flows (registration, offer
+# creation, browsing) never observe out-of-order state.
+
+import asyncio
+import logging
+from typing import Any, Awaitable, Dict, Hashable, Optional
+
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+logger = logging.getLogger(__name__)
+
+
+class _ChatLane:
+    __slots__ = ("lock", "depth")
+
+    def __init__(self):
+        self.lock = asyncio.Lock()
+        self.depth = 0
+
+
+class PerChatUpdateProcessor(BaseUpdateProcessor):
+    """Runs up to ``max_concurrent_updates`` handlers at once, one at a time per chat.
+
+    ``max_pending_updates`` caps how many updates may be queued in total (the base class
+    semaphore). Updates waiting behind an earlier update of the same chat do not take one of
+    the ``max_concurrent_updates`` running slots, so a single busy chat cannot starve others.
+    """
+
+    def __init__(self, max_concurrent_updates: int = 64, max_pending_updates: int = 1024):
+        super().__init__(max(max_pending_updates, max_concurrent_updates))
+        self.max_running = max_concurrent_updates
+        self._running_slots: Optional[asyncio.Semaphore] = None
+        self._lanes: Dict[Hashable, _ChatLane] = {}
+        self.pending = 0
+        self.running = 0
+        self.processed = 0
+        self.peak_pending = 0
+        self.peak_chat_depth = 0
+
+    @staticmethod
+    def _lane_key(update: Any) -> Optional[Hashable]:
+        if isinstance(update, Update):
+            if update.effective_chat:
+                return update.effective_chat.id
+            if update.effective_user:
+                return ("user", update.effective_user.id)
+        return None
+
+    async def do_process_update(self, update: object, coroutine: Awaitable[Any]) -> None:
+        key = self._lane_key(update)
+        lane = None
+        if key is not None:
+            # Registering the lane before the first await keeps arrival order per chat
+            lane = self._lanes.get(key)
+            if lane is None:
+                lane = self._lanes[key] = _ChatLane()
+            lane.depth += 1
+            self.peak_chat_depth = max(self.peak_chat_depth, lane.depth)
+
+        self.pending += 1
+        self.peak_pending = max(self.peak_pending, self.pending)
+        started = False
+        try:
+            if lane is not None:
+                await lane.lock.acquire()
+            try:
+                async with self._running_slots:
+                    self.pending -= 1
+                    started = True
+                    self.running += 1
+                    try:
+                        await coroutine
+                    finally:
+                        self.running -= 1
+                        self.processed += 1
+            finally:
+                if lane is not None:
+                    lane.lock.release()
+        finally:
+            if not started:
+                self.pending -= 1
+            if lane is not None:
+                lane.depth -= 1
+                if lane.depth == 0:
+                    del self._lanes[key]
+
+    async def initialize(self) -> None:
+        self._running_slots = asyncio.Semaphore(self.max_running)
+
+    async def shutdown(self) -> None:
+        if self.pending or self.running:
+            logger.info(f"Update processor shutting down with {self.running} running, {self.pending} pending")
+
+    def stats(self) -> Dict[str, int]:
+        """Queue depth metrics"""
+        return {
+            'running': self.running,
+            'pending': self.pending,
+            'active_chats': len(self._lanes),
+            'processed': self.processed,
+            'peak_pending': self.peak_pending,
+            'peak_chat_depth': self.peak_chat_depth,
+            'max_running': self.max_running,
+        }
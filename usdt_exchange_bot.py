@@ -5,11 +5,20 @@ import warnings
 warnings.filterwarnings("ignore", message="pkg_resources is deprecated as an API*", category=UserWarning)
 
 import os
+import argparse
+import csv
+import io
 import sqlite3
+import tempfile
 import logging
 import asyncio
-from datetime import datetime, timedelta
+import queue
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
 from typing import Dict, List, Optional, Tuple
+import html
 import json
 import re
 
@@ -20,9 +29,9 @@ from telegram import (
 )
 from telegram.ext import (
     Application, CommandHandler, MessageHandler, CallbackQueryHandler,
-    ConversationHandler, filters, ContextTypes
+    ConversationHandler, TypeHandler, filters, ContextTypes
 )
-from telegram.helpers import escape_markdown
+from telegram.error import BadRequest
 
 # For location services and phone verification
 import phonenumbers
@@ -45,207 +54,786 @@ logger = logging.getLogger(__name__)
 from dotenv import load_dotenv
 load_dotenv()
 
+from config import (
+    DB_POOL_SIZE, BROWSE_PAGE_SIZE, WRITE_BEHIND_FLUSH_MS, WRITE_BEHIND_MAX_BATCH,
+    WRITE_BEHIND_MAX_RETRIES, WRITE_BEHIND_MAX_QUEUED,
+    USER_CACHE_SIZE, USER_CACHE_TTL, OFFER_EXPIRY_DAYS, EXPIRY_CHECK_INTERVAL,
+    MAX_CONCURRENT_UPDATES, MAX_PENDING_UPDATES, OUTBOX_GLOBAL_RATE, OUTBOX_CHAT_RATE,
+    OUTBOX_CHAT_BURST, OUTBOX_GROUP_RATE, RENDER_CACHE_BYTES, PERSISTENCE_FLUSH_INTERVAL,
+    TOP_TRADERS_LIMIT, ENABLE_USER_RATINGS, TRANSACTIONS_PAGE_SIZE, NOTIFY_PRICE_ALERTS,
+    ALERT_MAX_PER_USER, ALERT_EXPIRY_DAYS, NOTIFY_NEW_OFFERS, SUBSCRIPTIONS_MAX_PER_USER,
+    NEW_OFFER_QUIET_HOURS, MARKET_RECONCILE_INTERVAL, RATE_HISTORY_DIR, RATE_HISTORY_RETENTION_INTERVAL,
+    REPUTATION_HALF_LIFE_DAYS, REPUTATION_DECAY_INTERVAL
+)
+from migrations import apply_migrations
+from order_book import OrderBook
+from cities import gazetteer, normalize_city_name, FUZZY_THRESHOLD
+from write_behind import WriteBehindQueue
+from cache import LRUCache
+from expiry import ExpiryHeap, OfferExpiryScheduler, utc_timestamp
+from update_processor import PerChatUpdateProcessor
+from send_queue import OutboundQueue
+from persistence import SQLitePersistence
+from rendering import OfferCardCache, decode_offer_cursor, render_browse_page, render_market
+from admin_panel import add_admin_handlers
+from reputation import ReputationEngine
+from backup import BackupManager
+from rate_history import RateHistory, backfill as backfill_rate_history
+from matching import MatchingEngine
+from fanout import NewOfferFanout
+from price_alerts import ABOVE, BELOW, AlertIndex, PriceAlertNotifier, describe_alert
+
 # Bot token from BotFather
 BOT_TOKEN = os.getenv("BOT_TOKEN")
 
+# Update delivery: "polling" or "webhook" (Application.run_webhook; needs a public HTTPS URL
+# and a secret token Telegram sends back with every update)
+BOT_MODE = os.getenv("BOT_MODE", "polling")
+WEBHOOK_LISTEN = os.getenv("WEBHOOK_LISTEN", "127.0.0.1")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8080"))
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "telegram")
+WEBHOOK_URL = os.getenv("WEBHOOK_URL")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET")
+WEBHOOK_MAX_CONNECTIONS = int(os.getenv("WEBHOOK_MAX_CONNECTIONS", "40"))
+# What Telegram accepts as a secret_token
+WEBHOOK_SECRET_PATTERN = re.compile(r"[A-Za-z0-9_-]{1,256}")
+
 # Database configuration
 DATABASE_PATH = "usdt_exchange.db"
 
+# Offer columns in the order expected by DatabaseManager._offer_from_row
+OFFER_COLUMNS = '''
+    o.offer_id, o.user_id, o.offer_type, o.amount, o.rate, o.min_order, o.max_order,
+    o.city, o.payment_methods, o.terms, o.created_date, o.status,
+    u.username, u.reputation_score, o.expiry_date, o.city_id, o.version
+'''
+
+# Transaction columns in the order expected by DatabaseManager._transaction_from_row
+TRANSACTION_COLUMNS = '''
+    t.transaction_id, t.buyer_id, t.seller_id, t.offer_id, t.amount, t.rate, t.total_inr,
+    t.status, t.created_date, t.completed_date, t.buyer_confirmed, t.seller_confirmed
+'''
+
+# Price alert columns in the order expected by DatabaseManager._alert_from_row
+ALERT_COLUMNS = "alert_id, user_id, city_id, offer_type, direction, threshold, created_date, expiry_date"
+
 # Conversation states
 (REGISTRATION_PHONE, REGISTRATION_LOCATION, 
  OFFER_TYPE, OFFER_AMOUNT, OFFER_RATE, OFFER_MIN_MAX, 
  OFFER_PAYMENT_METHODS, OFFER_LOCATION, OFFER_TERMS,
  BROWSE_FILTER, CONTACT_SELLER) = range(11)
 
+class ConnectionPool:
+    """Small pool of long-lived SQLite connections shared by the DB worker threads"""
+
+    def __init__(self, db_path: str, size: int = 4):
+        self.db_path = db_path
+        self.size = size
+        self._pool = queue.Queue(maxsize=size)
+        for _ in range(size):
+            self._pool.put(self._connect())
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path, timeout=30, check_same_thread=False)
+        # WAL lets readers proceed while a writer holds the lock
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA busy_timeout=5000")
+        return conn
+
+    @contextmanager
+    def connection(self):
+        """Borrow a connection, rolling back any open transaction on error"""
+        conn = self._pool.get()
+        try:
+            yield conn
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            self._pool.put(conn)
+
+    def close(self):
+        """Close every pooled connection"""
+        while True:
+            try:
+                conn = self._pool.get_nowait()
+            except queue.Empty:
+                break
+            conn.close()
+
+
 class DatabaseManager:
     """Handles all database operations"""
 
-    def __init__(self, db_path: str):
+    def __init__(self, db_path: str, pool_size: int = DB_POOL_SIZE):
         self.db_path = db_path
         self.init_database()
+        self.user_cache = LRUCache(USER_CACHE_SIZE, ttl=USER_CACHE_TTL)
+        self.reputation = ReputationEngine()
+        self.pool = ConnectionPool(db_path, pool_size)
+        # One worker per pooled connection so a query never waits for a connection
+        self._executor = ThreadPoolExecutor(max_workers=pool_size, thread_name_prefix="db")
+        active_offers = self.get_offers()
+        self.order_book = OrderBook()
+        self.order_book.load(active_offers)
+        self.expiry_heap = ExpiryHeap()
+        self.expiry_heap.load(active_offers)
+        logger.info(f"Loaded {len(self.order_book)} active offers into the order book")
+        self.alert_index = AlertIndex()
+        self.alert_index.load(self.get_active_alerts())
+        if not os.path.isdir(RATE_HISTORY_DIR):
+            # One-time backfill from the rows that predate the rate history store
+            with self.pool.connection() as conn:
+                offers, trades = backfill_rate_history(conn, RATE_HISTORY_DIR)
+            logger.info(f"Backfilled rate history from {offers} offers and {trades} trades")
+        self.rate_history = RateHistory(RATE_HISTORY_DIR)
+        # Batched low-priority writes (last_active, view counters, audit rows)
+        self.writes = WriteBehindQueue(self, WRITE_BEHIND_FLUSH_MS, WRITE_BEHIND_MAX_BATCH,
+                                       WRITE_BEHIND_MAX_RETRIES, WRITE_BEHIND_MAX_QUEUED)
+
+    async def run(self, func, *args, **kwargs):
+        """Run a blocking database call on the DB executor"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, functools.partial(func, *args, **kwargs))
+
+    def close(self):
+        """Stop the DB executor, close pooled connections and flush the rate history"""
+        self._executor.shutdown(wait=True)
+        self.rate_history.close()
+        self.pool.close()
 
     def init_database(self):
-        """Initialize database tables"""
+        """Create or upgrade the schema by applying pending migrations"""
         conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-
-        # Users table
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS users (
-                user_id INTEGER PRIMARY KEY,
-                username TEXT,
-                phone TEXT,
-                city TEXT,
-                registration_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                last_active TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                verification_status INTEGER DEFAULT 0,
-                reputation_score REAL DEFAULT 5.0,
-                is_blocked INTEGER DEFAULT 0
-            )
-        ''')
-
-        # Offers table
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS offers (
-                offer_id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER,
-                offer_type TEXT, -- 'SELL' or 'BUY'
-                amount REAL,
-                rate REAL,
-                min_order REAL,
-                max_order REAL,
-                city TEXT,
-                payment_methods TEXT, -- JSON string
-                terms TEXT,
-                created_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                status TEXT DEFAULT 'ACTIVE', -- 'ACTIVE', 'COMPLETED', 'CANCELLED'
-                expiry_date TIMESTAMP,
-                FOREIGN KEY (user_id) REFERENCES users (user_id)
-            )
-        ''')
-
-        # Transactions table
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS transactions (
-                transaction_id INTEGER PRIMARY KEY AUTOINCREMENT,
-                buyer_id INTEGER,
-                seller_id INTEGER,
-                offer_id INTEGER,
-                amount REAL,
-                rate REAL,
-                total_inr REAL,
-                status TEXT DEFAULT 'INITIATED',
-                created_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                completed_date TIMESTAMP,
-                meeting_location TEXT,
-                notes TEXT,
-                FOREIGN KEY (buyer_id) REFERENCES users (user_id),
-                FOREIGN KEY (seller_id) REFERENCES users (user_id),
-                FOREIGN KEY (offer_id) REFERENCES offers (offer_id)
-            )
-        ''')
-
-        # Ratings table
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS ratings (
-                rating_id INTEGER PRIMARY KEY AUTOINCREMENT,
-                transaction_id INTEGER,
-                rater_id INTEGER,
-                rated_user_id INTEGER,
-                rating INTEGER, -- 1-5 stars
-                comment TEXT,
-                created_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (transaction_id) REFERENCES transactions (transaction_id),
-                FOREIGN KEY (rater_id) REFERENCES users (user_id),
-                FOREIGN KEY (rated_user_id) REFERENCES users (user_id)
-            )
-        ''')
-
-        conn.commit()
+        version = apply_migrations(conn)
         conn.close()
-        logger.info("Database initialized successfully")
+        logger.info(f"Database initialized successfully (schema version {version})")
 
     def get_user(self, user_id: int) -> Optional[Dict]:
-        """Get user data by user_id"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-
-        cursor.execute("SELECT * FROM users WHERE user_id = ?", (user_id,))
-        result = cursor.fetchone()
-        conn.close()
+        """Get user data by user_id, served from the user cache when possible"""
+        cached = self.user_cache.get(user_id)
+        if cached is not None:
+            return dict(cached)
+
+        with self.pool.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                SELECT user_id, username, phone, city, registration_date, last_active,
+                       verification_status, reputation_score, is_blocked
+                FROM users WHERE user_id = ?
+            """, (user_id,))
+            result = cursor.fetchone()
 
         if result:
-            return {
+            user = {
                 'user_id': result[0], 'username': result[1], 'phone': result[2],
                 'city': result[3], 'registration_date': result[4],
                 'last_active': result[5], 'verification_status': result[6],
                 'reputation_score': result[7], 'is_blocked': result[8]
             }
+            self.user_cache.set(user_id, user)
+            return dict(user)
         return None
 
     def create_user(self, user_id: int, username: str, phone: str, city: str):
         """Create new user"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-
-        cursor.execute('''
-            INSERT INTO users (user_id, username, phone, city)
-            VALUES (?, ?, ?, ?)
-        ''', (user_id, username, phone, city))
-
-        conn.commit()
-        conn.close()
+        with self.pool.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                INSERT INTO users (user_id, username, phone, city, city_id, reputation_score)
+                VALUES (?, ?, ?, ?, ?, ?)
+            ''', (user_id, username, phone, city, gazetteer.city_id_for(city), self.reputation.score(0, 0)))
+            conn.commit()
+        self.user_cache.invalidate(user_id)
         logger.info(f"Created new user: {user_id}")
 
     def create_offer(self, user_id: int, offer_data: Dict) -> int:
         """Create new USDT offer"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-
-        cursor.execute('''
-            INSERT INTO offers (user_id, offer_type, amount, rate, min_order, 
-                              max_order, city, payment_methods, terms, expiry_date)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (
-            user_id, offer_data['type'], offer_data['amount'], offer_data['rate'],
-            offer_data['min_order'], offer_data['max_order'], offer_data['city'],
-            json.dumps(offer_data['payment_methods']), offer_data['terms'],
-            datetime.now() + timedelta(days=7)  # Expire after 7 days
-        ))
-
-        offer_id = cursor.lastrowid
-        conn.commit()
-        conn.close()
-
+        with self.pool.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                INSERT INTO offers (user_id, offer_type, amount, rate, min_order, 
+                                  max_order, city, city_id, payment_methods, terms, expiry_date)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', (
+                user_id, offer_data['type'], offer_data['amount'], offer_data['rate'],
+                offer_data['min_order'], offer_data['max_order'], offer_data['city'],
+                gazetteer.city_id_for(offer_data['city']),
+                json.dumps(offer_data['payment_methods']), offer_data['terms'],
+                utc_timestamp(datetime.now(timezone.utc) + timedelta(days=OFFER_EXPIRY_DAYS))
+            ))
+            offer_id = cursor.lastrowid
+            conn.commit()
+
+        offer = self.get_offer(offer_id)
+        if offer:
+            self.order_book.add(offer)
+            self.expiry_heap.push(offer['expiry_date'], offer_id)
+            self.record_rate(self.rate_history.record_offer, offer)
         logger.info(f"Created offer {offer_id} for user {user_id}")
         return offer_id
 
-    def get_offers(self, filters: Dict = None) -> List[Dict]:
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        query = '''
-        SELECT o.*, u.username, u.reputation_score
-        FROM offers o
-        JOIN users u ON o.user_id = u.user_id
-        WHERE o.status = 'ACTIVE' AND o.expiry_date > datetime('now')
+    def get_offer(self, offer_id: int) -> Optional[Dict]:
+        """Get a single offer with its owner's details"""
+        with self.pool.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(f'''
+                SELECT {OFFER_COLUMNS}
+                FROM offers o
+                JOIN users u ON o.user_id = u.user_id
+                WHERE o.offer_id = ?
+            ''', (offer_id,))
+            result = cursor.fetchone()
+        return self._offer_from_row(result) if result else None
+
+    def refresh_user_offers(self, user_id: int):
+        """Reload a user's active offers into the order book so cards pick up the new version"""
+        self.order_book.replace_user(user_id, self.get_offers({'user_id': user_id}))
+
+    def block_user(self, user_id: int) -> int:
+        """Block a user and deactivate all of their offers"""
+        with self.pool.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("UPDATE users SET is_blocked = 1 WHERE user_id = ?", (user_id,))
+            cursor.execute("UPDATE offers SET status = 'BLOCKED' WHERE user_id = ?", (user_id,))
+            conn.commit()
+
+        self.user_cache.invalidate(user_id)
+        removed = self.order_book.remove_user(user_id)
+        logger.info(f"Blocked user {user_id}, removed {len(removed)} offers from the order book")
+        return len(removed)
+
+    def expire_due_offers(self, now: Optional[str] = None) -> List[Dict]:
+        """Move every ACTIVE offer past its expiry date to EXPIRED in one statement"""
+        now = now or utc_timestamp()
+        with self.pool.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                UPDATE offers SET status = 'EXPIRED'
+                WHERE status = 'ACTIVE' AND expiry_date <= ?
+                RETURNING offer_id
+            ''', (now,))
+            offer_ids = [row[0] for row in cursor.fetchall()]
+            conn.commit()
+
+        self.expiry_heap.pop_due(now)
+        expired = []
+        for offer_id in offer_ids:
+            offer = self.order_book.remove(offer_id)
+            if offer:
+                expired.append(offer)
+        return expired
+
+    def get_top_traders(self, city_id: Optional[str] = None, limit: int = 10) -> List[Dict]:
+        """Most trusted traders, read in order from the leaderboard indexes"""
+        clause, params = "is_blocked = 0", []
+        if city_id:
+            clause += " AND city_id = ?"
+            params.append(city_id)
+        with self.pool.connection() as conn:
+            rows = conn.execute(f'''
+                SELECT user_id, username, city, reputation_score, tx_count, trades_completed
+                FROM users
+                WHERE {clause}
+                ORDER BY reputation_score DESC, tx_count DESC
+                LIMIT ?
+            ''', (*params, limit)).fetchall()
+        return [
+            {'user_id': row[0], 'username': row[1], 'city': row[2], 'reputation_score': row[3],
+             'tx_count': row[4], 'trades_completed': row[5]}
+            for row in rows
+        ]
+
+    @staticmethod
+    def _transaction_from_row(row) -> Dict:
+        return {
+            'transaction_id': row[0], 'buyer_id': row[1], 'seller_id': row[2], 'offer_id': row[3],
+            'amount': row[4], 'rate': row[5], 'total_inr': row[6], 'status': row[7],
+            'created_date': row[8], 'completed_date': row[9],
+            'buyer_confirmed': bool(row[10]), 'seller_confirmed': bool(row[11]),
+        }
+
+    def get_transaction(self, transaction_id: int) -> Optional[Dict]:
+        with self.pool.connection() as conn:
+            row = conn.execute(
+                f"SELECT {TRANSACTION_COLUMNS} FROM transactions t WHERE t.transaction_id = ?",
+                (transaction_id,)
+            ).fetchone()
+        return self._transaction_from_row(row) if row else None
+
+    def create_transaction(self, offer_id: int, taker_id: int, amount: float) -> Dict:
+        """Open a trade between an offer's owner and ``taker_id``; raises ValueError if not allowed"""
+        offer = self.order_book.get(offer_id)
+        if offer is None:
+            raise ValueError("That offer is no longer active.")
+        if offer['user_id'] == taker_id:
+            raise ValueError("You cannot trade on your own offer.")
+        if not offer['min_order'] <= amount <= offer['max_order']:
+            raise ValueError(f"Amount must be between {offer['min_order']} and {offer['max_order']} USDT.")
+        if offer['offer_type'] == "SELL":
+            buyer_id, seller_id = taker_id, offer['user_id']
+        else:
+            buyer_id, seller_id = offer['user_id'], taker_id
+        with self.pool.connection() as conn:
+            cursor = conn.execute('''
+                INSERT INTO transactions (buyer_id, seller_id, offer_id, amount, rate, total_inr)
+                VALUES (?, ?, ?, ?, ?, ?)
+            ''', (buyer_id, seller_id, offer_id, amount, offer['rate'], round(amount * offer['rate'], 2)))
+            transaction_id = cursor.lastrowid
+            conn.commit()
+        logger.info(f"Opened transaction {transaction_id} on offer {offer_id}")
+        return self.get_transaction(transaction_id)
+
+    def confirm_transaction(self, transaction_id: int, user_id: int) -> Optional[Dict]:
+        """Record one party's confirmation; the trade completes once both have confirmed.
+
+        Returns the updated transaction, or None if the user is not a party to an open trade.
+        """
+        with self.pool.connection() as conn:
+            cursor = conn.execute('''
+                UPDATE transactions SET
+                    buyer_confirmed = buyer_confirmed OR buyer_id = ?,
+                    seller_confirmed = seller_confirmed OR seller_id = ?
+                WHERE transaction_id = ? AND status = 'INITIATED' AND ? IN (buyer_id, seller_id)
+            ''', (user_id, user_id, transaction_id, user_id))
+            if cursor.rowcount == 0:
+                conn.rollback()
+                return None
+            completed = conn.execute('''
+                UPDATE transactions SET status = 'COMPLETED', completed_date = datetime('now')
+                WHERE transaction_id = ? AND buyer_confirmed AND seller_confirmed
+                RETURNING (SELECT city_id FROM offers WHERE offer_id = transactions.offer_id), rate, amount,
+                          completed_date
+            ''', (transaction_id,)).fetchone()
+            conn.commit()
+        if completed and completed[0]:
+            self.record_rate(self.rate_history.record_trade, *completed)
+        return self.get_transaction(transaction_id)
+
+    def record_rate(self, record, *args):
+        """Add an offer or trade to the rate history without letting a storage error fail the caller"""
+        try:
+            record(*args)
+        except (OSError, ValueError) as e:
+            logger.error(f"Could not record rate history: {e}")
+
+    @staticmethod
+    def _transaction_filter_clause(filters: Dict = None) -> Tuple[str, List]:
+        clause, params = "", []
+        if filters:
+            if filters.get('status'):
+                clause += " AND t.status = ?"
+                params.append(filters['status'])
+            if filters.get('since'):
+                clause += " AND t.created_date >= ?"
+                params.append(filters['since'])
+            if filters.get('until'):
+                clause += " AND t.created_date < ?"
+                params.append(filters['until'])
+        return clause, params
+
+    def _user_transactions_query(self, user_id: int, filters: Dict = None,
+                                 before: Optional[Tuple[str, int]] = None,
+                                 limit: Optional[int] = None) -> Tuple[str, List]:
+        """A user's trades as a UNION ALL of two index range reads (buyer side, seller side).
+
+        Each arm walks its (party, created_date, transaction_id) index newest first and stops
+        after ``limit`` rows, so a page costs the same for 10 or 10,000 trades. Self-trades only
+        appear in the buyer arm.
+        """
+        clause, params = self._transaction_filter_clause(filters)
+        if before is not None:
+            clause += " AND (t.created_date, t.transaction_id) < (?, ?)"
+            params += list(before)
+        order = " ORDER BY t.created_date DESC, t.transaction_id DESC"
+        if limit is not None:
+            order += " LIMIT ?"
+            params.append(limit)
+        query = f'''
+            SELECT * FROM (
+                SELECT {TRANSACTION_COLUMNS} FROM transactions t
+                WHERE t.buyer_id = ?{clause}{order}
+            )
+            UNION ALL
+            SELECT * FROM (
+                SELECT {TRANSACTION_COLUMNS} FROM transactions t
+                WHERE t.seller_id = ? AND t.buyer_id IS NOT ?{clause}{order}
+            )
         '''
+        return query, [user_id, *params, user_id, user_id, *params]
+
+    def get_transactions_page(self, user_id: int, filters: Dict = None,
+                              before: Optional[Tuple[str, int]] = None,
+                              limit: int = TRANSACTIONS_PAGE_SIZE) -> Tuple[List[Dict], bool]:
+        """One page of a user's trades, newest first, with the counterparty's username.
+
+        ``before`` is the (created_date, transaction_id) of the last trade on the previous page.
+        """
+        union, params = self._user_transactions_query(user_id, filters, before, limit + 1)
+        with self.pool.connection() as conn:
+            rows = conn.execute(f'''
+                SELECT x.*, u.username
+                FROM ({union}) x
+                LEFT JOIN users u
+                    ON u.user_id = CASE WHEN x.buyer_id = ? THEN x.seller_id ELSE x.buyer_id END
+                ORDER BY x.created_date DESC, x.transaction_id DESC
+                LIMIT ?
+            ''', (*params, user_id, limit + 1)).fetchall()
+        transactions = []
+        for row in rows[:limit]:
+            tx = self._transaction_from_row(row)
+            tx['side'] = "BUY" if tx['buyer_id'] == user_id else "SELL"
+            tx['counterparty'] = row[12]
+            transactions.append(tx)
+        return transactions, len(rows) > limit
+
+    def get_transaction_totals(self, user_id: int, filters: Dict = None) -> Dict:
+        """Trade count and USDT/INR totals per side for the same filters"""
+        union, params = self._user_transactions_query(user_id, filters)
+        with self.pool.connection() as conn:
+            row = conn.execute(f'''
+                SELECT COUNT(*),
+                       TOTAL(CASE WHEN buyer_id = ? THEN amount END),
+                       TOTAL(CASE WHEN buyer_id = ? THEN total_inr END),
+                       TOTAL(CASE WHEN buyer_id != ? THEN amount END),
+                       TOTAL(CASE WHEN buyer_id != ? THEN total_inr END)
+                FROM ({union})
+            ''', (user_id, user_id, user_id, user_id, *params)).fetchone()
+        return {
+            'count': row[0], 'bought_usdt': row[1], 'paid_inr': row[2],
+            'sold_usdt': row[3], 'received_inr': row[4],
+        }
+
+    def export_transactions_csv(self, user_id: int, filters: Dict = None, batch_size: int = 500):
+        """Write a user's trades, oldest first with running USDT/INR positions, to a temp file.
+
+        Rows are streamed from the cursor in batches straight to disk; the returned file is
+        positioned at the start and is deleted when the caller closes it.
+        """
+        union, params = self._user_transactions_query(user_id, filters)
+        output = tempfile.NamedTemporaryFile(mode="w+b", suffix=".csv")
+        text = io.TextIOWrapper(output, encoding="utf-8", newline="")
+        writer = csv.writer(text)
+        writer.writerow([
+            "transaction_id", "created_date", "completed_date", "side", "counterparty", "status",
+            "amount_usdt", "rate", "total_inr", "running_usdt", "running_inr",
+        ])
+        running_usdt = running_inr = 0.0
+        with self.pool.connection() as conn:
+            cursor = conn.execute(f'''
+                SELECT x.*, u.username
+                FROM ({union}) x
+                LEFT JOIN users u
+                    ON u.user_id = CASE WHEN x.buyer_id = ? THEN x.seller_id ELSE x.buyer_id END
+                ORDER BY x.created_date, x.transaction_id
+            ''', (*params, user_id))
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                for row in rows:
+                    tx = self._transaction_from_row(row)
+                    buying = tx['buyer_id'] == user_id
+                    amount, total = tx['amount'] or 0.0, tx['total_inr'] or 0.0
+                    # Only completed trades move the running position
+                    if tx['status'] == 'COMPLETED':
+                        running_usdt += amount if buying else -amount
+                        running_inr += -total if buying else total
+                    writer.writerow([
+                        tx['transaction_id'], tx['created_date'], tx['completed_date'] or "",
+                        "BUY" if buying else "SELL", row[12] or "", tx['status'],
+                        amount, tx['rate'], total, round(running_usdt, 6), round(running_inr, 2),
+                    ])
+        text.flush()
+        text.detach()
+        output.seek(0)
+        return output
+
+    def rate_transaction(self, transaction_id: int, rater_id: int, rating: int) -> Tuple[int, float]:
+        """Store a 1-5 rating of the other party of a completed trade.
+
+        Returns (rated_user_id, new reputation score); raises ValueError with a user-facing
+        reason if the trade is not completed, the rater is not a party, or they already rated it.
+        """
+        if not 1 <= rating <= 5:
+            raise ValueError("Rating must be between 1 and 5.")
+        with self.pool.connection() as conn:
+            row = conn.execute(
+                "SELECT buyer_id, seller_id, status FROM transactions WHERE transaction_id = ?", (transaction_id,)
+            ).fetchone()
+            if row is None or rater_id not in row[:2]:
+                raise ValueError("You were not part of this trade.")
+            if row[2] != 'COMPLETED':
+                raise ValueError("Only completed trades can be rated.")
+            if row[0] == row[1]:
+                raise ValueError("You cannot rate your own trade.")
+            rated_id = row[1] if rater_id == row[0] else row[0]
+            now = utc_timestamp()
+            cursor = conn.cursor()
+            try:
+                cursor.execute('''
+                    INSERT INTO ratings (transaction_id, rater_id, rated_user_id, rating, created_date)
+                    VALUES (?, ?, ?, ?, ?)
+                ''', (transaction_id, rater_id, rated_id, rating, now))
+            except sqlite3.IntegrityError:
+                conn.rollback()
+                raise ValueError("You have already rated this trade.")
+            score = self.reputation.apply(cursor, rated_id, rating, now)
+            conn.commit()
+        # Cards and cached profiles show the reputation; offers.version was bumped by trigger
+        self.user_cache.invalidate(rated_id)
+        self.refresh_user_offers(rated_id)
+        return rated_id, score
+
+    def decay_reputation(self) -> int:
+        """Age every rated user's score by the reputation half-life; returns users updated"""
+        with self.pool.connection() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            changed = self.reputation.decay_all(conn)
+            conn.commit()
+        for user_id in changed:
+            self.user_cache.invalidate(user_id)
+            self.refresh_user_offers(user_id)
+        return len(changed)
+
+    @staticmethod
+    def _alert_from_row(row) -> Dict:
+        return {
+            'alert_id': row[0], 'user_id': row[1], 'city_id': row[2], 'offer_type': row[3],
+            'direction': row[4], 'threshold': row[5], 'created_date': row[6], 'expiry_date': row[7],
+        }
+
+    def get_active_alerts(self, now: Optional[str] = None) -> List[Dict]:
+        with self.pool.connection() as conn:
+            rows = conn.execute(
+                f"SELECT {ALERT_COLUMNS} FROM price_alerts WHERE expiry_date > ?", (now or utc_timestamp(),)
+            ).fetchall()
+        return [self._alert_from_row(row) for row in rows]
+
+    def get_user_alerts(self, user_id: int) -> List[Dict]:
+        with self.pool.connection() as conn:
+            rows = conn.execute(f'''
+                SELECT {ALERT_COLUMNS} FROM price_alerts
+                WHERE user_id = ? AND expiry_date > ?
+                ORDER BY alert_id
+            ''', (user_id, utc_timestamp())).fetchall()
+        return [self._alert_from_row(row) for row in rows]
+
+    def create_alert(self, user_id: int, city_id: str, offer_type: str, direction: str, threshold: float) -> Dict:
+        """Subscribe a user to a price alert; raises ValueError with a user-facing reason"""
+        now = datetime.now(timezone.utc)
+        with self.pool.connection() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            count = conn.execute(
+                "SELECT COUNT(*) FROM price_alerts WHERE user_id = ? AND expiry_date > ?",
+                (user_id, utc_timestamp(now))
+            ).fetchone()[0]
+            if count >= ALERT_MAX_PER_USER:
+                conn.rollback()
+                raise ValueError(f"You already have {count} alerts. Remove one before adding another.")
+            row = conn.execute(f'''
+                INSERT INTO price_alerts (user_id, city_id, offer_type, direction, threshold, expiry_date)
+                VALUES (?, ?, ?, ?, ?, ?)
+                RETURNING {ALERT_COLUMNS}
+            ''', (user_id, city_id, offer_type, direction, threshold,
+                  utc_timestamp(now + timedelta(days=ALERT_EXPIRY_DAYS)))).fetchone()
+            conn.commit()
+        alert = self._alert_from_row(row)
+        self.alert_index.add(alert)
+        logger.info(f"Created price alert {alert['alert_id']} for user {user_id}")
+        return alert
+
+    def delete_alert(self, alert_id: int, user_id: int) -> bool:
+        with self.pool.connection() as conn:
+            deleted = conn.execute(
+                "DELETE FROM price_alerts WHERE alert_id = ? AND user_id = ?", (alert_id, user_id)
+            ).rowcount
+            conn.commit()
+        if deleted:
+            self.alert_index.remove(alert_id)
+        return bool(deleted)
+
+    def delete_expired_alerts(self, now: Optional[str] = None) -> int:
+        with self.pool.connection() as conn:
+            alert_ids = [row[0] for row in conn.execute(
+                "DELETE FROM price_alerts WHERE expiry_date <= ? RETURNING alert_id", (now or utc_timestamp(),)
+            ).fetchall()]
+            conn.commit()
+        for alert_id in alert_ids:
+            self.alert_index.remove(alert_id)
+        return len(alert_ids)
+
+    def subscribe(self, user_id: int, city_id: str, offer_types: List[str]) -> int:
+        """Subscribe a user to new offers in a city; returns how many subscriptions were added"""
+        with self.pool.connection() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            count = conn.execute(
+                "SELECT COUNT(*) FROM city_subscriptions WHERE user_id = ?", (user_id,)
+            ).fetchone()[0]
+            existing = {row[0] for row in conn.execute(
+                "SELECT offer_type FROM city_subscriptions WHERE user_id = ? AND city_id = ?", (user_id, city_id)
+            )}
+            new = [offer_type for offer_type in offer_types if offer_type not in existing]
+            if count + len(new) > SUBSCRIPTIONS_MAX_PER_USER:
+                conn.rollback()
+                raise ValueError(f"You can follow at most {SUBSCRIPTIONS_MAX_PER_USER} city/side combinations. "
+                                 "Use /unsubscribe first.")
+            conn.executemany(
+                "INSERT INTO city_subscriptions (city_id, offer_type, user_id) VALUES (?, ?, ?)",
+                [(city_id, offer_type, user_id) for offer_type in new]
+            )
+            conn.commit()
+        return len(new)
+
+    def unsubscribe(self, user_id: int, city_id: Optional[str] = None) -> int:
+        """Remove a user's subscriptions for one city, or all of them"""
+        with self.pool.connection() as conn:
+            if city_id is None:
+                removed = conn.execute("DELETE FROM city_subscriptions WHERE user_id = ?", (user_id,)).rowcount
+            else:
+                removed = conn.execute(
+                    "DELETE FROM city_subscriptions WHERE user_id = ? AND city_id = ?", (user_id, city_id)
+                ).rowcount
+            conn.commit()
+        return removed
+
+    def get_user_subscriptions(self, user_id: int) -> List[Tuple[str, str]]:
+        with self.pool.connection() as conn:
+            return conn.execute(
+                "SELECT city_id, offer_type FROM city_subscriptions WHERE user_id = ? ORDER BY city_id, offer_type",
+                (user_id,)
+            ).fetchall()
+
+    def get_subscriber_batch(self, city_id: str, offer_type: str, after_user_id: int = 0,
+                             limit: int = 500) -> List[int]:
+        """Next ``limit`` unblocked subscribers with user_id > ``after_user_id``, in id order"""
+        with self.pool.connection() as conn:
+            rows = conn.execute('''
+                SELECT s.user_id FROM city_subscriptions s
+                JOIN users u ON u.user_id = s.user_id
+                WHERE s.city_id = ? AND s.offer_type = ? AND s.user_id > ? AND u.is_blocked = 0
+                ORDER BY s.user_id
+                LIMIT ?
+            ''', (city_id, offer_type, after_user_id, limit)).fetchall()
+        return [row[0] for row in rows]
+
+    def reconcile_order_book(self) -> List[str]:
+        """Rebuild the order book (and its market totals) from SQLite if it has drifted"""
+        return self.order_book.reconcile(self.get_offers)
+
+    @staticmethod
+    def _offer_filter_clause(filters: Dict = None) -> Tuple[str, List]:
+        """Build the WHERE clause and parameters for get_offers"""
+        # Expired offers are moved out of ACTIVE by expire_due_offers, so no time predicate
+        clause = "o.status = 'ACTIVE'"
         params = []
 
         if filters:
-            if 'city' in filters:
-                query += " AND LOWER(o.city) LIKE ?"
-                params.append(f"%{filters['city'].lower()}%")
+            if 'city_id' in filters:
+                clause += " AND o.city_id = ?"
+                params.append(filters['city_id'])
+            elif 'city' in filters:
+                clause += " AND o.city_id = ?"
+                params.append(gazetteer.city_id_for(filters['city']))
             if 'offer_type' in filters:
-                query += " AND o.offer_type = ?"
+                clause += " AND o.offer_type = ?"
                 params.append(filters['offer_type'])
             if 'min_amount' in filters:
-                query += " AND o.amount >= ?"
+                clause += " AND o.amount >= ?"
                 params.append(filters['min_amount'])
             if 'max_rate' in filters:
-                query += " AND o.rate <= ?"
+                clause += " AND o.rate <= ?"
                 params.append(filters['max_rate'])
             if 'user_id' in filters:
-                query += " AND o.user_id = ?"
+                clause += " AND o.user_id = ?"
                 params.append(filters['user_id'])
 
-        query += " ORDER BY o.created_date DESC"
-        cursor.execute(query, params)
-        results = cursor.fetchall()
-        conn.close()
+        return clause, params
+
+    @staticmethod
+    def _offer_from_row(result) -> Dict:
+        return {
+            'offer_id': result[0], 'user_id': result[1], 'offer_type': result[2],
+            'amount': result[3], 'rate': result[4], 'min_order': result[5],
+            'max_order': result[6], 'city': result[7],
+            'payment_methods': json.loads(result[8]), 'terms': result[9],
+            'created_date': result[10], 'status': result[11],
+            'username': result[12], 'reputation_score': result[13],
+            'expiry_date': result[14], 'city_id': result[15], 'version': result[16],
+        }
+
+    def get_offers(self, filters: Dict = None) -> List[Dict]:
+        clause, params = self._offer_filter_clause(filters)
+        query = f'''
+        SELECT {OFFER_COLUMNS}
+        FROM offers o
+        JOIN users u ON o.user_id = u.user_id
+        WHERE {clause}
+        ORDER BY o.created_date DESC
+        '''
+        with self.pool.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(query, params)
+            results = cursor.fetchall()
+
+        return [self._offer_from_row(result) for result in results]
+
+    # Awaitable wrappers used by the bot handlers so queries never block the event loop
+
+    async def get_user_async(self, user_id: int) -> Optional[Dict]:
+        return await self.run(self.get_user, user_id)
+
+    async def create_user_async(self, user_id: int, username: str, phone: str, city: str):
+        return await self.run(self.create_user, user_id, username, phone, city)
+
+    async def create_offer_async(self, user_id: int, offer_data: Dict) -> int:
+        return await self.run(self.create_offer, user_id, offer_data)
 
-        offers = []
-        for result in results:
-            offers.append({
-                'offer_id': result[0], 'user_id': result[1], 'offer_type': result[2],
-                'amount': result[3], 'rate': result[4], 'min_order': result[5],
-                'max_order': result[6], 'city': result[7],
-                'payment_methods': json.loads(result[8]), 'terms': result[9],
-                'created_date': result[10], 'username': result[12],
-                'reputation_score': result[13],
-                'status': result[11] if len(result) > 11 else 'ACTIVE',
-            })
+    async def get_offers_async(self, filters: Dict = None) -> List[Dict]:
+        return await self.run(self.get_offers, filters)
 
-        return offers
+    async def block_user_async(self, user_id: int) -> int:
+        return await self.run(self.block_user, user_id)
+
+    async def create_transaction_async(self, offer_id: int, taker_id: int, amount: float) -> Dict:
+        return await self.run(self.create_transaction, offer_id, taker_id, amount)
+
+    async def confirm_transaction_async(self, transaction_id: int, user_id: int) -> Optional[Dict]:
+        return await self.run(self.confirm_transaction, transaction_id, user_id)
+
+    async def get_transactions_page_async(self, user_id: int, filters: Dict = None,
+                                          before: Optional[Tuple[str, int]] = None,
+                                          limit: int = TRANSACTIONS_PAGE_SIZE) -> Tuple[List[Dict], bool]:
+        return await self.run(self.get_transactions_page, user_id, filters, before, limit)
+
+    async def get_transaction_totals_async(self, user_id: int, filters: Dict = None) -> Dict:
+        return await self.run(self.get_transaction_totals, user_id, filters)
+
+    async def rate_transaction_async(self, transaction_id: int, rater_id: int, rating: int) -> Tuple[int, float]:
+        return await self.run(self.rate_transaction, transaction_id, rater_id, rating)
+
+    async def get_user_alerts_async(self, user_id: int) -> List[Dict]:
+        return await self.run(self.get_user_alerts, user_id)
+
+    async def create_alert_async(self, user_id: int, city_id: str, offer_type: str, direction: str,
+                                 threshold: float) -> Dict:
+        return await self.run(self.create_alert, user_id, city_id, offer_type, direction, threshold)
+
+    async def delete_alert_async(self, alert_id: int, user_id: int) -> bool:
+        return await self.run(self.delete_alert, alert_id, user_id)
+
+    async def subscribe_async(self, user_id: int, city_id: str, offer_types: List[str]) -> int:
+        return await self.run(self.subscribe, user_id, city_id, offer_types)
+
+    async def unsubscribe_async(self, user_id: int, city_id: Optional[str] = None) -> int:
+        return await self.run(self.unsubscribe, user_id, city_id)
+
+    async def get_user_subscriptions_async(self, user_id: int) -> List[Tuple[str, str]]:
+        return await self.run(self.get_user_subscriptions, user_id)
+
+    async def get_top_traders_async(self, city_id: Optional[str] = None, limit: int = 10) -> List[Dict]:
+        return await self.run(self.get_top_traders, city_id, limit)
 
 class USDTExchangeBot:
     """Main bot class"""
@@ -253,9 +841,85 @@ class USDTExchangeBot:
     def __init__(self, token: str):
         self.token = token
         self.db = DatabaseManager(DATABASE_PATH)
-        self.application = Application.builder().token(token).build()
+        self.application = (
+            Application.builder()
+            .token(token)
+            # Parallel across chats, strictly ordered within a chat
+            .concurrent_updates(PerChatUpdateProcessor(MAX_CONCURRENT_UPDATES, MAX_PENDING_UPDATES))
+            # Conversations and user_data survive restarts
+            .persistence(SQLitePersistence(self.db, PERSISTENCE_FLUSH_INTERVAL))
+            .post_init(self.on_startup)
+            .post_shutdown(self.on_shutdown)
+            .build()
+        )
+        self.outbox = OutboundQueue(
+            self.application.bot,
+            global_rate=OUTBOX_GLOBAL_RATE,
+            chat_rate=OUTBOX_CHAT_RATE,
+            chat_burst=OUTBOX_CHAT_BURST,
+            group_rate=OUTBOX_GROUP_RATE,
+        )
+        self.cards = OfferCardCache(RENDER_CACHE_BYTES)
+        self.matcher = MatchingEngine(self.db.order_book)
+        self.alerts = PriceAlertNotifier(self.db, self.outbox, self.cards)
+        if NOTIFY_PRICE_ALERTS:
+            self.alerts.schedule(self.application.job_queue)
+        self.fanout = NewOfferFanout(self.db, self.outbox, self.cards)
+        self.backups = BackupManager(DATABASE_PATH)
+        self.backups.schedule(self.application.job_queue)
+        self.application.job_queue.run_repeating(
+            self.trim_rate_history, interval=RATE_HISTORY_RETENTION_INTERVAL, first=RATE_HISTORY_RETENTION_INTERVAL,
+            name="rate_history_retention"
+        )
+        self.application.job_queue.run_repeating(
+            self.reconcile_market, interval=MARKET_RECONCILE_INTERVAL, first=MARKET_RECONCILE_INTERVAL,
+            name="order_book_reconcile"
+        )
+        if REPUTATION_HALF_LIFE_DAYS:
+            self.application.job_queue.run_repeating(
+                self.decay_reputation, interval=REPUTATION_DECAY_INTERVAL, first=REPUTATION_DECAY_INTERVAL,
+                name="reputation_decay"
+            )
+        self.expiry_scheduler = OfferExpiryScheduler(self.db, EXPIRY_CHECK_INTERVAL, self.outbox)
+        self.expiry_scheduler.schedule(self.application.job_queue)
         self.setup_handlers()
 
+    async def on_startup(self, application: Application):
+        """Start background storage and sending tasks once the event loop is running"""
+        await self.db.writes.start()
+        await self.outbox.start()
+
+    async def reconcile_market(self, context: ContextTypes.DEFAULT_TYPE):
+        """Periodic check of the in-memory order book and market stats against SQLite"""
+        problems = await self.db.run(self.db.reconcile_order_book)
+        if problems:
+            logger.warning(f"Order book drifted from the database, rebuilt it: {'; '.join(problems[:5])}"
+                           + (f" (+{len(problems) - 5} more)" if len(problems) > 5 else ""))
+
+    async def decay_reputation(self, context: ContextTypes.DEFAULT_TYPE):
+        """Periodic decay of reputation scores so they age without new ratings"""
+        changed = await self.db.run(self.db.decay_reputation)
+        if changed:
+            logger.info(f"Decayed reputation scores of {changed} users")
+
+    async def trim_rate_history(self, context: ContextTypes.DEFAULT_TYPE):
+        """Apply rate history retention and flush the series to disk"""
+        trimmed = await self.db.run(self.db.rate_history.apply_retention)
+        if trimmed:
+            logger.info(f"Trimmed {trimmed} expired rate history buckets")
+
+    async def on_shutdown(self, application: Application):
+        """Drain queued messages, flush buffered writes and release database resources once the application has stopped"""
+        await self.fanout.stop()
+        await self.outbox.stop()
+        await self.db.writes.stop()
+        self.db.close()
+
+    async def track_activity(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Record last_active for every update through the write-behind queue"""
+        if update.effective_user:
+            self.db.writes.touch_user(update.effective_user.id)
+
     def get_main_menu_keyboard(self):
         """Get main menu as a reply keyboard"""
         keyboard = [
@@ -267,6 +931,8 @@ class USDTExchangeBot:
 
     def setup_handlers(self):
         """Setup all bot handlers"""
+        # Runs before every other handler group without stopping them
+        self.application.add_handler(TypeHandler(Update, self.track_activity), group=-1)
         # Registration conversation handler
         registration_conv = ConversationHandler(
             entry_points=[CommandHandler("start", self.start_command)],
@@ -274,7 +940,9 @@ class USDTExchangeBot:
                 REGISTRATION_PHONE: [MessageHandler(filters.CONTACT, self.handle_phone)],
                 REGISTRATION_LOCATION: [MessageHandler(filters.TEXT, self.handle_location)]
             },
-            fallbacks=[CommandHandler("cancel", self.cancel)]
+            fallbacks=[CommandHandler("cancel", self.cancel)],
+            name="registration",
+            persistent=True
         )
         # Offer creation conversation handler
         offer_conv = ConversationHandler(
@@ -291,7 +959,9 @@ class USDTExchangeBot:
                 OFFER_LOCATION: [MessageHandler(filters.TEXT, self.handle_offer_location)],
                 OFFER_TERMS: [MessageHandler(filters.TEXT, self.handle_offer_terms)]
             },
-            fallbacks=[CommandHandler("cancel", self.cancel)]
+            fallbacks=[CommandHandler("cancel", self.cancel)],
+            name="offer_creation",
+            persistent=True
         )
         # Offer browsing conversation handler
         offer_browse_conv = ConversationHandler(
@@ -302,7 +972,9 @@ class USDTExchangeBot:
             states={
                 BROWSE_FILTER: [MessageHandler(filters.TEXT, self.handle_browse_city)],
             },
-            fallbacks=[CommandHandler("cancel", self.cancel)]
+            fallbacks=[CommandHandler("cancel", self.cancel)],
+            name="browse",
+            persistent=True
         )
         # My Listings conversation handler
         my_listings_conv = ConversationHandler(
@@ -320,13 +992,20 @@ class USDTExchangeBot:
         self.application.add_handler(my_listings_conv)
         self.application.add_handler(CallbackQueryHandler(self.handle_callback))
         self.application.add_handler(CommandHandler("help", self.help_command))
+        self.application.add_handler(CommandHandler("top", self.top_command))
+        self.application.add_handler(CommandHandler("rates", self.rates_command))
+        self.application.add_handler(CommandHandler("trade", self.trade_command))
+        self.application.add_handler(CommandHandler("alert", self.alert_command))
+        self.application.add_handler(CommandHandler("subscribe", self.subscribe_command))
+        self.application.add_handler(CommandHandler("unsubscribe", self.unsubscribe_command))
         self.application.add_handler(CommandHandler("menu", self.show_main_menu))
+        add_admin_handlers(self.application, self.db, self.outbox)
         self.application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, self.handle_menu_commands))
 
     async def start_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handle /start command"""
         user = update.effective_user
-        db_user = self.db.get_user(user.id)
+        db_user = await self.db.get_user_async(user.id)
         if db_user:
             await update.message.reply_text(
                 f"Welcome back, {user.first_name}! 👋\n\nWhat would you like to do today?",
@@ -359,14 +1038,33 @@ class USDTExchangeBot:
         )
         return REGISTRATION_LOCATION
 
+    async def confirmed_city(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> Optional[str]:
+        """Display name of the city the user typed, or None after asking about a likely typo"""
+        city_raw = update.message.text.strip()
+        key = normalize_city_name(city_raw)
+        # Sending the same name twice keeps it as written (a town missing from the gazetteer)
+        confirmed = context.user_data.pop('unconfirmed_city', None) == key
+        if not confirmed and gazetteer.resolve(city_raw) is None:
+            suggestions = gazetteer.suggest(city_raw, min_score=FUZZY_THRESHOLD)
+            if suggestions:
+                context.user_data['unconfirmed_city'] = key
+                await update.message.reply_text(
+                    f"Did you mean {' or '.join(suggestions)}? Send the correct name, "
+                    f"or send {city_raw} again to use it as written."
+                )
+                return None
+        return gazetteer.display_name(city_raw)
+
     async def handle_location(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handle location registration"""
         user = update.effective_user
-        city = update.message.text.strip()
+        city = await self.confirmed_city(update, context)
+        if city is None:
+            return REGISTRATION_LOCATION
         phone = context.user_data.get('phone')
 
         # Create user in database
-        self.db.create_user(user.id, user.username or user.first_name, phone, city)
+        await self.db.create_user_async(user.id, user.username or user.first_name, phone, city)
 
         await update.message.reply_text(
             f"Perfect! You're all set up in {city}. 🎉\n\n"
@@ -515,7 +1213,9 @@ class USDTExchangeBot:
 
     async def handle_offer_location(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handle main city for offer"""
-        city = update.message.text.strip().lower()
+        city = await self.confirmed_city(update, context)
+        if city is None:
+            return OFFER_LOCATION
         context.user_data['offer']['city'] = city
 
         await update.message.reply_text(
@@ -524,48 +1224,10 @@ class USDTExchangeBot:
         )
         return OFFER_TERMS
 
-    def format_offer_details_html(self, offer, include_user=True, include_id=False):
-        """Format offer details using HTML"""
-        emoji = "💰" if offer['offer_type'] == "SELL" else "🔄"
-        action = "Selling" if offer['offer_type'] == "SELL" else "Buying"
-        try:
-            rep_score = float(offer['reputation_score'])
-            rep_str = f"⭐{rep_score:.1f}"
-        except Exception:
-            rep_str = str(offer['reputation_score'])
-        details = (
-            f"{emoji} <b>{action} {offer['amount']} USDT</b>\n"
-            f"Rate: ₹{offer['rate']} per USDT\n"
-            f"Range: {offer['min_order']}-{offer['max_order']} USDT\n"
-        )
-        if include_user:
-            details += f"By: @{offer['username']} ({rep_str})\n"
-        details += f"Location: {offer['city'].capitalize()}\n"
-        if include_id:
-            details += f"Offer ID: #{offer['offer_id']}\n"
-        return details
-
     def format_offer_with_contact_html(self, offer):
-        """Format offer details with contact button using HTML"""
-        emoji = "💰" if offer['offer_type'] == "SELL" else "🔄"
-        action = "Selling" if offer['offer_type'] == "SELL" else "Buying"
-        try:
-            rep_score = float(offer['reputation_score'])
-            rep_str = f"⭐{rep_score:.1f}"
-        except Exception:
-            rep_str = str(offer['reputation_score'])
-        text = (
-            f"{emoji} <b>{action} {offer['amount']} USDT</b>\n"
-            f"Rate: ₹{offer['rate']} per USDT\n"
-            f"Range: {offer['min_order']}-{offer['max_order']} USDT\n"
-            f"By: @{offer['username']} ({rep_str})\n"
-            f"Location: {offer['city'].capitalize()}\n"
-            f"Offer ID: #{offer['offer_id']}\n"
-        )
-        keyboard = [[
-            InlineKeyboardButton("💬 Contact User", callback_data=f"contact_{offer['user_id']}")
-        ]]
-        return text, InlineKeyboardMarkup(keyboard)
+        """Format offer details with contact button using HTML (cached per offer version)"""
+        card = self.cards.get(offer)
+        return card.text, card.reply_markup
 
     async def handle_offer_terms(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handle additional terms and create offer"""
@@ -581,7 +1243,10 @@ class USDTExchangeBot:
             offer['terms'] = f"Area/Locality: {area_or_terms}" if area_or_terms else ""
 
         # Create offer in database
-        offer_id = self.db.create_offer(update.effective_user.id, offer)
+        offer_id = await self.db.create_offer_async(update.effective_user.id, offer)
+        created = self.db.order_book.get(offer_id)
+        if created:
+            self.cards.get(created)  # render the card once, before the first browse
         offer_type_text = "Selling" if offer['type'] == "SELL" else "Buying"
 
         # Send confirmation with proper escaping and error handling
@@ -591,7 +1256,7 @@ class USDTExchangeBot:
                 f"{offer_type_text}: {offer['amount']} USDT\n"
                 f"Rate: ₹{offer['rate']} per USDT\n"
                 f"Order Range: {offer['min_order']} - {offer['max_order']} USDT\n"
-                f"City: {offer['city'].capitalize()}\n"
+                f"City: {offer['city']}\n"
                 f"Payment Methods: {', '.join(offer['payment_methods'])}\n"
                 f"Terms/Area: {offer['terms'] or 'None'}\n\n"
                 f"Your offer is now live! Others can see and contact you.\n"
@@ -606,6 +1271,18 @@ class USDTExchangeBot:
                 reply_markup=self.get_main_menu_keyboard()
             )
 
+        # Tell both sides about counter-offers this one could trade with right away
+        if created:
+            matches = self.matcher.find(created)
+            if matches:
+                logger.info(f"Offer {offer_id} matches offers {[m.counter['offer_id'] for m in matches]}")
+                self.matcher.notify(self.outbox, matches)
+            if NOTIFY_PRICE_ALERTS:
+                self.alerts.offer_posted(created)
+            if NOTIFY_NEW_OFFERS:
+                # Delivered by a background task; this reply does not wait for it
+                self.fanout.offer_posted(created)
+
         # Clear offer data
         context.user_data.pop('offer', None)
         return ConversationHandler.END
@@ -640,49 +1317,96 @@ class USDTExchangeBot:
 
     async def handle_browse_city(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         city_raw = update.message.text.strip()
-        city = city_raw.lower()  # for DB filtering
-        offers = self.db.get_offers({'city': city})
+        city_id = gazetteer.city_id_for(city_raw)
+        offer_type = "SELL"
+        offers, has_more = self.db.order_book.page(city_id, offer_type, limit=BROWSE_PAGE_SIZE)
+        if not offers:
+            offer_type = "BUY"
+            offers, has_more = self.db.order_book.page(city_id, offer_type, limit=BROWSE_PAGE_SIZE)
         if not offers:
+            hint = ""
+            if gazetteer.resolve(city_raw) is None:
+                suggestions = gazetteer.suggest(city_raw)
+                if suggestions:
+                    hint = f"\n\nDid you mean: {', '.join(suggestions)}?"
             await update.message.reply_text(
-                f"No active offers found in {city_raw} 😔\n\nTry posting your own offer or check back later!",
+                f"No active offers found in {gazetteer.display_name(city_raw)} 😔\n\n"
+                f"Try posting your own offer or check back later!{hint}",
                 parse_mode='HTML',
                 reply_markup=self.get_main_menu_keyboard()
             )
             return ConversationHandler.END
-        await update.message.reply_text(
-            f"🔍 <b>Active Offers in {city_raw.capitalize()}</b>\n\nFound {len(offers)} offers. Click on any offer to contact the user:",
-            parse_mode='HTML'
-        )
-        for offer in offers[:5]:
-            text, reply_markup = self.format_offer_with_contact_html(offer)
-            await update.message.reply_text(
-                text,
-                parse_mode='HTML',
-                reply_markup=reply_markup
-            )
-        await update.message.reply_text(
-            "That's all for now!",
-            reply_markup=self.get_main_menu_keyboard()
-        )
+        context.user_data['browse_city'] = city_id
+        text, reply_markup = self.render_browse_page(city_id, offer_type, offers, has_next=has_more, has_prev=False)
+        self.outbox.send_message(update.effective_chat.id, text, parse_mode='HTML', reply_markup=reply_markup)
         return ConversationHandler.END
 
+    def render_browse_page(self, city_id: str, offer_type: str, offers: List[Dict], has_next: bool, has_prev: bool):
+        """Render one page of offers as a single message and count the views"""
+        text, reply_markup, shown = render_browse_page(
+            gazetteer.display_name(city_id), offer_type, offers, has_next, has_prev, self.cards)
+        for offer in shown:
+            self.db.writes.count_view(offer['offer_id'])
+        return text, reply_markup
+
+    async def handle_browse_page(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Handle Next/Prev, refresh and buyer/seller toggle buttons by editing the page in place"""
+        query = update.callback_query
+        await query.answer()
+        city = context.user_data.get('browse_city')
+        action, _, token = query.data[len("browse_"):].partition("_")
+        if not city:
+            await query.edit_message_text("This list has expired. Please browse again.")
+            return
+
+        if action == "side":
+            offer_type = "BUY" if token == "BUY" else "SELL"
+            offers, has_more = self.db.order_book.page(city, offer_type, limit=BROWSE_PAGE_SIZE)
+            has_next, has_prev = has_more, False
+        else:
+            cursor = decode_offer_cursor(token)
+            if cursor is None:
+                await query.edit_message_text("This list has expired. Please browse again.")
+                return
+            offer_type, rate, offer_id = cursor
+            if action == "next":
+                offers, has_more = self.db.order_book.page(
+                    city, offer_type, after=(rate, offer_id), limit=BROWSE_PAGE_SIZE)
+                has_next, has_prev = has_more, True
+            else:
+                offers, has_more = self.db.order_book.page(
+                    city, offer_type, before=(rate, offer_id), limit=BROWSE_PAGE_SIZE)
+                has_next, has_prev = True, has_more
+
+        if offers:
+            text, reply_markup = self.render_browse_page(city, offer_type, offers, has_next, has_prev)
+        else:
+            text = "No more offers. Start again from the best rates:"
+            reply_markup = InlineKeyboardMarkup([[
+                InlineKeyboardButton("💰 Sellers", callback_data="browse_side_SELL"),
+                InlineKeyboardButton("🔄 Buyers", callback_data="browse_side_BUY"),
+            ]])
+        try:
+            await query.edit_message_text(text, parse_mode='HTML', reply_markup=reply_markup)
+        except BadRequest as e:
+            # Refreshing an unchanged page is not an error
+            if "not modified" not in str(e).lower():
+                raise
+
     async def handle_contact_user(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handle contact user button click"""
         query = update.callback_query
-        await query.answer()
         user_id = int(query.data.split("_")[1])
-        user = self.db.get_user(user_id)
+        self.db.writes.audit(update.effective_user.id, "contact", str(user_id))
+        user = await self.db.get_user_async(user_id)
         if not user:
-            await query.edit_message_text(
-                "User not found. They may have deleted their account.",
-                reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("🔙 Back", callback_data="browse_offers")]])
-            )
+            await query.answer("User not found. They may have deleted their account.", show_alert=True)
             return
-        keyboard = [
-            [InlineKeyboardButton("💬 Send Message", url=f"tg://user?id={user_id}")],
-            [InlineKeyboardButton("🔙 Back to Offers", callback_data="browse_offers")]
-        ]
-        await query.edit_message_text(
+        await query.answer()
+        # Reply below the list so a multi-offer browse page stays usable
+        keyboard = [[InlineKeyboardButton("💬 Send Message", url=f"tg://user?id={user_id}")]]
+        self.outbox.send_message(
+            update.effective_chat.id,
             f"Contacting: <b>@{user['username'] or 'User'}</b>\n\n"
             f"Location: {user['city']}\n"
             f"Reputation: ⭐{user['reputation_score']}\n\n"
@@ -691,11 +1415,18 @@ class USDTExchangeBot:
             reply_markup=InlineKeyboardMarkup(keyboard)
         )
 
+    def queue_listings(self, chat_id: int, offers: List[Dict]):
+        """Queue one card per offer and the closing message without waiting on Telegram's pacing"""
+        for offer in offers:
+            text, reply_markup = self.format_offer_with_contact_html(offer)
+            self.outbox.send_message(chat_id, text, parse_mode='HTML', reply_markup=reply_markup)
+        self.outbox.send_message(chat_id, "That's all your listings!", reply_markup=self.get_main_menu_keyboard())
+
     async def show_my_listings(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         query = update.callback_query
         await query.answer()  # Acknowledge the callback
         user_id = update.effective_user.id
-        offers = self.db.get_offers({'user_id': user_id})
+        offers = await self.db.get_offers_async({'user_id': user_id})
         if not offers:
             await query.edit_message_text(
                 "You have no active listings.\n\nUse 'Post USDT Offer' to create one!",
@@ -706,22 +1437,12 @@ class USDTExchangeBot:
             f"📊 <b>My Active Listings</b>\n\nYou have {len(offers)} active offers:",
             parse_mode='HTML'
         )
-        for offer in offers:
-            text, reply_markup = self.format_offer_with_contact_html(offer)
-            await update.effective_message.reply_text(
-                text,
-                parse_mode='HTML',
-                reply_markup=reply_markup
-            )
-        await update.effective_message.reply_text(
-            "That's all your listings!",
-            reply_markup=self.get_main_menu_keyboard()
-        )
+        self.queue_listings(update.effective_chat.id, offers)
 
     async def show_my_listings_from_menu(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Show user's listings from the main menu (reply keyboard)"""
         user_id = update.effective_user.id
-        offers = self.db.get_offers({'user_id': user_id})
+        offers = await self.db.get_offers_async({'user_id': user_id})
         if not offers:
             await update.message.reply_text(
                 "You have no active listings.\n\nUse 'Post USDT Offer' to create one!",
@@ -732,17 +1453,7 @@ class USDTExchangeBot:
             f"📊 <b>My Active Listings</b>\n\nYou have {len(offers)} active offers:",
             parse_mode='HTML'
         )
-        for offer in offers:
-            text, reply_markup = self.format_offer_with_contact_html(offer)
-            await update.message.reply_text(
-                text,
-                parse_mode='HTML',
-                reply_markup=reply_markup
-            )
-        await update.message.reply_text(
-            "That's all your listings!",
-            reply_markup=self.get_main_menu_keyboard()
-        )
+        self.queue_listings(update.effective_chat.id, offers)
 
     async def handle_callback(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         query = update.callback_query
@@ -760,6 +1471,16 @@ class USDTExchangeBot:
             await self.show_my_listings(update, context)
         elif data.startswith("contact_"):
             await self.handle_contact_user(update, context)
+        elif data.startswith(("browse_next_", "browse_prev_", "browse_side_")):
+            await self.handle_browse_page(update, context)
+        elif data.startswith("txh_"):
+            await self.handle_transactions_callback(update, context)
+        elif data.startswith("trade_done_"):
+            await self.handle_trade_done(update, context)
+        elif data.startswith("rate_"):
+            await self.handle_rating(update, context)
+        elif data.startswith("alert_del_"):
+            await self.handle_alert_delete(update, context)
         # Add more callback handlers as needed
 
     async def help_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -767,6 +1488,13 @@ class USDTExchangeBot:
         help_text = '''
 🤖 <b>USDT-INR Exchange Bot Help</b>
 <b>Commands:</b>
+/trade &lt;offer_id&gt; &lt;amount&gt; - Open a trade on an offer
+/top [city] - Most trusted traders
+/rates [city] - Best bid/ask, spread and average rates
+/alert &lt;city&gt; &lt;sell|buy&gt; &lt;below|above&gt; &lt;rate&gt; - Get notified about new offers at your price
+/alert - List and remove your price alerts
+/subscribe &lt;city&gt; [sell|buy] - Get notified about new offers in a city
+/unsubscribe [city] - Stop new-offer notifications
         '''
         if update.callback_query:
             await update.callback_query.edit_message_text(
@@ -783,6 +1511,351 @@ class USDTExchangeBot:
                 reply_markup=self.get_main_menu_keyboard()
             )
 
+    def trade_keyboard(self, transaction_id: int):
+        return InlineKeyboardMarkup([[
+            InlineKeyboardButton("✅ Trade completed", callback_data=f"trade_done_{transaction_id}")
+        ]])
+
+    async def trade_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Handle /trade <offer_id> <amount>: open a trade on someone's offer"""
+        try:
+            offer_id = int(context.args[0].lstrip("#"))
+            amount = float(context.args[1])
+        except (IndexError, ValueError):
+            await update.message.reply_text("Usage: /trade <offer_id> <amount in USDT>")
+            return
+        try:
+            tx = await self.db.create_transaction_async(offer_id, update.effective_user.id, amount)
+        except ValueError as e:
+            await update.message.reply_text(f"❌ {e}")
+            return
+        owner_id = tx['seller_id'] if tx['buyer_id'] == update.effective_user.id else tx['buyer_id']
+        summary = (
+            f"Trade #{tx['transaction_id']} on offer #{offer_id}\n"
+            f"{tx['amount']} USDT at ₹{tx['rate']} = ₹{tx['total_inr']:,.2f}\n\n"
+        )
+        await update.message.reply_text(
+            f"🤝 <b>{summary}</b>Meet and pay as agreed, then press the button once the trade is done. "
+            "It completes when both sides confirm.",
+            parse_mode='HTML',
+            reply_markup=self.trade_keyboard(tx['transaction_id'])
+        )
+        username = html.escape(update.effective_user.username or 'a user')
+        self.outbox.send_message(
+            owner_id,
+            f"🤝 <b>@{username} opened a trade</b>\n\n{summary}"
+            "Press the button once the trade is done.",
+            parse_mode='HTML',
+            reply_markup=self.trade_keyboard(tx['transaction_id'])
+        )
+
+    async def handle_trade_done(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Handle a party confirming a trade; ask both for ratings once it completes"""
+        query = update.callback_query
+        transaction_id = int(query.data[len("trade_done_"):])
+        tx = await self.db.confirm_transaction_async(transaction_id, update.effective_user.id)
+        if tx is None:
+            await query.answer("This trade is already closed.", show_alert=True)
+            return
+        await query.answer()
+        if tx['status'] != 'COMPLETED':
+            await query.edit_message_text(
+                f"✅ You confirmed trade #{transaction_id}. Waiting for the other side to confirm."
+            )
+            return
+        await query.edit_message_text(f"🎉 Trade #{transaction_id} is complete!")
+        if not ENABLE_USER_RATINGS:
+            return
+        for user_id in {tx['buyer_id'], tx['seller_id']}:
+            keyboard = [[
+                InlineKeyboardButton("⭐" * stars, callback_data=f"rate_{transaction_id}_{stars}")
+                for stars in range(1, 6)
+            ]]
+            self.outbox.send_message(
+                user_id,
+                f"How was your trade #{transaction_id}? Rate the other trader:",
+                reply_markup=InlineKeyboardMarkup(keyboard)
+            )
+
+    async def handle_rating(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Handle a rating button after a completed trade"""
+        query = update.callback_query
+        _, transaction_id, stars = query.data.split("_")
+        try:
+            await self.db.rate_transaction_async(int(transaction_id), update.effective_user.id, int(stars))
+        except ValueError as e:
+            await query.answer(str(e), show_alert=True)
+            return
+        await query.answer()
+        await query.edit_message_text(f"Thanks! You rated trade #{transaction_id} {'⭐' * int(stars)}.")
+
+    @staticmethod
+    def transaction_filters(context: ContextTypes.DEFAULT_TYPE) -> Dict:
+        """DB filters for the My Transactions view from the user's chosen status/period"""
+        choice = context.user_data.get('tx_filter', {})
+        filters = {'status': choice.get('status')}
+        if choice.get('days'):
+            filters['since'] = utc_timestamp(datetime.now(timezone.utc) - timedelta(days=choice['days']))
+        return filters
+
+    async def show_transactions(self, update: Update, context: ContextTypes.DEFAULT_TYPE,
+                                before: Optional[Tuple[str, int]] = None):
+        """Show a page of the user's trade history; edits the message when paging from a button"""
+        user_id = update.effective_user.id
+        filters = self.transaction_filters(context)
+        transactions, has_more = await self.db.get_transactions_page_async(user_id, filters, before)
+        # Totals cover every page; compute them when the view opens, not for each page.
+        # Stored as plain JSON so the cache still matches after a persistence round trip.
+        choice = context.user_data.get('tx_filter', {})
+        key = {'status': choice.get('status'), 'days': choice.get('days')}
+        cached = context.user_data.get('tx_totals')
+        if before is None or not isinstance(cached, dict) or cached.get('filter') != key:
+            cached = context.user_data['tx_totals'] = {
+                'filter': key, 'totals': await self.db.get_transaction_totals_async(user_id, filters)}
+        totals = cached['totals']
+
+        lines = ["💰 <b>My Transactions</b>\n"]
+        if not transactions:
+            lines.append("No trades match these filters yet." if before is None else "No older trades.")
+        for tx in transactions:
+            action = "🟢 Bought" if tx['side'] == "BUY" else "🔴 Sold"
+            lines.append(
+                f"#{tx['transaction_id']} · {tx['created_date'][:10]} · {action} {tx['amount']} USDT "
+                f"@ ₹{tx['rate']} = ₹{tx['total_inr']:,.2f}\n"
+                f"   with @{html.escape(tx['counterparty'] or 'User')} · {tx['status'].title()}"
+            )
+        lines.append(
+            f"\n<b>Totals</b> ({totals['count']} trades): bought {totals['bought_usdt']:g} USDT "
+            f"for ₹{totals['paid_inr']:,.2f}, sold {totals['sold_usdt']:g} USDT for ₹{totals['received_inr']:,.2f}"
+        )
+
+        def mark(label, selected):
+            return f"• {label}" if selected else label
+
+        keyboard = []
+        nav = []
+        if before is not None:
+            nav.append(InlineKeyboardButton("⏮ Newest", callback_data="txh_first"))
+        if has_more:
+            last = transactions[-1]
+            nav.append(InlineKeyboardButton(
+                "Older ▶", callback_data=f"txh_page_{last['created_date']}_{last['transaction_id']}"))
+        if nav:
+            keyboard.append(nav)
+        keyboard.append([
+            InlineKeyboardButton(mark(label, choice.get('status') == status), callback_data=f"txh_status_{status or 'ALL'}")
+            for label, status in (("All", None), ("✅ Completed", "COMPLETED"), ("⏳ Open", "INITIATED"))
+        ])
+        keyboard.append([
+            InlineKeyboardButton(mark(label, choice.get('days') == days), callback_data=f"txh_days_{days or 0}")
+            for label, days in (("7 days", 7), ("30 days", 30), ("All time", None))
+        ])
+        keyboard.append([InlineKeyboardButton("📄 Export CSV", callback_data="txh_csv")])
+
+        text, reply_markup = "\n".join(lines), InlineKeyboardMarkup(keyboard)
+        if update.callback_query:
+            try:
+                await update.callback_query.edit_message_text(text, parse_mode='HTML', reply_markup=reply_markup)
+            except BadRequest as e:
+                if "not modified" not in str(e).lower():
+                    raise
+        else:
+            await update.message.reply_text(text, parse_mode='HTML', reply_markup=reply_markup)
+
+    async def handle_transactions_callback(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Handle paging, filter and export buttons under My Transactions"""
+        query = update.callback_query
+        action, _, value = query.data[len("txh_"):].partition("_")
+        choice = context.user_data.setdefault('tx_filter', {})
+        if action == "csv":
+            await query.answer("Preparing your CSV…")
+            await self.send_transactions_csv(update, context)
+            return
+        await query.answer()
+        before = None
+        if action == "status":
+            choice['status'] = None if value == "ALL" else value
+        elif action == "days":
+            choice['days'] = int(value) or None
+        elif action == "page":
+            created_date, _, transaction_id = value.rpartition("_")
+            before = (created_date, int(transaction_id))
+        await self.show_transactions(update, context, before)
+
+    async def send_transactions_csv(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        user_id = update.effective_user.id
+        output = await self.db.run(self.db.export_transactions_csv, user_id, self.transaction_filters(context))
+        # The file is only read when the outbox sends it, and removed once that is done
+        sent = self.outbox.send_document(
+            update.effective_chat.id,
+            output,
+            filename=f"transactions_{user_id}.csv",
+            caption="Your trade history (oldest first, with running USDT/INR positions)"
+        )
+        sent.add_done_callback(lambda _: output.close())
+
+    async def rates_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Handle /rates [city]: market summary for a city, the user's own city by default"""
+        city_raw = " ".join(context.args).strip()
+        if not city_raw:
+            user = await self.db.get_user_async(update.effective_user.id)
+            if not user or not user['city']:
+                await update.message.reply_text("Usage: /rates <city>")
+                return
+            city_raw = user['city']
+        elif gazetteer.resolve(city_raw) is None:
+            suggestions = gazetteer.suggest(city_raw)
+            hint = f" Did you mean: {', '.join(suggestions)}?" if suggestions else ""
+            await update.message.reply_text(f"Unknown city '{city_raw}'.{hint}")
+            return
+        market = self.db.order_book.market(gazetteer.city_id_for(city_raw))
+        await update.message.reply_text(
+            render_market(gazetteer.display_name(city_raw), market), parse_mode='HTML'
+        )
+
+    async def top_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Handle /top [city]: the most trusted traders overall or in a city"""
+        city_raw = " ".join(context.args).strip()
+        city_id = None
+        if city_raw:
+            if gazetteer.resolve(city_raw) is None:
+                suggestions = gazetteer.suggest(city_raw)
+                hint = f" Did you mean: {', '.join(suggestions)}?" if suggestions else ""
+                await update.message.reply_text(f"Unknown city '{city_raw}'.{hint}")
+                return
+            city_id = gazetteer.city_id_for(city_raw)
+        traders = await self.db.get_top_traders_async(city_id, TOP_TRADERS_LIMIT)
+        place = gazetteer.display_name(city_raw) if city_id else "all cities"
+        if not traders:
+            await update.message.reply_text(f"No traders in {place} yet.")
+            return
+        lines = [f"🏆 <b>Most trusted traders in {html.escape(place)}</b>\n"]
+        for i, trader in enumerate(traders, 1):
+            lines.append(
+                f"{i}. @{html.escape(trader['username'] or 'User')} - ⭐{trader['reputation_score']:.1f} "
+                f"({trader['trades_completed']} completed trades)"
+            )
+        await update.message.reply_text("\n".join(lines), parse_mode='HTML')
+
+    def alerts_message(self, alerts: List[Dict]):
+        if not alerts:
+            return "You have no price alerts.\n\nExample: /alert mumbai sell below 88.0", None
+        lines = ["🔔 <b>Your price alerts</b>\n"]
+        keyboard = []
+        for alert in alerts:
+            lines.append(f"#{alert['alert_id']}: {html.escape(describe_alert(alert))} "
+                         f"(until {alert['expiry_date'][:10]})")
+            keyboard.append([InlineKeyboardButton(f"🗑 Remove #{alert['alert_id']}",
+                                                  callback_data=f"alert_del_{alert['alert_id']}")])
+        return "\n".join(lines), InlineKeyboardMarkup(keyboard)
+
+    async def alert_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Handle /alert <city> <sell|buy> <below|above> <rate>, or list alerts without arguments"""
+        if not NOTIFY_PRICE_ALERTS:
+            await update.message.reply_text("Price alerts are currently disabled.")
+            return
+        user_id = update.effective_user.id
+        if not context.args:
+            text, reply_markup = self.alerts_message(await self.db.get_user_alerts_async(user_id))
+            await update.message.reply_text(text, parse_mode='HTML', reply_markup=reply_markup)
+            return
+
+        args = context.args
+        try:
+            city_raw = " ".join(args[:-3]).strip()
+            offer_type, direction = args[-3].upper(), args[-2].upper()
+            threshold = float(args[-1].lstrip("₹"))
+            if not city_raw or offer_type not in ("SELL", "BUY") or direction not in (BELOW, ABOVE) or threshold <= 0:
+                raise ValueError
+        except (IndexError, ValueError):
+            await update.message.reply_text(
+                "Usage: /alert <city> <sell|buy> <below|above> <rate>\n"
+                "Example: /alert mumbai sell below 88.0"
+            )
+            return
+        if gazetteer.resolve(city_raw) is None:
+            suggestions = gazetteer.suggest(city_raw)
+            hint = f" Did you mean: {', '.join(suggestions)}?" if suggestions else ""
+            await update.message.reply_text(f"Unknown city '{city_raw}'.{hint}")
+            return
+        try:
+            alert = await self.db.create_alert_async(
+                user_id, gazetteer.city_id_for(city_raw), offer_type, direction, threshold
+            )
+        except ValueError as e:
+            await update.message.reply_text(f"❌ {e}")
+            return
+        await update.message.reply_text(
+            f"🔔 Alert #{alert['alert_id']} set: {html.escape(describe_alert(alert))}.\n"
+            f"You'll hear about matching new offers until {alert['expiry_date'][:10]}.",
+            parse_mode='HTML'
+        )
+
+    async def handle_alert_delete(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        query = update.callback_query
+        user_id = update.effective_user.id
+        deleted = await self.db.delete_alert_async(int(query.data.rsplit("_", 1)[1]), user_id)
+        await query.answer("Alert removed" if deleted else "Alert not found")
+        text, reply_markup = self.alerts_message(await self.db.get_user_alerts_async(user_id))
+        try:
+            await query.edit_message_text(text, parse_mode='HTML', reply_markup=reply_markup)
+        except BadRequest as e:
+            if "not modified" not in str(e).lower():
+                raise
+
+    async def subscribe_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Handle /subscribe <city> [sell|buy], or list subscriptions without arguments"""
+        if not NOTIFY_NEW_OFFERS:
+            await update.message.reply_text("New-offer notifications are currently disabled.")
+            return
+        user_id = update.effective_user.id
+        if not context.args:
+            subscriptions = await self.db.get_user_subscriptions_async(user_id)
+            if not subscriptions:
+                await update.message.reply_text(
+                    "You don't follow any cities yet.\n\nExample: /subscribe mumbai sell"
+                )
+                return
+            lines = ["🆕 <b>You get new-offer notifications for</b>\n"]
+            lines += [f"{html.escape(gazetteer.display_name(city_id))}: "
+                      f"{'sellers' if offer_type == 'SELL' else 'buyers'}" for city_id, offer_type in subscriptions]
+            lines.append("\nStop with /unsubscribe [city]")
+            await update.message.reply_text("\n".join(lines), parse_mode='HTML')
+            return
+
+        args = list(context.args)
+        offer_types = ["SELL", "BUY"]
+        if args[-1].upper() in offer_types:
+            offer_types = [args.pop().upper()]
+        city_raw = " ".join(args).strip()
+        if not city_raw or gazetteer.resolve(city_raw) is None:
+            suggestions = gazetteer.suggest(city_raw) if city_raw else []
+            hint = f" Did you mean: {', '.join(suggestions)}?" if suggestions else ""
+            await update.message.reply_text(f"Unknown city '{city_raw}'.{hint}\nUsage: /subscribe <city> [sell|buy]")
+            return
+        try:
+            await self.db.subscribe_async(user_id, gazetteer.city_id_for(city_raw), offer_types)
+        except ValueError as e:
+            await update.message.reply_text(f"❌ {e}")
+            return
+        sides = " and ".join("sellers" if t == "SELL" else "buyers" for t in offer_types)
+        text = f"🆕 You'll be notified about new {sides} in {gazetteer.display_name(city_raw)}."
+        if NEW_OFFER_QUIET_HOURS:
+            start, end = NEW_OFFER_QUIET_HOURS
+            text += f"\nNo messages between {start}:00 and {end}:00; offers posted then arrive together afterwards."
+        await update.message.reply_text(text)
+
+    async def unsubscribe_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Handle /unsubscribe [city]"""
+        city_raw = " ".join(context.args).strip()
+        city_id = gazetteer.city_id_for(city_raw) if city_raw else None
+        removed = await self.db.unsubscribe_async(update.effective_user.id, city_id)
+        place = gazetteer.display_name(city_raw) if city_raw else "any city"
+        await update.message.reply_text(
+            f"Stopped {removed} new-offer notification{'s' if removed != 1 else ''} for {place}."
+            if removed else f"You weren't subscribed to {place}."
+        )
+
     async def cancel(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handle /cancel command to exit a conversation"""
         if update.message:
@@ -804,10 +1877,7 @@ class USDTExchangeBot:
         if text in ["📝 Post USDT Offer", "🔍 Browse Offers", "📊 My Listings"]:
             return
         elif text == "💰 My Transactions":
-            await update.message.reply_text(
-                "Transaction history feature coming soon!",
-                reply_markup=self.get_main_menu_keyboard()
-            )
+            await self.show_transactions(update, context)
         elif text == "⚙️ Settings":
             await update.message.reply_text(
                 "Settings feature coming soon!",
@@ -816,6 +1886,53 @@ class USDTExchangeBot:
         elif text == "❓ Help":
             await self.help_command(update, context)
 
+def check_webhook_settings(webhook_url: Optional[str], secret_token: Optional[str]):
+    """Raise ValueError for webhook settings that would expose or break the webhook"""
+    if not webhook_url:
+        raise ValueError("Webhook mode needs the public HTTPS URL Telegram should post updates to")
+    if not secret_token:
+        raise ValueError("A webhook needs a secret token; anyone could post updates to it otherwise")
+    if not WEBHOOK_SECRET_PATTERN.fullmatch(secret_token):
+        raise ValueError("The webhook secret must be 1-256 characters of A-Z, a-z, 0-9, _ and -")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="USDT-INR Exchange Telegram Bot")
+    parser.add_argument("--mode", choices=["polling", "webhook"], default=BOT_MODE,
+                        help="how to receive updates (env BOT_MODE, default polling)")
+    parser.add_argument("--listen", default=WEBHOOK_LISTEN, help="webhook bind address (env WEBHOOK_LISTEN)")
+    parser.add_argument("--port", type=int, default=WEBHOOK_PORT, help="webhook port (env WEBHOOK_PORT)")
+    parser.add_argument("--url-path", default=WEBHOOK_PATH, help="webhook URL path (env WEBHOOK_PATH)")
+    parser.add_argument("--webhook-url", default=WEBHOOK_URL,
+                        help="public URL registered with Telegram; required in webhook mode (env WEBHOOK_URL)")
+    parser.add_argument("--secret", default=WEBHOOK_SECRET,
+                        help="secret token Telegram sends in every request; required in webhook mode "
+                             "(env WEBHOOK_SECRET)")
+    parser.add_argument("--max-connections", type=int, default=WEBHOOK_MAX_CONNECTIONS,
+                        help="max simultaneous Telegram connections, 1-100 (env WEBHOOK_MAX_CONNECTIONS)")
+    args = parser.parse_args()
+    if args.mode == "webhook":
+        try:
+            check_webhook_settings(args.webhook_url, args.secret)
+        except ValueError as e:
+            parser.error(str(e))
+    return args
+
+
 if __name__ == "__main__":
+    args = parse_args()
     bot = USDTExchangeBot(BOT_TOKEN)
-    bot.application.run_polling()
+    if args.mode == "webhook":
+        # Registers the webhook with the secret and rejects requests that do not carry it
+        bot.application.run_webhook(
+            listen=args.listen,
+            port=args.port,
+            url_path=args.url_path,
+            webhook_url=args.webhook_url,
+            secret_token=args.secret,
+            max_connections=args.max_connections,
+            allowed_updates=Update.ALL_TYPES,
+        )
+    else:
+        # Polling deletes any webhook left over from a previous webhook deployment
+        bot.application.run_polling()
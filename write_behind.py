@@ -0,0 +1,180 @@
+# Write-behind queue for USDT-INR Exchange Bot
+#
+# Low-priority writes (last-active touches, offer view counters, audit rows) are buffered
+# in memory and written in a single transaction every WRITE_BEHIND_FLUSH_MS milliseconds
+# or as soon as WRITE_BEHIND_MAX_BATCH items are waiting, so tracking activity on every
+# update costs one fsync per batch instead of one per message.
+#
+# Each queued statement runs under its own savepoint: one that fails by itself (a constraint
+# or SQL error) is logged and dropped without holding back the rest of the batch. When the
+# whole batch fails (e.g. the database stays locked) it is retried, but a statement is
+# dropped after WRITE_BEHIND_MAX_RETRIES attempts and at most WRITE_BEHIND_MAX_QUEUED
+# statements are buffered.
+
+import asyncio
+import logging
+import sqlite3
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+def _sqlite_now() -> str:
+    """Current UTC time in SQLite's CURRENT_TIMESTAMP format"""
+    return datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+
+
+class WriteBehindQueue:
+    """Buffers small writes and flushes them in batches on the DB executor"""
+
+    def __init__(self, db, flush_interval_ms: int = 500, max_batch: int = 200,
+                 max_retries: int = 5, max_queued: int = 10000):
+        self.db = db
+        self.flush_interval = flush_interval_ms / 1000
+        self.max_batch = max_batch
+        self.max_retries = max_retries
+        self.max_queued = max_queued
+        # Touches and view counts are coalesced so hot keys cost one row per flush
+        self._touches: Dict[int, str] = {}
+        self._views: Dict[int, int] = {}
+        self._statements: List[Tuple[str, tuple, int]] = []  # (sql, params, failed attempts)
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._flush_lock: Optional[asyncio.Lock] = None
+        self.flushed_items = 0
+        self.flush_count = 0
+        self.dropped = 0
+
+    def __len__(self) -> int:
+        return len(self._touches) + len(self._views) + len(self._statements)
+
+    def touch_user(self, user_id: int):
+        """Record that a user was active just now"""
+        self._touches[user_id] = _sqlite_now()
+        self._maybe_wake()
+
+    def count_view(self, offer_id: int, views: int = 1):
+        self._views[offer_id] = self._views.get(offer_id, 0) + views
+        self._maybe_wake()
+
+    def audit(self, user_id: Optional[int], action: str, details: str = ""):
+        self.enqueue(
+            "INSERT INTO audit_log (user_id, action, details, created_date) VALUES (?, ?, ?, ?)",
+            (user_id, action, details, _sqlite_now())
+        )
+
+    def enqueue(self, sql: str, params: tuple = ()):
+        """Queue an arbitrary low-priority statement; dropped if the buffer is full"""
+        if len(self._statements) >= self.max_queued:
+            self._drop(sql, params, "write-behind buffer is full")
+            return
+        self._statements.append((sql, params, 0))
+        self._maybe_wake()
+
+    def _drop(self, sql: str, params: tuple, reason: str):
+        self.dropped += 1
+        logger.error(f"Dropped write-behind statement ({reason}): {' '.join(sql.split())} {params!r}")
+
+    def _maybe_wake(self):
+        if self._wakeup is not None and len(self) >= self.max_batch:
+            self._wakeup.set()
+
+    async def start(self):
+        self._wakeup = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stop the background task and write everything still buffered"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self.flush()
+            except Exception:
+                logger.exception("Write-behind flush failed")
+
+    async def flush(self):
+        """Write all buffered items in one transaction"""
+        if not len(self):
+            return
+        lock = self._flush_lock or asyncio.Lock()
+        async with lock:
+            touches, self._touches = self._touches, {}
+            views, self._views = self._views, {}
+            statements, self._statements = self._statements, []
+            try:
+                failed = await self.db.run(self._write_batch, touches, views, statements)
+            except Exception:
+                # Put the batch back so the next flush retries it
+                for user_id, ts in touches.items():
+                    self._touches.setdefault(user_id, ts)
+                for offer_id, count in views.items():
+                    self._views[offer_id] = self._views.get(offer_id, 0) + count
+                retry = []
+                for sql, params, attempts in statements:
+                    if attempts + 1 >= self.max_retries:
+                        self._drop(sql, params, f"failed {attempts + 1} times")
+                    else:
+                        retry.append((sql, params, attempts + 1))
+                self._statements[:0] = retry
+                for sql, params, _ in self._statements[self.max_queued:]:
+                    self._drop(sql, params, "write-behind buffer is full")
+                del self._statements[self.max_queued:]
+                raise
+            for sql, params, error in failed:
+                self._drop(sql, params, str(error))
+            self.flushed_items += len(touches) + len(views) + len(statements) - len(failed)
+            self.flush_count += 1
+
+    @staticmethod
+    def _is_transient(error: sqlite3.Error) -> bool:
+        """Errors that would hit any statement in the batch, not this one in particular"""
+        return isinstance(error, sqlite3.OperationalError) and any(
+            word in str(error) for word in ("locked", "busy", "disk I/O")
+        )
+
+    def _write_batch(self, touches: Dict[int, str], views: Dict[int, int],
+                     statements: List[Tuple[str, tuple, int]]) -> List[Tuple[str, tuple, Exception]]:
+        """Write a batch in one transaction; returns the statements that failed on their own"""
+        failed = []
+        with self.db.pool.connection() as conn:
+            cursor = conn.cursor()
+            if not conn.in_transaction:
+                cursor.execute("BEGIN")
+            if touches:
+                cursor.executemany(
+                    "UPDATE users SET last_active = ? WHERE user_id = ?",
+                    [(ts, user_id) for user_id, ts in touches.items()]
+                )
+            if views:
+                cursor.executemany(
+                    "UPDATE offers SET view_count = view_count + ? WHERE offer_id = ?",
+                    [(count, offer_id) for offer_id, count in views.items()]
+                )
+            for sql, params, _ in statements:
+                cursor.execute("SAVEPOINT write_behind_item")
+                try:
+                    cursor.execute(sql, params)
+                except sqlite3.Error as e:
+                    if self._is_transient(e):
+                        raise
+                    cursor.execute("ROLLBACK TO write_behind_item")
+                    failed.append((sql, params, e))
+                cursor.execute("RELEASE write_behind_item")
+            conn.commit()
+        return failed